@@ -2,10 +2,13 @@
 Hold state about running commands, e.g. 'running', 'done', 'failed', ...
 Also hold keywords for those commands as we pass them around.
 """
+import threading
+
 from opscore.utility.qstr import qstr
 
 import sopActor.myGlobals as myGlobals
 import sopActor
+from sopActor.utils.calls import call_async
 
 def getDefaultArcTime(survey):
     """Get the default arc time for this survey"""
@@ -21,6 +24,100 @@ def getDefaultFlatTime(survey):
     else:
         return 0
 
+class KeyCache(object):
+    """
+    The last value we output for each keyword, and how many times it has changed.
+
+    Lets us output just the keywords that changed since we last did (e.g. on
+    every stage transition), while a full dump (e.g. "sop status") still
+    outputs them all, and brings us up to date.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget what we've output, so that everything counts as changed."""
+        with self._lock:
+            self.values = {}            # key: the last message we output for it
+            self.versions = {}          # key: how many times that message has changed
+
+    def changed(self, key, msg):
+        """Note that key is being output as msg: return True if that's not what it was last time."""
+        with self._lock:
+            if key in self.values and self.values[key] == msg:
+                return False
+            self.values[key] = msg
+            self.versions[key] = self.versions.get(key, 0) + 1
+            return True
+
+    def version(self, key):
+        """Return how many times key has changed (0 if it's never been output)."""
+        with self._lock:
+            return self.versions.get(key, 0)
+
+    def output(self, write, key, msg, changedOnly=False):
+        """Output msg for key with write (e.g. cmd.inform), unless changedOnly and it hasn't changed."""
+        if self.changed(key, msg) or not changedOnly:
+            write(msg)
+
+
+class StateVersion(object):
+    """
+    Counts the changes to anything that sop's status reports, so that a status
+    kept from before (see SopCmd._status_snapshot) can tell when it's stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def bump(self):
+        """Something has changed."""
+        with self._lock:
+            self.value += 1
+
+
+stateVersion = StateVersion()
+
+
+class ReportedDict(dict):
+    """A dict that status reports (e.g. a CmdState's stages): any change to it bumps stateVersion."""
+
+    def __setitem__(self, key, value):
+        changed = key not in self or self[key] != value
+        dict.__setitem__(self, key, value)
+        if changed:
+            stateVersion.bump()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        stateVersion.bump()
+
+    def _bumps(name):
+        def method(self, *args, **kwargs):
+            result = getattr(dict, name)(self, *args, **kwargs)
+            stateVersion.bump()
+            return result
+        method.__name__ = name
+        method.__doc__ = getattr(dict, name).__doc__
+        return method
+    clear = _bumps('clear')
+    pop = _bumps('pop')
+    popitem = _bumps('popitem')
+    setdefault = _bumps('setdefault')
+    update = _bumps('update')
+    del _bumps
+
+# sop's own status keywords (version, bypasses, ...), as SopCmd.status last output them.
+statusKeys = KeyCache()
+
+# Output just the keywords that have changed on each stage transition, rather
+# than all of them. SopActor sets this from the [status] section of sop.cfg.
+incremental = True
+
+
 class CmdState(object):
     """
     A class that's intended to hold command state data.
@@ -43,6 +140,13 @@ class CmdState(object):
     #   aborted : mark with warning color
     #   starting, prepping, running : mark with running color.
     validStageStates = ('prepping', 'running', 'done', 'failed', 'aborted', 'pending', 'off', 'idle')
+    # Stage states that are always output at once, rather than coalesced with the next.
+    finalStageStates = ('done', 'failed', 'aborted')
+    # The attributes our status reports, besides the keywords: a change to one
+    # of them bumps stateVersion. Subclasses add those their getUserKeys reads.
+    # keywords and stages are kept as ReportedDicts, so that changing them in place counts too.
+    reportedFields = ('name', 'cmdState', 'stateText', 'allStages', 'stages', 'keywords')
+    userKeyFields = ()
 
     def __init__(self, name, allStages, keywords={}, hiddenKeywords=()):
         """
@@ -54,13 +158,26 @@ class CmdState(object):
         self.cmdState = "idle"
         self.stateText = "OK"
         self.aborted = False
+        self._stopping = []             # stop commands sent by abort(), that it must wait for
         self.keywords = dict(keywords)
         self.hiddenKeywords = hiddenKeywords
+        self.emitted = KeyCache()
         self.reset_keywords()
         self.reset_nonkeywords()
 
         self.setStages(allStages)
 
+    def __setattr__(self, name, value):
+        """Note a change to anything our status reports."""
+        if name in ('keywords', 'stages') and not isinstance(value, ReportedDict):
+            value = ReportedDict(value)
+        reported = name in self.reportedFields or name in self.userKeyFields or \
+            name in self.__dict__.get('keywords', ())
+        changed = reported and (name not in self.__dict__ or self.__dict__[name] != value)
+        object.__setattr__(self, name, value)
+        if changed:
+            stateVersion.bump()
+
     def reset_keywords(self):
         """Reset all the keywords to their default values."""
         for k, v in self.keywords.iteritems():
@@ -94,6 +211,7 @@ class CmdState(object):
             if key == 'cleanup':
                 self.stages[key] = 'idle'
         self.activeStages = allStages
+        stateVersion.bump()
 
     def reinitialize(self,cmd=None,stages=None,output=True, setStagesTo='idle'):
         """Re-initialize this cmdState, keeping the stages list as is."""
@@ -138,36 +256,41 @@ class CmdState(object):
         assert name in self.stages, "stage %s is unknown, out of %s"%(name,repr(self.stages))
         assert stageState in self.validStageStates, "state %s is unknown, out of %s" % (stageState,repr(self.validStageStates))
         self.stages[name] = stageState
+        stateVersion.bump()
 
         if genKeys:
-            self.genCmdStateKeys()
+            self.genCmdStateKeys(changedOnly=incremental, final=stageState in self.finalStageStates)
 
-    def genCmdStateKeys(self, cmd=None):
+    def genCmdStateKeys(self, cmd=None, changedOnly=False, final=True):
+        """Output our State keyword; unless final, it may be coalesced with the next one."""
         cmd = self._getCmd(cmd)
-        cmd.inform("%sState=%s,%s,%s" % (self.name, qstr(self.cmdState),
-                                         qstr(self.stateText),
-                                         ",".join([qstr(self.stages[sname]) \
-                                                       for sname in self.allStages])))
-
-    def genCommandKeys(self, cmd=None):
+        key = "%sState" % self.name
+        msg = "%s=%s,%s,%s" % (key, qstr(self.cmdState), qstr(self.stateText),
+                               ",".join([qstr(self.stages[sname]) \
+                                             for sname in self.allStages]))
+        write = lambda msg: myGlobals.coalescer.write(cmd, key, msg, final=final)
+        self.emitted.output(write, key, msg, changedOnly)
+
+    def genCommandKeys(self, cmd=None, changedOnly=False):
         """ Return a list of the keywords describing our command. """
 
         cmd = self._getCmd(cmd)
-        cmd.inform("%sStages=%s" % (self.name,
-                                    ",".join([qstr(sname) \
-                                                  for sname in self.allStages])))
-        self.genCmdStateKeys(cmd=cmd)
+        key = "%sStages" % self.name
+        msg = "%s=%s" % (key, ",".join([qstr(sname) for sname in self.allStages]))
+        self.emitted.output(cmd.inform, key, msg, changedOnly)
+        self.genCmdStateKeys(cmd=cmd, changedOnly=changedOnly)
 
     def getUserKeys(self):
         return []
 
-    def genStateKeys(self, cmd=None):
+    def genStateKeys(self, cmd=None, changedOnly=False):
         '''
         Generates command info statements for commmand keys
         Format: [commandName]_keyword = currentset_value, default_value
         e.g.
         doMangaSequence_count=1,3; doMangaSequence_dithers="NSE","NSE"
         doMangaSequence_expTime=900.0,900.0; doMangaSequence_ditherSeq=NSE,0
+        If changedOnly, skip either line if it's the same as we last output.
         '''
         cmd = self._getCmd(cmd)
 
@@ -180,7 +303,7 @@ class CmdState(object):
             msg.append("%s_%s=%s,%s" % (self.name, keyName,
                                         val, default))
         if msg:
-            cmd.inform("; ".join(msg))
+            self.emitted.output(cmd.inform, "%s_keywords" % self.name, "; ".join(msg), changedOnly)
 
         try:
             userKeys = self.getUserKeys()
@@ -189,15 +312,15 @@ class CmdState(object):
             cmd.warn('text="failed to fetch all keywords for %s"' % (self.name))
 
         if userKeys:
-            cmd.inform(";".join(userKeys))
+            self.emitted.output(cmd.inform, "%s_userKeys" % self.name, ";".join(userKeys), changedOnly)
 
-    def genKeys(self, cmd=None, trimKeys=False):
-        """Output all our keywords."""
+    def genKeys(self, cmd=None, trimKeys=False, changedOnly=False):
+        """Output all our keywords, or just those that have changed since we last did."""
         if not trimKeys or trimKeys == self.name:
             # [commandName]Stages and [commandName]State info statements (e.g. doMangaSequenceStages, doMangaSequenceState)
-            self.genCommandKeys(cmd=cmd)
+            self.genCommandKeys(cmd=cmd, changedOnly=changedOnly)
             # invidual state keys
-            self.genStateKeys(cmd=cmd)
+            self.genStateKeys(cmd=cmd, changedOnly=changedOnly)
 
     def took_exposure(self):
         """Update keys after an exposure and output them."""
@@ -231,8 +354,16 @@ class CmdState(object):
 
     def abort(self):
         """Abort this command by clearing relevant variables."""
+        # Subclasses send their stop commands all at once: wait for them here.
+        for future in self._stopping:
+            future.wait()
+        self._stopping = []
         self.aborted = True
         myGlobals.actorState.aborting = True
+        # so that e.g. our lamp warmups notice now.
+        if self.cmd is not None:
+            for timer in myGlobals.timers.pending(self.cmd):
+                myGlobals.timers.fire(timer)
         self.abortStages()
 
     def abortStages(self):
@@ -240,36 +371,47 @@ class CmdState(object):
         for s in self.activeStages:
             if not self.stages[s] in ("done", "failed", "off"):
                 self.stages[s] = "aborted"
+        stateVersion.bump()
         self.genCmdStateKeys()
 
-    def stop_boss_exposure(self):
+    def _stop(self, cmd, failText, wait, **kwargs):
+        """
+        Send a stop command, warning with failText if it fails.
+        If not wait, leave abort() to wait for it, so that several can run at once.
+        """
+        def check(future):
+            if future.didFail:
+                cmd.warn(failText)
+        future = call_async(forUserCmd=cmd, **kwargs)
+        future.add_callback(check)
+        if wait:
+            future.wait()
+        else:
+            self._stopping.append(future)
+
+    def stop_boss_exposure(self, wait=True):
         """Abort any currently running BOSS exposure, or warn if there's nothing to abort."""
         cmd = self._getCmd()
         # The same states we cannot slew during are the states we can't abort from.
         if self.isSlewingDisabled_BOSS()[0]:
             cmd.warn('text="Will cancel pending BOSS exposures and stop any running one."')
-            call = myGlobals.actorState.actor.cmdr.call
-            cmdVar = call(actor="boss", forUserCmd=cmd, cmdStr="exposure stop")
-            if cmdVar.didFail:
-                cmd.warn('text="Failed to stop running BOSS exposure"')
+            self._stop(cmd, 'text="Failed to stop running BOSS exposure"', wait,
+                       actor="boss", cmdStr="exposure stop")
         else:
             cmd.warn('text="No BOSS exposure to abort!"')
 
-    def stop_apogee_exposure(self):
+    def stop_apogee_exposure(self, wait=True):
         """Abort any currently running APOGEE exposure."""
         cmd = self._getCmd()
         cmd.warn('text="Will cancel pending APOGEE exposures and stop any running one."')
-        call = myGlobals.actorState.actor.cmdr.call
-        cmdVar = call(actor="apogee", forUserCmd=cmd, cmdStr="expose stop")
-        if cmdVar.didFail:
-            cmd.warn('text="Failed to stop running APOGEE exposure"')
+        self._stop(cmd, 'text="Failed to stop running APOGEE exposure"', wait,
+                   actor="apogee", cmdStr="expose stop")
 
-    def stop_tcc(self):
+    def stop_tcc(self, wait=True):
         """Stop current TCC motion."""
         cmd = self._getCmd()
-        cmdVar = myGlobals.actorState.actor.cmdr.call(actor="tcc", forUserCmd=cmd, cmdStr="axis stop")
-        if cmdVar.didFail:
-            cmd.warn('text="Failed to abort slew"')
+        self._stop(cmd, 'text="Failed to abort slew"', wait,
+                   actor="tcc", cmdStr="axis stop")
 
 
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -288,8 +430,8 @@ class GotoGangChangeCmd(CmdState):
         self.doSlew = True
 
     def abort(self):
-        self.stop_apogee_exposure()
-        self.stop_tcc()
+        self.stop_apogee_exposure(wait=False)
+        self.stop_tcc(wait=False)
         self.doDomeFlat = False
         self.doSlew = False
         super(GotoGangChangeCmd,self).abort()
@@ -304,7 +446,7 @@ class GotoPositionCmd(CmdState):
         self.doSlew = True
 
     def abort(self):
-        self.stop_tcc()
+        self.stop_tcc(wait=False)
         self.doSlew = False
         super(GotoPositionCmd, self).abort()
 
@@ -317,7 +459,7 @@ class DoApogeeDomeFlatCmd(CmdState):
         self.expType = "object"
 
     def abort(self):
-        self.stop_apogee_exposure()
+        self.stop_apogee_exposure(wait=False)
         super(DoApogeeDomeFlatCmd,self).abort()
 
 
@@ -362,8 +504,8 @@ class GotoFieldCmd(CmdState):
         self.doGuider = True
 
     def abort(self):
-        self.stop_boss_exposure()
-        self.stop_tcc()
+        self.stop_boss_exposure(wait=False)
+        self.stop_tcc(wait=False)
         self.doSlew = False
         self.ffScreen = False
         self.doHartmann = False
@@ -404,7 +546,7 @@ class GotoFieldLCOCmd(CmdState):
     def abort(self):
 
         if self.stages['slew'].lower() == 'running':
-            self.stop_tcc()
+            self.stop_tcc(wait=False)
 
         self.doSlew = False
         self.doScreen = False
@@ -417,15 +559,12 @@ class GotoFieldLCOCmd(CmdState):
 
         self.cmd.fail('aborted command.')
 
-    def stop_tcc(self):
+    def stop_tcc(self, wait=True):
         """Stop current TCC motion."""
 
-        cmdVar = myGlobals.actorState.actor.cmdr.call(actor='tcc', forUserCmd=self.cmd,
-                                                      cmdStr='target 0,0 icrs /abort')
-
         # It seems the abort command does its thing but didFail is True.
-        if cmdVar.didFail:
-            self.cmd.warn('text="Failed to abort slew. This is probably ok."')
+        self._stop(self.cmd, 'text="Failed to abort slew. This is probably ok."', wait,
+                   actor='tcc', cmdStr='target 0,0 icrs /abort')
 
     def reinitialize(self, cmd, setStagesTo='off', **kwargs):
         """Reinitialises all but sets stages to off."""
@@ -456,6 +595,8 @@ class DoBossCalibsCmd(CmdState):
             return self.nBiasDone < self.nBias or self.nDarkDone < self.nDark or \
                    self.nFlatDone < self.nFlat or self.nArcDone < self.nArc
 
+    userKeyFields = ('nBias', 'nBiasDone', 'nDark', 'nDarkDone', 'nFlat', 'nFlatDone', 'nArc', 'nArcDone')
+
     def getUserKeys(self):
         msg = []
         msg.append("nBias=%d,%d" % (self.nBiasDone, self.nBias))
@@ -465,7 +606,7 @@ class DoBossCalibsCmd(CmdState):
         return ["%s_%s" % (self.name, m) for m in msg]
 
     def abort(self):
-        self.stop_boss_exposure()
+        self.stop_boss_exposure(wait=False)
         self.nArc = self.nArcDone
         self.nBias = self.nBiasDone
         self.nDark = self.nDarkDone
@@ -495,6 +636,8 @@ class DoApogeeScienceCmd(CmdState):
             self.keywords['expTime'] = value
             self.expTime = value
 
+    userKeyFields = ('index', 'ditherPairs')
+
     def getUserKeys(self):
         msg = []
         msg.append('%s_index=%d,%d' % (self.name,self.index,self.ditherPairs))
@@ -516,7 +659,7 @@ class DoApogeeScienceCmd(CmdState):
 
     def abort(self):
         self.ditherPairs = self.index
-        self.stop_apogee_exposure()
+        self.stop_apogee_exposure(wait=False)
         super(DoApogeeScienceCmd,self).abort()
 
 
@@ -533,6 +676,8 @@ class DoApogeeSkyFlatsCmd(CmdState):
         self.comment = "sky flat, offset 0.01 degree in RA"
         super(DoApogeeSkyFlatsCmd,self).reset_nonkeywords()
 
+    userKeyFields = ('index', 'ditherPairs')
+
     def getUserKeys(self):
         msg = []
         msg.append('%s_index=%d,%d' % (self.name,self.index,self.ditherPairs))
@@ -554,7 +699,7 @@ class DoApogeeSkyFlatsCmd(CmdState):
 
     def abort(self):
         self.ditherPairs = self.index
-        self.stop_apogee_exposure()
+        self.stop_apogee_exposure(wait=False)
         super(DoApogeeSkyFlatsCmd,self).abort()
 
 
@@ -566,6 +711,8 @@ class DoBossScienceCmd(CmdState):
         self.nExp = 0
         self.index = 0
 
+    userKeyFields = ('index', 'nExp')
+
     def getUserKeys(self):
         msg = []
         msg.append("%s_nExp=%d,%d" % (self.name, self.index, self.nExp))
@@ -589,7 +736,7 @@ class DoBossScienceCmd(CmdState):
             return False
 
     def abort(self):
-        self.stop_boss_exposure()
+        self.stop_boss_exposure(wait=False)
         self.nExp = self.index
         super(DoBossScienceCmd, self).abort()
 
@@ -630,6 +777,8 @@ class DoMangaSequenceCmd(CmdState):
         """Reset dither sequence based on dithers and count."""
         self.ditherSeq = self.dithers*self.count
 
+    userKeyFields = ('ditherSeq', 'index')
+
     def getUserKeys(self):
         msg = []
         msg.append("%s_ditherSeq=%s,%s" % (self.name, self.ditherSeq, self.index))
@@ -667,7 +816,7 @@ class DoMangaSequenceCmd(CmdState):
             return False
 
     def abort(self):
-        self.stop_boss_exposure()
+        self.stop_boss_exposure(wait=False)
         super(DoMangaSequenceCmd, self).abort()
 
 
@@ -690,7 +839,7 @@ class DoMangaDitherCmd(CmdState):
             return False
 
     def abort(self):
-        self.stop_boss_exposure()
+        self.stop_boss_exposure(wait=False)
         super(DoMangaDitherCmd,self).abort()
 
 
@@ -734,6 +883,8 @@ class DoApogeeMangaDitherCmd(CmdState):
         self.apogeeExpTime=450.0
         self.apogee_long = False
 
+    userKeyFields = ('mangaExpTime', 'apogeeExpTime')
+
     def getUserKeys(self):
         msg = []
         msg.append("%s_expTime=%s,%s" % (self.name, self.mangaExpTime, self.apogeeExpTime))
@@ -752,8 +903,8 @@ class DoApogeeMangaDitherCmd(CmdState):
             return False
 
     def abort(self):
-        self.stop_boss_exposure()
-        self.stop_apogee_exposure()
+        self.stop_boss_exposure(wait=False)
+        self.stop_apogee_exposure(wait=False)
         super(DoApogeeMangaDitherCmd,self).abort()
 
 
@@ -829,6 +980,8 @@ class DoApogeeMangaSequenceCmd(CmdState):
         self.mangaDitherSeq = self.mangaDithers*self.count
         # Note: Two APOGEE exposures are taken for each MaNGA exposure.
 
+    userKeyFields = ('mangaDitherSeq', 'index', 'mangaExpTime', 'apogeeExpTime')
+
     def getUserKeys(self):
         msg = []
         msg.append("%s_ditherSeq=%s,%s" % (self.name, self.mangaDitherSeq, self.index))
@@ -874,6 +1027,6 @@ class DoApogeeMangaSequenceCmd(CmdState):
             return False
 
     def abort(self):
-        self.stop_boss_exposure()
-        self.stop_apogee_exposure()
+        self.stop_boss_exposure(wait=False)
+        self.stop_apogee_exposure(wait=False)
         super(DoApogeeMangaSequenceCmd,self).abort()
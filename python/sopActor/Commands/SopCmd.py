@@ -15,7 +15,7 @@ import os
 from sopActor import CmdState, Msg
 import sopActor
 import sopActor.myGlobals as myGlobals
-from sopActor.multiCommand import MultiCommand
+from sopActor import script
 
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
@@ -55,12 +55,26 @@ surveyMode_inv_dict = {None: 'None',
                        sopActor.APOGEELEAD: 'APOGEE lead'}
 
 
+class StatusRecorder(object):
+    """Stands in for a cmd, to keep the lines of a status to output again later."""
+
+    def __init__(self):
+        self.lines = []
+
+    def inform(self, msg):
+        self.lines.append(('inform', msg))
+
+    def warn(self, msg):
+        self.lines.append(('warn', msg))
+
+
 class SopCmd(object):
     """ Wrap commands to the sop actor"""
 
     def __init__(self, actor):
         self.actor = actor
         self.replyQueue = sopActor.Queue('(replyQueue)',0)
+        self._statusCache = {}          # oneCommand: (state version, status lines); see _status_snapshot
         #
         # Declare keys that we're going to use
         #
@@ -85,6 +99,7 @@ class SopCmd(object):
             keys.Key('noGuider', help='Don\'t start the guider'),
             keys.Key("comment", types.String(), help="comment for headers"),
             keys.Key("scriptName", types.String(), help="name of script to run"),
+            keys.Key("dryRun", help="Say how long it would take, without running anything"),
             keys.Key("az", types.Float(), help="what azimuth to slew to"),
             keys.Key("rotOffset", types.Float(), help="what rotator offset to add"),
             keys.Key("alt", types.Float(), help="what altitude to slew to"),
@@ -97,6 +112,7 @@ class SopCmd(object):
             ("doApogeeScience", "[<expTime>] [<ditherPairs>] [stop] [<abort>] [<comment>]", self.doApogeeScience),
             ("doApogeeSkyFlats", "[<expTime>] [<ditherPairs>] [stop] [abort]", self.doApogeeSkyFlats),
             ("ping", "", self.ping),
+            ("perf", "[clear]", self.perf),
             ("restart", "[<threads>] [keepQueues]", self.restart),
             ("gotoInstrumentChange", "[abort] [stop]", self.gotoInstrumentChange),
             ("gotoStow", "[abort] [stop]", self.gotoStow),
@@ -107,8 +123,8 @@ class SopCmd(object):
             ("setFakeField", "[<az>] [<alt>] [<rotOffset>]", self.setFakeField),
             ("status", "[geek]", self.status),
             ("reinit", "", self.reinit),
-            ("runScript", "<scriptName>", self.runScript),
-            ("listScripts", "", self.listScripts),
+            ("runScript", "<scriptName> [dryRun]", self.runScript),
+            ("listScripts", "[dryRun]", self.listScripts),
             ]
 
     def stop_cmd(self, cmd, cmdState, sopState, name):
@@ -362,20 +378,47 @@ class SopCmd(object):
                                            survey=sopState.survey)
 
     def runScript(self, cmd):
-        """ Run the named script from the SOPACTOR_DIR/scripts directory. """
+        """
+        Run the named script from the SOPACTOR_DIR/scripts directory.
+        With dryRun, just say how long each line and the script should take.
+        """
         sopState = myGlobals.actorState
 
+        if "dryRun" in cmd.cmd.keywords:
+            scriptName = cmd.cmd.keywords["scriptName"].values[0]
+            try:
+                dryRun = script.Script(cmd, scriptName, genKeys=False)
+            except RuntimeError as e:
+                cmd.fail('text=%s' % qstr("Cannot load script %s: %s" % (scriptName, e)))
+                return
+            # Not genStartKeys: its scriptState would replace that of any script that's running.
+            dryRun.genLineKeys()
+            dryRun.genTimingKeys()
+            cmd.finish('')
+            return
+
         sopState.queues[sopActor.SCRIPT].put(Msg.NEW_SCRIPT, cmd, replyQueue=self.replyQueue,
                                              actorState=sopState,
                                              survey=sopState.survey,
                                              scriptName = cmd.cmd.keywords["scriptName"].values[0])
 
     def listScripts(self, cmd):
-        """ List available script names for the runScript command."""
+        """
+        List available script names for the runScript command.
+        With dryRun, also say how long each should take.
+        """
         path = os.path.join(os.environ['SOPACTOR_DIR'],'scripts','*.inp')
         scripts = glob.glob(path)
-        scripts = ','.join(os.path.splitext(os.path.basename(s))[0] for s in scripts)
-        cmd.inform('availableScripts="%s"'%scripts)
+        names = [os.path.splitext(os.path.basename(s))[0] for s in scripts]
+        cmd.inform('availableScripts="%s"'%','.join(names))
+        if "dryRun" in cmd.cmd.keywords:
+            for name in names:
+                try:
+                    total = script.Script(cmd, name, genKeys=False).expectedTotal()
+                except RuntimeError as e:
+                    cmd.warn('text=%s' % qstr("Cannot load script %s: %s" % (name, e)))
+                    continue
+                cmd.inform('scriptTiming=%s,%0.1f' % (name, total))
         cmd.finish('')
 
     def ping(self, cmd):
@@ -383,6 +426,19 @@ class SopCmd(object):
 
         cmd.finish('text="Yawn; how soporific"')
 
+    def perf(self, cmd):
+        """
+        Report how long messages waited on each queue, and how long their
+        handlers took, per message type: count, mean, median, 90th percentile
+        and maximum, in seconds. With clear, start again from nothing.
+        """
+        myGlobals.perf.genKeys(cmd)
+        if "clear" in cmd.cmd.keywords:
+            myGlobals.perf.clear()
+            cmd.finish('text="cleared queue latency statistics"')
+        else:
+            cmd.finish('')
+
     def restart(self, cmd):
         """Restart the worker threads"""
 
@@ -447,48 +503,82 @@ class SopCmd(object):
 
         return False
 
-    def status(self, cmd, threads=False, finish=True, oneCommand=None):
+    def status(self, cmd, threads=False, finish=True, oneCommand=None, changedOnly=False):
         """Return sop status.
 
         If threads is true report on SOP's threads; (also if geek in cmd.keywords)
         If finish complete the command.
         Trim output to contain just keys relevant to oneCommand.
+        If changedOnly, only output keys that have changed since we last did.
         """
 
         sopState = myGlobals.actorState
-        bypass = myGlobals.bypass
 
-        self.actor.sendVersionKey(cmd)
+        if changedOnly:
+            self._status_keys(cmd, sopState, oneCommand=oneCommand, changedOnly=True)
+        else:
+            for level, msg in self._status_snapshot(sopState, oneCommand=oneCommand):
+                getattr(cmd, level)(msg)
 
         if hasattr(cmd, 'cmd') and cmd.cmd != None and "geek" in cmd.cmd.keywords:
             threads = True
             for t in threading.enumerate():
                 cmd.inform('text="%s"' % t)
 
+        if threads:
+            if not self._status_threads(cmd, sopState, finish=finish):
+                return
+
+        if finish:
+            cmd.finish("")
+
+        return
+
+    def _status_snapshot(self, sopState, oneCommand=None):
+        """
+        Return the (level, msg) of each line of a full status for oneCommand.
+
+        The lines are kept, and only redone when something they report has
+        changed: a CmdState, a bypass, the cartridge or the gang connector.
+        """
+        version = (CmdState.stateVersion.value, myGlobals.bypass.version,
+                   sopState.apogeeGang.getPhysicalPos())
+        cached = self._statusCache.get(oneCommand)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        recorder = StatusRecorder()
+        self._status_keys(recorder, sopState, oneCommand=oneCommand)
+        self._statusCache[oneCommand] = (version, recorder.lines)
+        return recorder.lines
+
+    def _status_keys(self, cmd, sopState, oneCommand=None, changedOnly=False):
+        """Output our status keywords (just those that have changed, if changedOnly)."""
+
+        bypass = myGlobals.bypass
+        emitted = CmdState.statusKeys
+
+        if emitted.changed('version', getattr(self.actor, 'version', None)) or not changedOnly:
+            self.actor.sendVersionKey(cmd)
+
         bypassNames, bypassStates = bypass.get_bypass_list()
-        cmd.inform("bypassNames="+", ".join(bypassNames))
+        emitted.output(cmd.inform, 'bypassNames', "bypassNames="+", ".join(bypassNames), changedOnly)
         bypassed = bypass.get_bypassedNames()
         txt = "bypassedNames=" + ", ".join(bypassed)
         # output non-empty bypassedNames as a warning, per #2187.
         if bypassed == []:
-            cmd.inform(txt)
+            emitted.output(cmd.inform, 'bypassedNames', txt, changedOnly)
         else:
-            cmd.warn(txt)
-        cmd.inform('text="apogeeGang: %s"' % (sopState.apogeeGang.getPos()))
-
-        cmd.inform("surveyCommands=" + ", ".join(sopState.validCommands))
-
-        self._status_commands(cmd, sopState, oneCommand=oneCommand)
+            emitted.output(cmd.warn, 'bypassedNames', txt, changedOnly)
+        emitted.output(cmd.inform, 'apogeeGang',
+                       'text="apogeeGang: %s"' % (sopState.apogeeGang.getPos()), changedOnly)
 
-        if threads:
-            self._status_threads(cmd, sopState, finish=finish)
-
-        if finish:
-            cmd.finish("")
+        emitted.output(cmd.inform, 'surveyCommands',
+                       "surveyCommands=" + ", ".join(sopState.validCommands), changedOnly)
 
-        return
+        self._status_commands(cmd, sopState, oneCommand=oneCommand, changedOnly=changedOnly)
 
-    def _status_commands(self, cmd, sopState, oneCommand=None):
+    def _status_commands(self, cmd, sopState, oneCommand=None, changedOnly=False):
         """Status of commands.
 
         This method is intended to be super'd and expanded for each location.
@@ -496,31 +586,32 @@ class SopCmd(object):
         """
 
         # major commands
-        sopState.doApogeeScience.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doApogeeSkyFlats.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.gotoGangChange.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doApogeeDomeFlat.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.gotoPosition.genKeys(cmd=cmd, trimKeys=oneCommand)
+        sopState.doApogeeScience.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doApogeeSkyFlats.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.gotoGangChange.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doApogeeDomeFlat.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.gotoPosition.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
 
     def _status_threads(self, cmd, sopState, finish=True):
-        # TBD: threads arg is only used with "geek" option, apparently?
-        # TBD: I guess its useful for live debugging of the threads.
-
-        try:
-            sopState.ignoreAborting = True
-            getStatus = MultiCommand(cmd, 5.0, None)
-
-            for tid in sopState.threads.keys():
-                getStatus.append(tid, Msg.STATUS)
+        """
+        Probe SOP's threads in parallel, outputting each one's state and reply
+        latency in threadProbe. Threads busy with a long command (e.g. the
+        master during an exposure) are busy, not failures.
 
-            if not getStatus.run():
-                if finish:
-                    cmd.fail("")
-                    return
-                else:
-                    cmd.warn("")
-        finally:
-            sopState.ignoreAborting = False
+        Return False if we failed cmd.
+        """
+        probe = myGlobals.heartbeat.probe(cmd, sopState, timeout=5.0)
+        cmd.inform("threadProbe=%s" % ",".join('"%s","%s",%0.3f' % p for p in probe))
+
+        failed = [name for name, state, latency in probe if state in ("failed", "dead")]
+        if failed:
+            txt = 'text="sop threads failed to answer: %s"' % ", ".join(failed)
+            if finish:
+                cmd.fail(txt)
+                return False
+            else:
+                cmd.warn(txt)
+        return True
 
     def initCommands(self):
         """Recreate the objects that hold the state of the various commands."""
@@ -612,6 +703,7 @@ class SopCmd(object):
         else:
             sopState.gotoField.setStages(['slew', 'guider', 'cleanup'])
 
+        CmdState.stateVersion.bump()
         if status:
             self.status(cmd, threads=False, finish=False)
 
@@ -627,20 +627,21 @@ class SopCmd_APO(SopCmd.SopCmd):
 
         super(SopCmd_APO, self).initCommands()
 
-    def _status_commands(self, cmd, sopState, oneCommand=None):
+    def _status_commands(self, cmd, sopState, oneCommand=None, changedOnly=False):
         """Status of APO specific commands.
 
         """
 
         super(SopCmd_APO, self)._status_commands(cmd, sopState,
-                                                 oneCommand=oneCommand)
-
-        sopState.gotoField.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doBossCalibs.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doBossScience.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doMangaDither.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doMangaSequence.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doApogeeMangaDither.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.doApogeeMangaSequence.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.hartmann.genKeys(cmd=cmd, trimKeys=oneCommand)
-        sopState.collimateBoss.genKeys(cmd=cmd, trimKeys=oneCommand)
+                                                 oneCommand=oneCommand,
+                                                 changedOnly=changedOnly)
+
+        sopState.gotoField.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doBossCalibs.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doBossScience.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doMangaDither.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doMangaSequence.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doApogeeMangaDither.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.doApogeeMangaSequence.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.hartmann.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
+        sopState.collimateBoss.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
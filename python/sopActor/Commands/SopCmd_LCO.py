@@ -165,15 +165,16 @@ class SopCmd_LCO(SopCmd.SopCmd):
 
         super(SopCmd_LCO, self).initCommands()
 
-    def _status_commands(self, cmd, sopState, oneCommand=None):
+    def _status_commands(self, cmd, sopState, oneCommand=None, changedOnly=False):
         """Status of LCO specific commands.
 
         """
 
         super(SopCmd_LCO, self)._status_commands(cmd, sopState,
-                                                 oneCommand=oneCommand)
+                                                 oneCommand=oneCommand,
+                                                 changedOnly=changedOnly)
 
-        sopState.gotoField.genKeys(cmd=cmd, trimKeys=oneCommand)
+        sopState.gotoField.genKeys(cmd=cmd, trimKeys=oneCommand, changedOnly=changedOnly)
 
     def doing_science(self, sopState):
         """Return True if any sort of science command is currently running."""
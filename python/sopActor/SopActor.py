@@ -16,6 +16,8 @@ from __future__ import print_function
 
 
 import abc
+import atexit
+import ConfigParser
 import os
 
 import opscore.actor.model
@@ -34,13 +36,24 @@ import lampThreads
 import tccThread
 import scriptThread
 import slewThread
+import kinematics
 
 import sopActor
 from sopActor import myGlobals
 from sopActor.utils.guider import GuiderState
 from sopActor.utils.gang import ApogeeGang
+from sopActor.utils.instrumentState import InstrumentStateCache
 
 from bypass import Bypass
+from executor import Executor
+from timers import Timers
+from durations import Durations
+from timeouts import TimeoutPolicy
+from lampJournal import LampJournal
+from coalesce import Coalescer
+from heartbeat import Heartbeat
+from perf import Perf
+import CmdState
 
 
 class State(object):
@@ -98,6 +111,14 @@ class SopActor(actorcore.Actor.SDSSActor):
         self.logger.propagate = True
 
         sopActor.myGlobals.bypass = Bypass()
+        sopActor.myGlobals.timers = Timers()
+        sopActor.myGlobals.durations = Durations()
+        sopActor.myGlobals.timeouts = TimeoutPolicy()
+        sopActor.myGlobals.lampJournal = LampJournal()
+        sopActor.myGlobals.coalescer = Coalescer()
+        sopActor.myGlobals.heartbeat = Heartbeat()
+        sopActor.myGlobals.perf = Perf()
+        atexit.register(self._stopServices)
 
         # Define the Thread list
         self.threadList = [
@@ -117,6 +138,51 @@ class SopActor(actorcore.Actor.SDSSActor):
             ('tcc', sopActor.TCC, tccThread),
             ('slew', sopActor.SLEW, slewThread)]
 
+        # The threads whose messages can instead be handled on a shared pool
+        # (see startThreads), and how to make their handlers.
+        self.poolable = dict((tname, lampThreads.handler(tid))
+                             for tname, tid, threadModule in self.threadList
+                             if tid in lampThreads.lamps)
+        self.poolable.update({'ffs': ffsThread.handler,
+                              'gcamera': gcameraThread.handler})
+        nWorkers = self._getConfig('executor', 'workers', self.config.getint, 0)
+        # ffs and gcamera can each hold a worker for minutes (a screen move, a
+        # guider exposure), so always leave at least one free for the lamps.
+        minWorkers = 3                  # ffs, gcamera, and one for the lamps
+        if 0 < nWorkers < minWorkers:
+            self.logger.warn('executor needs at least %d workers, not %d: using %d' %
+                             (minWorkers, nWorkers, minWorkers))
+            nWorkers = minWorkers
+        self.executor = Executor(self, nWorkers) if nWorkers > 0 else None
+
+        # What we've learned of how long things take, kept across restarts.
+        durationsFile = self._getConfig('durations', 'file')
+        if durationsFile:
+            myGlobals.durations.load(os.path.expandvars(durationsFile))
+        # When the lamps last changed, so that a restart doesn't warm them up again.
+        journalFile = self._getConfig('lamps', 'journal')
+        if journalFile:
+            myGlobals.lampJournal.load(os.path.expandvars(journalFile))
+        # How the timeouts are learned; whether to output only the status keywords
+        # that change as commands run, and how long to hold back a state that's
+        # still changing; how often to output threadHealth, and when a thread is stale.
+        for obj, attr, section, option, get in (
+                (myGlobals.timeouts, 'percentile', 'timeouts', 'percentile', self.config.getfloat),
+                (myGlobals.timeouts, 'margin', 'timeouts', 'margin', self.config.getfloat),
+                (myGlobals.timeouts, 'minSamples', 'timeouts', 'minSamples', self.config.getint),
+                (myGlobals.timeouts, 'shorten', 'timeouts', 'shorten', self.config.getboolean),
+                (CmdState, 'incremental', 'status', 'incremental', self.config.getboolean),
+                (myGlobals.coalescer, 'window', 'status', 'coalesceWindow', self.config.getfloat),
+                (myGlobals.heartbeat, 'interval', 'heartbeat', 'interval', self.config.getfloat),
+                (myGlobals.heartbeat, 'stale', 'heartbeat', 'stale', self.config.getfloat)):
+            setattr(obj, attr, self._getConfig(section, option, get, getattr(obj, attr)))
+        # How fast and how hard the mount's axes move, to predict how long slews take.
+        for axis in kinematics.mount.axes:
+            axis.maxVel = self._getConfig('mount', axis.name + 'Vel', self.config.getfloat,
+                                          axis.maxVel)
+            axis.maxAccel = self._getConfig('mount', axis.name + 'Accel', self.config.getfloat,
+                                            axis.maxAccel)
+
         # Explicitly load other actor models.
         self.models = {}
         for actor in ['boss', 'guider', 'platedb', 'mcp',
@@ -125,6 +191,7 @@ class SopActor(actorcore.Actor.SDSSActor):
 
         self.actorState = actorcore.Actor.ActorState(self, self.models)
         self.actorState.guiderState = GuiderState(self.models['guider'])
+        self.actorState.instrumentState = InstrumentStateCache(self.models)
         self.actorState.apogeeGang = ApogeeGang(location=self.location)
         myGlobals.actorState = self.actorState
 
@@ -136,6 +203,69 @@ class SopActor(actorcore.Actor.SDSSActor):
 
         self._readWarmUpTimes()
 
+    def _getConfig(self, section, option, get=None, default=None):
+        """
+        Return option from section of our config, read with get (e.g.
+        self.config.getfloat; self.config.get if None), or default if it isn't there.
+        """
+        if get is None:
+            get = self.config.get
+        try:
+            return get(section, option)
+        except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+            return default
+
+    def startThreads(self, actorState, cmd=None, restart=False, restartThreads=None,
+                     restartQueues=False, **kwargs):
+        """
+        Start or restart the worker threads and queues.
+
+        If we have an executor, the poolable threads aren't started: their
+        queues are handled by the executor's pool of workers instead.
+        Either way, the heartbeat reports on them all, and "sop perf" on
+        their latencies (but not on the reply queues of the commands they run).
+        """
+        myGlobals.heartbeat.start(self)
+        if self.executor is None:
+            super(SopActor, self).startThreads(actorState, cmd=cmd, restart=restart,
+                                               restartThreads=restartThreads,
+                                               restartQueues=restartQueues, **kwargs)
+            self._recordPerf(actorState)
+            return
+
+        threadList = self.threadList
+        pooled = [t for t in threadList if t[0] in self.poolable]
+        self.threadList = [t for t in threadList if t[0] not in self.poolable]
+        try:
+            super(SopActor, self).startThreads(actorState, cmd=cmd, restart=restart,
+                                               restartThreads=restartThreads,
+                                               restartQueues=restartQueues, **kwargs)
+        finally:
+            self.threadList = threadList
+
+        for tname, tid, threadModule in pooled:
+            if restartThreads and tname not in restartThreads:
+                continue
+            queue = actorState.queues.get(tid)
+            if queue is None or (restart and restartQueues):
+                if queue is not None:
+                    self.executor.unregister(queue)
+                queue = sopActor.Queue(tname, 0)
+                actorState.queues[tid] = queue
+            self.executor.register(queue, self.poolable[tname](self, actorState.queues))
+        self.executor.start()
+        self._recordPerf(actorState)
+
+    def _recordPerf(self, actorState):
+        """Record the latencies of the threads' own queues for "sop perf"."""
+        for queue in actorState.queues.values():
+            queue.stats = myGlobals.perf
+
+    def _stopServices(self):
+        """Stop the heartbeat and timers threads as sop exits, before the modules they use go away."""
+        myGlobals.heartbeat.stop()
+        myGlobals.timers.stop()
+
     def periodicStatus(self):
         """Run some command periodically"""
         pass
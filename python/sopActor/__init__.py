@@ -1,5 +1,8 @@
 import Queue as _Queue
+import heapq
+import itertools
 import threading
+import time
 import re
 
 from opscore.utility.qstr import qstr
@@ -55,11 +58,26 @@ try:
     Msg
 except NameError:
     class Msg(object):
+        """
+        A message to one of the threads.
+
+        Data may be passed as keyword arguments, and becomes attributes. The
+        common kinds of message are instances of compact subclasses (see
+        _classes, below), which keep their data in slots and only accept the
+        fields they declare; any other kind is a GenericMsg, which takes anything.
+        """
+        # The attributes every Msg has.
+        __slots__ = ('type', 'cmd', 'priority', 'duration', 'timeout', 'deadline', 'dependsOn',
+                     'replyQueue', 'inReplyTo', 'senderName', 'senderName0', 'senderQueue',
+                     'putTime', 'getTime')
+        _fields = ()                    # a subclass's own slots
+
         # Priorities
         CRITICAL = 0
         HIGH = 2
         MEDIUM = 4
         NORMAL = 6
+        LOW = 8
 
         # Command types; use classes so that the unique IDs are automatically generated
         class DO_BOSS_CALIBS(): pass
@@ -106,23 +124,59 @@ except NameError:
         class SCRIPT_STEP(): pass
         class TWODARKS(): pass
 
+        # Default priorities by command type; anything else is NORMAL.
+        # Self-requeued polling (WAIT_UNTIL, SCRIPT_STEP) yields to everything else,
+        # so that e.g. a restart or status needn't wait out a lamp warmup.
+        _priorities = {EXIT: CRITICAL,
+                       AXIS_STOP: HIGH,
+                       STOP_SCRIPT: HIGH,
+                       STATUS: HIGH,
+                       WAIT_UNTIL: LOW,
+                       SCRIPT_STEP: LOW,
+                      }
+
+        def __new__(cls, type=None, *args, **data):
+            """Make a Msg of the given type, using its compact subclass if it has one."""
+            if cls is Msg:
+                cls = Msg._classes.get(type, GenericMsg)
+            return object.__new__(cls)
+
         def __init__(self, type, cmd, **data):
             self.type = type
             self.cmd = cmd
-            self.priority = Msg.NORMAL
+            self.priority = Msg._priorities.get(type, Msg.NORMAL) # may be overridden by data
 
             self.duration = 0           # how long this command is expected to take (may be overridden by data)
+            self.timeout = None         # the least time to allow it to reply, if not None
+            self.deadline = None        # when it must have replied by, once its queue starts on it
+            self.dependsOn = None       # the queues whose preconditions must be met first; None for the default
+            self.replyQueue = None
             #
             # convert data[] into attributes
             #
             for k, v in data.items():
-                self.__setattr__(k, v)
-            self.__data = data.keys()
+                setattr(self, k, v)
+            # A Msg made while handling another, to pass on that one's reply (e.g. a relay,
+            # or a requeued WAIT_UNTIL), is answering it too; see Queue.put for replies.
+            handling = _get_handling()
+            if handling is not None and handling.replyQueue is not None and \
+                    self.replyQueue is handling.replyQueue:
+                self.inReplyTo = handling
+            else:
+                self.inReplyTo = None
+
+        def data(self):
+            """Return a dict of the data this Msg carries, beyond the attributes every Msg has."""
+            data = dict(getattr(self, '__dict__', {}))
+            for k in self._fields:
+                if hasattr(self, k):
+                    data[k] = getattr(self, k)
+            return data
 
         def __repr__(self):
             values = []
-            for k in self.__data:
-                values.append("%s : %s" % (k, self.__getattribute__(k)))
+            for k, v in self.data().items():
+                values.append("%s : %s" % (k, v))
 
             return "%s, %s: {%s}" % (self.type.__name__, self.cmd, ", ".join(values))
 
@@ -130,18 +184,84 @@ except NameError:
             """Used when sorting the messages in a priority queue"""
             return self.priority - rhs.priority
 
+    class GenericMsg(Msg):
+        """A Msg of a kind without a compact class, carrying whatever data it's given."""
+        __slots__ = ('__dict__',)
+
+    def _msgClass(name, msgType, fields):
+        """Return a compact subclass of Msg for messages of type msgType, with the given data fields."""
+        return type(name, (Msg,), dict(__slots__=fields, _fields=fields,
+                                       __doc__="A %s Msg" % msgType.__name__))
+
+    ExposeMsg = _msgClass('ExposeMsg', Msg.EXPOSE, ('expTime', 'expType', 'readout', 'cartridge',
+                                                    'nreads', 'comment'))
+    ReplyMsg = _msgClass('ReplyMsg', Msg.REPLY, ('success',))
+    LampOnMsg = _msgClass('LampOnMsg', Msg.LAMP_ON, ('on', 'delay', 'noWait'))
+    FfsMoveMsg = _msgClass('FfsMoveMsg', Msg.FFS_MOVE, ('open',))
+    SlewMsg = _msgClass('SlewMsg', Msg.SLEW, ('actorState', 'ra', 'dec', 'rot', 'az', 'alt',
+                                              'keepOffsets', 'ffScreen', 'nominal'))
+    StatusMsg = _msgClass('StatusMsg', Msg.STATUS, ())
+
+    # The types of Msg that have their own compact class.
+    Msg._classes = {Msg.EXPOSE: ExposeMsg,
+                    Msg.REPLY: ReplyMsg,
+                    Msg.LAMP_ON: LampOnMsg,
+                    Msg.FFS_MOVE: FfsMoveMsg,
+                    Msg.SLEW: SlewMsg,
+                    Msg.STATUS: StatusMsg,
+                   }
+
+# The name of the thread putting a Msg, and that name without any "-N" restart count.
+_senderNames = threading.local()
+
+def _get_sender_names():
+    """Return this thread's (name, name without restart count), computed once per thread."""
+    try:
+        return _senderNames.names
+    except AttributeError:
+        name = threading.current_thread().name
+        _senderNames.names = (name, re.sub(r"(-\d+)?$", "", name))
+        return _senderNames.names
+
+# The Msg this thread got from its queue, and is handling.
+_handling = threading.local()
+
+def _get_handling():
+    """Return the Msg this thread is handling, or None."""
+    return getattr(_handling, 'msg', None)
+
 class Queue(_Queue.PriorityQueue):
-    """A queue type that checks that the message is of the desired type"""
+    """
+    A queue type that checks that the message is of the desired type.
+
+    Messages are returned in order of priority, and in the order they were
+    put within a priority.
+    """
 
     Empty = _Queue.Empty
 
     def __init__(self, name, *args):
         _Queue.Queue.__init__(self, *args)
         self.name = name
+        self.executor = None            # the Executor handling our messages, if not a thread of our own
+        self._current = None            # the Msg last got, until its handler is done with it
+        self.checkedIn = None           # when our thread last asked for a message; see heartbeat
+        self.lastGot = None             # when it last got one
+        self.stats = None               # the perf.Perf to record our latencies in, for a thread's own queue
 
     def __str__(self):
         return self.name
 
+    def _init(self, maxsize):
+        _Queue.PriorityQueue._init(self, maxsize)
+        self._counter = itertools.count() # tie-breaker, so equal priorities stay FIFO
+
+    def _put(self, msg):
+        heapq.heappush(self.queue, (msg.priority, next(self._counter), msg))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
     def put(self, arg0, *args, **kwds):
         """
         Put  messaage onto the queue, calling the superclass's put method
@@ -153,18 +273,50 @@ class Queue(_Queue.PriorityQueue):
         else:
             msg = Msg(arg0, *args, **kwds)
 
-        msg.senderName = threading.current_thread().name
-        msg.senderName0 =  re.sub(r"(-\d+)?$", "", msg.senderName)
+        msg.senderName, msg.senderName0 = _get_sender_names()
         msg.senderQueue = self
+        if msg.inReplyTo is None:
+            handling = _get_handling()
+            if handling is not None and handling.replyQueue is self:
+                msg.inReplyTo = handling # a reply to the Msg we're handling
+        msg.putTime = time.time()
 
         _Queue.Queue.put(self, msg)
+        if self.executor is not None:
+            self.executor.notify(self)
+
+    def get(self, block=True, timeout=None):
+        """
+        Get the next message, recording how long it waited for us.
+        As each thread handles its messages in turn, asking for the next one
+        means the handler is done with the last.
+        """
+        self.done()
+        self.checkedIn = time.time()
+        msg = _Queue.PriorityQueue.get(self, block, timeout)
+        msg.getTime = self.lastGot = time.time()
+        if self.stats is not None:
+            self.stats.waited(self, msg)
+        self._current = msg
+        if _get_handling() is None:     # not e.g. a reply got while handling another Msg
+            _handling.msg = msg
+        return msg
+
+    def done(self):
+        """Record that the handler is done with the message it last got."""
+        msg, self._current = self._current, None
+        if msg is not None:
+            if self.stats is not None:
+                self.stats.handled(self, msg, time.time())
+            if _get_handling() is msg:
+                _handling.msg = None
 
     def flush(self):
         """flush the queue"""
 
         while True:
             try:
-                msg = self.get(timeout=0)
+                msg = _Queue.PriorityQueue.get(self, timeout=0)
             except Queue.Empty:
                 return
 
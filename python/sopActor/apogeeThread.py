@@ -4,6 +4,7 @@ import time
 import sopActor
 from sopActor import Msg, tback
 import sopActor.myGlobals as myGlobals
+from sopActor import flasher
 
 from opscore.utility.qstr import qstr
 
@@ -36,17 +37,17 @@ def checkFailure(cmd, replyQueue, cmdVar, failmsg, finish=True):
 def do_dither(cmd, actorState, dither):
     """Move the APOGEE dither position."""
     timeLim = 30.0  # seconds
-    cmdVar = actorState.actor.cmdr.call(actor="apogee", forUserCmd=cmd,
-                                        cmdStr=("dither namedpos=%s" % dither),
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = myGlobals.timeouts.call(actor="apogee", forUserCmd=cmd,
+                                     cmdStr=("dither namedpos=%s" % dither),
+                                     keyVars=[], timeLim=timeLim)
     return cmdVar
 #...
 
 def do_shutter(cmd,actorState,position):
     """Move the APOGEE shutter position."""
-    cmdVar = actorState.actor.cmdr.call(actor="apogee", forUserCmd=cmd,
-                                        cmdStr="shutter %s" % (position),
-                                        timeLim=20)
+    cmdVar = myGlobals.timeouts.call(actor="apogee", forUserCmd=cmd,
+                                     cmdStr="shutter %s" % (position),
+                                     timeLim=20)
     return cmdVar
 #...
 
@@ -68,16 +69,18 @@ def do_expose(cmd, actorState, expTime, dither, expType, comment, nreads=None):
         expFlavor = "nreads=%i"%nreads
         # read is 10.8 seconds, round up and add overhead
         timeLim = 11 * nreads + 15.0
+        nominal = 10.8 * nreads
     else:
         expFlavor = "time=%0.1f"%expTime
         timeLim = expTime + 15.0 # seconds
+        nominal = expTime
 
     comment = "comment=%s" % qstr(comment) if comment else ""
     exposeCmdStr = "expose %s object=%s %s"%(expFlavor, expType, comment)
 
-    cmdVar = actorState.actor.cmdr.call(actor="apogee", forUserCmd=cmd,
-                                        cmdStr=exposeCmdStr,
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = myGlobals.timeouts.call(actor="apogee", forUserCmd=cmd,
+                                     cmdStr=exposeCmdStr, nominal=nominal,
+                                     keyVars=[], timeLim=timeLim)
     success = not cmdVar.didFail
 
     if not success:
@@ -108,9 +111,10 @@ def do_apogee_dither_set(cmd, actorState, expTime, dithers, expType, comment):
     return True
 
 class ApogeeCB(object):
+    """Listen to the APOGEE reads, and flash the FF lamps in step with them when asked."""
     def __init__(self):
         self.cmd = myGlobals.actorState.actor.bcast
-        self.reset()
+        self.flasher = None
         myGlobals.actorState.models['apogee'].keyVarDict["utrReadState"].addCallback(self.listenToReads, callNow=True)
 
     def shutdown(self):
@@ -128,60 +132,25 @@ class ApogeeCB(object):
 
         if not self.cmd.isAlive():
             self.cmd = myGlobals.actorState.actor.bcast
-        self.cmd.diag('text="utrReadState=%s,%s count=%s trigger=%s"' %
-                      (state, n, self.count, self.triggerCount))
+        scheduler = self.flasher
+        self.cmd.diag('text="utrReadState=%s,%s reads=%s"' %
+                      (state, n, len(scheduler.reads) if scheduler else None))
 
-        if self.triggerCount < 0:
+        if scheduler is None or str(state) != "Reading":
             return
-        if str(state) != "Reading":
-            return
-
-        self.count += 1
 
         try:
-            #if not self.cmd.isAlive():
-            #    self.cmd = myGlobals.actorState.actor.bcast
-            self.cmd.diag('text="utrReadState2=%s,%s count=%s trigger=%s"' %
-                          (state, n, self.count, self.triggerCount))
-
-            if self.count == self.triggerCount:
-                self.reset()
-                # time.sleep(1)
-                self.cb()
+            scheduler.read()
+            if scheduler.scheduled():
+                self.flasher = None
         except Exception as e:
-            self.cmd.warn('text="failed to call callback: %s"' % (e))
-            tback("cb", e)
+            self.cmd.warn('text="failed to schedule APOGEE flash: %s"' % (e))
+            tback("flash", e)
 
-    def reset(self):
-        self.count = 0
-        self.triggerCount = -1
-
-    def waitForNthRead(self, cmd, n, q, cb=None):
-        self.reset()
+    def flash(self, cmd, pattern=(3,)):
+        """Flash the FF lamps after each read in pattern of the exposure that's about to start."""
         self.cmd = cmd
-        self.triggerCount = n
-        self.q = q
-
-        self.cb = cb if cb else self.flashLamps
-
-    def turnOffLamps(self):
-        self.cmd.diag('text="calling ff_lamp.off"')
-        replyQueue = sopActor.Queue("apogeeFlasher")
-        myGlobals.actorState.queues[sopActor.FF_LAMP].put(Msg.LAMP_ON, cmd=self.cmd, on=False, replyQueue=replyQueue)
-        self.cmd.diag('text="called ff_lamp.off"')
-
-    def flashLamps(self):
-        time2flash = 4.0       # seconds
-
-        replyQueue = sopActor.Queue("apogeeFlasher")
-        self.cmd.diag('text="calling ff_lamp.on"')
-        # NOTE: calling with noWait, so we don't wait for the mcp to respond.
-        # This prevents the problem where one lamp doesn't turn on within 4 seconds.
-        myGlobals.actorState.queues[sopActor.FF_LAMP].put(Msg.LAMP_ON, cmd=self.cmd, on=True, replyQueue=replyQueue, noWait=True)
-
-        self.cmd.diag('text="called ff_lamp.on"')
-        self.cmd.diag('text="pausing..."')
-        reactor.callLater(time2flash, self.turnOffLamps)
+        self.flasher = flasher.FlashScheduler(cmd, pattern, callLater=reactor.callLater)
 
 def main(actor, queues):
     """Main loop for APOGEE ICC thread"""
@@ -248,7 +217,7 @@ def main(actor, queues):
                 raise ValueError, ("Unknown message type %s" % msg.type)
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception as e:
             sopActor.handle_bad_exception(actor,e,threadName,msg)
 
@@ -294,15 +263,14 @@ def script_main(actor, queues):
 
             elif msg.type == Msg.POST_FLAT:
                 cmd = msg.cmd
-                n = 3
+                pattern = getattr(msg, 'flashes', (3,))
 
+                apogeeFlatCB.flash(cmd, pattern)
                 actorState.queues[sopActor.APOGEE].put(Msg.EXPOSE, cmd, replyQueue=msg.replyQueue,
                                                        expTime=50, expType='DomeFlat')
-                apogeeFlatCB.waitForNthRead(cmd, n, msg.replyQueue)
 
             elif msg.type == Msg.APOGEE_PARK_DARKS:
                 cmd = msg.cmd
-                n = 2
                 # expTime = 100.0
 
                 if True:
@@ -323,6 +291,6 @@ def script_main(actor, queues):
                 raise ValueError, ("Unknown message type %s" % msg.type)
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception, e:
             sopActor.handle_bad_exception(actor,e,threadName,msg)
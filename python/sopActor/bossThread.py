@@ -39,10 +39,10 @@ def single_hartmann(cmd, actorState, replyQueue, expTime, mask):
     
     timeLim = expTime + 180.0  # seconds
     timeLim += 100
-    cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=cmd,
-                                        cmdStr=("exposure %s %s hartmann=%s" %
-                                                (expType, expTimeCmd, mask)),
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = sopActor.myGlobals.timeouts.call(actor="boss", forUserCmd=cmd,
+                                              cmdStr=("exposure %s %s hartmann=%s" %
+                                                      (expType, expTimeCmd, mask)),
+                                              nominal=expTime, keyVars=[], timeLim=timeLim)
     
     replyQueue.put(Msg.EXPOSURE_FINISHED, cmd=cmd, success=not cmdVar.didFail)
 #...
@@ -54,8 +54,8 @@ def hartmann(cmd, actorState, replyQueue, args):
     cmdStr = 'collimate'
     if args is not None:
         cmdStr = ' '.join((cmdStr,args))
-    cmdVar = actorState.actor.cmdr.call(actor="hartmann", forUserCmd=cmd,cmdStr=cmdStr,
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = sopActor.myGlobals.timeouts.call(actor="hartmann", forUserCmd=cmd,cmdStr=cmdStr,
+                                              keyVars=[], timeLim=timeLim)
 
     if cmdVar.didFail:
         cmd.error("text='Failed to collimate BOSS spectrographs.")
@@ -91,10 +91,10 @@ def main(actor, queues):
 
                 timeLim = msg.expTime + 180.0  # seconds
                 timeLim += 100
-                cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=msg.cmd,
-                                                    cmdStr=("exposure %s %s %s" %
-                                                            (expType, expTimeCmd, readoutCmd)),
-                                                    keyVars=[], timeLim=timeLim)
+                cmdVar = sopActor.myGlobals.timeouts.call(actor="boss", forUserCmd=msg.cmd,
+                                                          cmdStr=("exposure %s %s %s" %
+                                                                  (expType, expTimeCmd, readoutCmd)),
+                                                          nominal=max(msg.expTime, 0), keyVars=[], timeLim=timeLim)
                 if cmdVar.didFail:
                     msg.cmd.error('text="BOSS failed on %s"'%cmdTxt)
                 msg.replyQueue.put(Msg.EXPOSURE_FINISHED, cmd=msg.cmd, success=not cmdVar.didFail)
@@ -113,6 +113,6 @@ def main(actor, queues):
                 raise ValueError, ("Unknown message type %s" % msg.type)
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception, e:
             sopActor.handle_bad_exception(actor,e,threadName,msg)
@@ -11,6 +11,7 @@ class Bypass(object):
     def __init__(self):
         """Define what can be bypassed on init, and clear them all."""
         self._bypassed = {}
+        self.version = 0                # bumped on every change, for SopCmd's cached status
         for ss in ("ffs", "lamp_ff", "lamp_hgcd", "lamp_ne",
                    "axes", "slewToField", "guiderDark",
                    "isBoss", "isApogee",
@@ -37,6 +38,7 @@ class Bypass(object):
             if self.is_gang_bypass(name) and bypassed:
                 self.clear_gang_bypasses()
             self._bypassed[name] = bypassed
+            self.version += 1
         else:
             return None
 
@@ -66,11 +68,13 @@ class Bypass(object):
         """Clear all cartridge bypasses."""
         for name in self.cartBypasses:
             self._bypassed[name] = False
+        self.version += 1
 
     def clear_gang_bypasses(self):
         """Clear all gang connector bypasses."""
         for name in self.gangBypasses:
             self._bypassed[name] = False
+        self.version += 1
 
     def get_bypassedNames(self):
         """Return an alphabetized list of currently-bypassed systems, for keyword output."""
@@ -0,0 +1,105 @@
+"""
+Coalesce bursts of state keywords, e.g. stageState and <cmd>State.
+
+A sequence can take a stage through prepping, prepped and running within a
+few milliseconds, each of them another output of the same keyword. So within
+window seconds of a keyword's last output, a new value is held back instead,
+replacing any value already held for that keyword. What's held goes out when
+the window ends, or as soon as anything else goes out, so that keywords still
+appear in the order they last changed. Final values (done, failed, ...) always
+go out at once: nothing's last state is ever lost, or late.
+
+The first time we hold something for a command, we hook its output methods
+(inform, warn, finish, fail, ...) so that they output whatever we're holding
+for it first: nothing else said about a command can overtake a state that's
+being held, and no held state can outlive its command.
+"""
+import collections
+import threading
+import time
+
+
+class Coalescer(object):
+    """Output keywords, holding back those that change again within window seconds."""
+
+    def __init__(self, window=0):
+        self.window = window            # seconds; 0 to output every value at once
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict() # key: (cmd, msg), in the order they changed
+        self._last = {}                 # key: when we last output it
+        self._timer = None
+
+    # The Cmd methods that output something, and so must come after what's held.
+    hooked = ('diag', 'inform', 'respond', 'warn', 'error', 'finish', 'fail')
+
+    def write(self, cmd, key, msg, final=True):
+        """
+        Output msg, the latest value of keyword key, to cmd; unless it isn't
+        final and key was output less than window seconds ago, in which case
+        hold on to it until later.
+        """
+        now = time.time()
+        with self._lock:
+            self._pending.pop(key, None)    # superseded by msg
+            if not final and self.window > 0:
+                last = self._last.get(key)
+                if last is not None and now - last < self.window:
+                    self._hook(cmd)
+                    self._pending[key] = (cmd, msg)
+                    if self._timer is None:
+                        self._timer = threading.Timer(self.window, self.flush)
+                        self._timer.daemon = True
+                        self._timer.start()
+                    return
+            self._flush(now)
+            self._inform(cmd, msg)
+            self._last[key] = now
+
+    def flush(self, cmd=None):
+        """Output everything we're holding on to (for cmd, if not None)."""
+        with self._lock:
+            self._flush(time.time(), cmd)
+
+    def _flush(self, now, cmd=None):
+        """Output everything we're holding (for cmd, if not None), in order; call with the lock held."""
+        for key, (heldCmd, msg) in self._pending.items():
+            if cmd is None or heldCmd is cmd:
+                self._inform(heldCmd, msg)
+                self._last[key] = now
+                del self._pending[key]
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _hook(self, cmd):
+        """Have cmd flush what we're holding for it before it outputs anything else."""
+        if getattr(cmd, '_unhooked', None) is not None:
+            return
+        unhooked = {}
+        for name in self.hooked:
+            method = getattr(cmd, name, None)
+            if method is not None:
+                unhooked[name] = method
+                setattr(cmd, name, self._flushFirst(cmd, method))
+        cmd._unhooked = unhooked
+
+    def _flushFirst(self, cmd, method):
+        """Return method (one of cmd's), but flushing what we're holding for cmd first."""
+        def flushFirst(*args, **kwargs):
+            self.flush(cmd)
+            return method(*args, **kwargs)
+        return flushFirst
+
+    def _inform(self, cmd, msg):
+        """cmd.inform(msg), bypassing our hook (as we're holding the lock)."""
+        unhooked = getattr(cmd, '_unhooked', None)
+        (unhooked['inform'] if unhooked else cmd.inform)(msg)
+
+    def clear(self):
+        """Forget what we've output, and drop anything we're holding."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+            self._last = {}
@@ -0,0 +1,161 @@
+"""
+How long things have taken, remembered across restarts.
+
+Every time a MultiCommand gets a successful reply we note how long the Msg
+took from when its queue started on it, keyed by (queue, Msg type, bucket);
+and likewise how long each command that the threads send to other actors
+takes (see timeouts), keyed by actor and the command with its numbers taken
+out.
+The bucket is the Msg's discrete parameters (e.g. readout, or which way a
+lamp is going); its continuous ones (exposure time, lamp warmup delay) are
+subtracted out first, so what we learn is the overhead, and one bucket
+serves every exposure time.
+
+We keep only the last maxSamples of each, and at most maxKeys keys, in a
+small JSON file that is quick to load at startup.
+"""
+import collections
+import json
+import re
+import threading
+import time
+
+from sopActor.utils.jsonFile import save_json
+
+# The Msg parameters that select a bucket.
+bucketFields = ('expType', 'readout', 'on', 'open', 'noWait')
+
+maxSamples = 50                         # per key
+maxKeys = 500
+minSamples = 3                          # fewer than this, and we don't trust the percentiles
+saveInterval = 300                      # seconds between saves, at most
+
+
+def nominal(msg):
+    """
+    Return the time msg is asked to take, beyond any overhead: its exposures
+    and delays, or the estimate it was given as its nominal (e.g. a slew's,
+    from kinematics).
+    """
+    if getattr(msg, 'nominal', None) is not None:
+        return msg.nominal
+    expTime = getattr(msg, 'expTime', None)
+    seconds = expTime if expTime is not None and expTime > 0 else 0
+    dithers = getattr(msg, 'dithers', None)
+    if dithers:
+        seconds *= len(dithers)
+    delay = getattr(msg, 'delay', None)
+    if delay:
+        seconds += delay
+    return seconds
+
+def key(queue, msg):
+    """Return the key we file msg's durations on queue under."""
+    values = ["%s=%s" % (field, getattr(msg, field)) for field in bucketFields
+              if getattr(msg, field, None) is not None]
+    if getattr(msg, 'nominal', None) is not None:
+        values.append("nominal")        # overheads beyond an estimate, not whole durations
+    return "%s,%s,%s" % (queue, msg.type.__name__, ";".join(values))
+
+def callKey(actor, cmdStr, literal=False):
+    """
+    Return the key we file the durations of actor's cmdStr under. Numbers
+    are wildcarded (their time is in the nominal) unless literal (e.g. a
+    script line's "expose nreads=60", whose nominal we don't know), and so is
+    quoted free text (e.g. an APOGEE exposure's comment), always.
+    """
+    cmdStr = re.sub(r'"(?:[^"\\]|\\.)*"', '"*"', cmdStr)
+    if literal:
+        return "%s,line,%s" % (actor, cmdStr)
+    return "%s,call,%s" % (actor, re.sub(r"\d+(\.\d*)?", "#", cmdStr))
+
+
+class Durations(object):
+    """The recent overheads of each (queue, Msg type, bucket), and their percentiles."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saveLock = threading.Lock() # one save at a time: they share the tmp file
+        self.fileName = None            # where we're saved; None to not save
+        self.learning = True            # False to only use what we've learned so far
+        self.clear()
+
+    def clear(self):
+        """Forget everything we've learned."""
+        with self._lock:
+            self.samples = collections.OrderedDict() # key: deque of overheads, least recently updated first
+            self._saved = time.time()
+
+    def load(self, fileName):
+        """Load what we learned from fileName (if it exists), and save there from now on."""
+        samples = collections.OrderedDict()
+        try:
+            with open(fileName) as fd:
+                for k, values in json.load(fd)[-maxKeys:]:
+                    samples[str(k)] = collections.deque(values[-maxSamples:], maxSamples)
+        except (IOError, ValueError):
+            samples.clear()             # a missing or damaged file: start afresh
+        with self._lock:
+            self.samples = samples
+            self.fileName = fileName
+            self._saved = time.time()
+
+    def save(self):
+        """Write what we've learned to our file (atomically, so a crash can't leave half of it)."""
+        if self.fileName is None:
+            return
+        with self._saveLock:
+            with self._lock:
+                data = [(k, list(values)) for k, values in self.samples.items()]
+                self._saved = time.time()
+            save_json(self.fileName, data)
+
+    def observed(self, queue, msg, seconds):
+        """msg took seconds to do on queue: learn from it."""
+        self._observed(key(queue, msg), seconds - nominal(msg))
+
+    def observedCall(self, actor, cmdStr, seconds, nominal=0, literal=False):
+        """actor took seconds to do cmdStr, nominal of which it was asked to take: learn from it."""
+        self._observed(callKey(actor, cmdStr, literal), seconds - nominal)
+
+    def _observed(self, k, overhead):
+        """Learn that k took overhead seconds more than nominal, saving if it's been a while."""
+        if not self.learning:
+            return
+        overhead = round(max(overhead, 0.0), 1)
+        with self._lock:
+            values = self.samples.pop(k, None)
+            if values is None:
+                values = collections.deque(maxlen=maxSamples)
+                while len(self.samples) >= maxKeys:
+                    self.samples.popitem(last=False)
+            values.append(overhead)
+            self.samples[k] = values
+            due = time.time() - self._saved > saveInterval
+        if due:
+            try:
+                self.save()
+            except (IOError, OSError):
+                pass                    # we'll try again next time; don't fail the command over it
+
+    def percentile(self, queue, msg, p, minSamples=minSamples):
+        """
+        Return how long msg should take on queue, with the p'th percentile
+        of the overheads we've seen; None if we've seen fewer than minSamples.
+        """
+        overhead = self._percentile(key(queue, msg), p, minSamples)
+        return None if overhead is None else nominal(msg) + overhead
+
+    def callPercentile(self, actor, cmdStr, p, nominal=0, minSamples=minSamples, literal=False):
+        """As percentile, for actor's cmdStr, which is asked to take nominal seconds."""
+        overhead = self._percentile(callKey(actor, cmdStr, literal), p, minSamples)
+        return None if overhead is None else nominal + overhead
+
+    def _percentile(self, k, p, minSamples):
+        """Return the p'th percentile of k's overheads, or None if there are fewer than minSamples."""
+        with self._lock:
+            values = self.samples.get(k)
+            if values is None or len(values) < minSamples:
+                return None
+            values = sorted(values)
+        return values[min(int(p/100.0*len(values)), len(values) - 1)]
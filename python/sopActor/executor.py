@@ -0,0 +1,100 @@
+"""
+Run the handlers for several queues on a small, bounded pool of threads.
+
+Most of sop's subsystem threads spend their lives blocked in queue.get(),
+waking only to say that they're alive. An Executor instead hands each
+message to that queue's handler on one of a few shared worker threads,
+while guaranteeing that a queue's messages are still handled one at a
+time, in order, just as a dedicated thread would.
+"""
+import collections
+import threading
+
+import sopActor
+from sopActor import handle_bad_exception
+
+
+class Executor(object):
+    """
+    A pool of worker threads that run per-queue message handlers.
+
+    A handler is called as handler(msg) and returns False when its queue
+    should be detached (i.e. on EXIT), like a thread main loop returning.
+    """
+
+    def __init__(self, actor, nWorkers, name="executor"):
+        self.actor = actor
+        self.nWorkers = nWorkers
+        self.name = name
+        self._handlers = {}             # queue: handler
+        self._ready = collections.deque() # queues with messages, that no worker has
+        self._busy = set()              # queues a worker is handling (or are in _ready)
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def __contains__(self, queue):
+        return queue in self._handlers
+
+    def start(self):
+        """Start the worker threads, if they aren't already running."""
+        with self._cond:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            for i in range(len(self._workers), self.nWorkers):
+                worker = threading.Thread(target=self._work, name="%s-%d" % (self.name, i))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def register(self, queue, handler):
+        """Have handler process the messages put onto queue, instead of a dedicated thread."""
+        with self._cond:
+            self._handlers[queue] = handler
+            queue.executor = self
+        self.notify(queue)
+
+    def unregister(self, queue):
+        """Stop handling queue's messages; any left are kept on the queue."""
+        with self._cond:
+            self._handlers.pop(queue, None)
+            if getattr(queue, 'executor', None) is self:
+                queue.executor = None
+
+    def notify(self, queue):
+        """Called when something is put onto queue: schedule it, unless a worker already has it."""
+        with self._cond:
+            if queue in self._handlers and queue not in self._busy and not queue.empty():
+                self._busy.add(queue)
+                self._ready.append(queue)
+                self._cond.notify()
+
+    def _work(self):
+        """Worker thread: handle one message from each ready queue in turn."""
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                queue = self._ready.popleft()
+                handler = self._handlers.get(queue)
+
+            msg = None
+            try:
+                if handler is not None:
+                    msg = queue.get(block=False)
+                    # Reply as the queue's thread would, so that e.g. bypasses
+                    # and deadlines know who's answering.
+                    sopActor._senderNames.names = (queue.name, queue.name)
+                    try:
+                        keepGoing = handler(msg)
+                    finally:
+                        queue.done()
+                    if keepGoing is False:
+                        self.unregister(queue)
+            except queue.Empty:
+                pass
+            except Exception, e:
+                handle_bad_exception(self.actor, e, str(queue), msg)
+
+            # Let someone else take this queue, now that we've finished with it.
+            with self._cond:
+                self._busy.discard(queue)
+            self.notify(queue)
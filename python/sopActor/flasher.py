@@ -0,0 +1,124 @@
+"""
+Flash the flat field lamps during an APOGEE exposure, in step with its reads.
+
+An APOGEE dome flat is an up-the-ramp exposure with the FF lamps flashed on
+for a few seconds part way through. A flash that straddles a read splits its
+light between two of them, so each flash is timed to sit in the middle of the
+interval after the read it follows:
+
+* each read (utrReadState "Reading") is timestamped, and the interval between
+  reads taken from those (readInterval until we've seen two);
+* the lamps are commanded early by how long the mcp takes to act on them: half
+  the round trip of ff.on, as timeouts has learned it (defaultLatency until it
+  has);
+* the round trip of each command is measured, and the on-time the lamps got
+  is reported as apogeeFlash=flash,nFlash,onTime.
+
+The lamps are commanded through the FF lamp thread, like every other use of
+them, so that its lamp_ff bypass and the lamp journal apply to flashes too.
+
+pattern lists the reads (counting from 1) to flash after, e.g. (3,) for the
+usual single flash, or (3, 5, 7) for three.
+"""
+import threading
+import time
+
+import sopActor
+from sopActor import Msg
+import sopActor.myGlobals as myGlobals
+
+readInterval = 10.8                     # seconds between APOGEE reads, until we've timed some
+defaultLatency = 0.5                    # seconds from sending a lamp command to the mcp acting on it
+flashTime = 4.0                         # seconds to have the lamps on for
+
+
+class FlashScheduler(object):
+    """
+    Flash the FF lamps after the reads in pattern of one exposure.
+
+    Call read() as each read starts. callLater(seconds, function, *args) is
+    how to call function later (e.g. twisted's reactor.callLater), and
+    lampQueue the FF lamp thread's queue (actorState's, if None).
+    """
+
+    def __init__(self, cmd, pattern=(3,), flashTime=flashTime, callLater=None, lampQueue=None):
+        self.cmd = cmd
+        self.pattern = tuple(sorted(pattern))
+        self.flashTime = flashTime
+        self.callLater = callLater
+        self.lampQueue = lampQueue
+        self._lock = threading.Lock()
+        self.reads = []                 # when each read started
+        self.flashes = []               # per flash, {on: (time sent, round trip)}
+
+    def scheduled(self):
+        """Have all our flashes been scheduled?"""
+        return len(self.flashes) == len(self.pattern)
+
+    def interval(self):
+        """Return the seconds between reads: the median of those we've timed, or readInterval."""
+        gaps = sorted(b - a for a, b in zip(self.reads, self.reads[1:]))
+        return gaps[len(gaps)//2] if gaps else readInterval
+
+    def latency(self):
+        """Return the seconds from sending a lamp command to the mcp acting on it."""
+        roundTrip = myGlobals.durations.callPercentile('mcp', 'ff.on', 50)
+        return defaultLatency if roundTrip is None else roundTrip/2.0
+
+    def window(self, readTime):
+        """Return when to send the lamps on, and off, to centre a flash in the interval after readTime."""
+        middle = readTime + self.interval()/2.0 - self.latency()
+        return middle - self.flashTime/2.0, middle + self.flashTime/2.0
+
+    def read(self, when=None):
+        """A read started at when (now, if None): schedule a flash after it, if pattern says to."""
+        now = time.time()
+        self.reads.append(now if when is None else when)
+        if len(self.reads) not in self.pattern:
+            return
+
+        onAt, offAt = self.window(self.reads[-1])
+        with self._lock:
+            flash = len(self.flashes)
+            self.flashes.append({})
+        self.callLater(max(onAt - now, 0), self._lamp, flash, True)
+        self.callLater(max(offAt - now, 0), self._lamp, flash, False)
+
+    def _lamp(self, flash, on):
+        """Send the lamps on (or off), for flash."""
+        queue = self.lampQueue
+        if queue is None:
+            queue = myGlobals.actorState.queues[sopActor.FF_LAMP]
+        sent = time.time()
+        replyQueue = ReplyCallback(lambda success: self._replied(flash, on, sent, success))
+        queue.put(Msg.LAMP_ON, cmd=self.cmd, on=on, replyQueue=replyQueue)
+
+    def _replied(self, flash, on, sent, success):
+        """The lamp thread has finished the lamp command for flash that we sent at sent."""
+        roundTrip = time.time() - sent
+        if not success:
+            self.cmd.warn('text="Failed to turn FF lamps %s for APOGEE flash %d"' %
+                          ("on" if on else "off", flash + 1))
+            return
+
+        with self._lock:
+            self.flashes[flash][on] = (sent, roundTrip)
+            if len(self.flashes[flash]) < 2:
+                return
+            (onSent, onTrip), (offSent, offTrip) = self.flashes[flash][True], self.flashes[flash][False]
+        onTime = (offSent + offTrip/2.0) - (onSent + onTrip/2.0)
+        self.cmd.inform('apogeeFlash=%d,%d,%0.2f' % (flash + 1, len(self.pattern), onTime))
+
+
+class ReplyCallback(object):
+    """
+    A replyQueue that calls callback(success) with the reply put on it, rather
+    than waiting for someone to get it: the flashes are scheduled from the
+    reactor, which mustn't block.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def put(self, msgType, cmd=None, success=True, **kwargs):
+        self.callback(success)
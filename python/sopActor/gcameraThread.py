@@ -7,40 +7,54 @@ import sopActor.myGlobals
 from opscore.utility.qstr import qstr
 from opscore.utility.tback import tback
 
+def handle(actor, msg):
+    """Handle one msg for the gcamera ICC. Return False if we should exit."""
+
+    threadName = "gcamera"
+
+    try:
+        if msg.type == Msg.EXIT:
+            if msg.cmd:
+                msg.cmd.inform('text="Exiting thread %s"' % (threading.current_thread().name))
+
+            return False
+
+        elif msg.type == Msg.EXPOSE:
+            msg.cmd.respond('text="starting gcamera exposure"')
+
+            timeLim = msg.expTime + 180.0  # seconds
+            cmdVar = sopActor.myGlobals.timeouts.call(actor="gcamera", forUserCmd=msg.cmd,
+                                                      cmdStr=("%s time=%g cartridge=%d" %
+                                                              (msg.expType, msg.expTime, msg.cartridge)),
+                                                      nominal=msg.expTime, keyVars=[], timeLim=timeLim)
+
+            msg.replyQueue.put(Msg.EXPOSURE_FINISHED, cmd=msg.cmd, success=not cmdVar.didFail)
+
+        elif msg.type == Msg.STATUS:
+            msg.cmd.inform('text="%s thread"' % threadName)
+            msg.replyQueue.put(Msg.REPLY, cmd=msg.cmd, success=True)
+        else:
+            raise ValueError, ("Unknown message type %s" % msg.type)
+    except Exception, e:
+        sopActor.handle_bad_exception(actor, e, threadName, msg)
+    return True
+
 def main(actor, queues):
     """Main loop for gcamera ICC thread"""
 
-    threadName = "gcamera"
     actorState = sopActor.myGlobals.actorState
     timeout = actorState.timeout
 
     while True:
         try:
             msg = queues[sopActor.GCAMERA].get(timeout=timeout)
+        except Queue.Empty:
+            continue                    # queue.get() checked in with the heartbeat
 
-            if msg.type == Msg.EXIT:
-                if msg.cmd:
-                    msg.cmd.inform('text="Exiting thread %s"' % (threading.current_thread().name))
-
-                return
-
-            elif msg.type == Msg.EXPOSE:
-                msg.cmd.respond('text="starting gcamera exposure"')
-
-                timeLim = msg.expTime + 180.0  # seconds
-                cmdVar = actorState.actor.cmdr.call(actor="gcamera", forUserCmd=msg.cmd,
-                                                    cmdStr=("%s time=%g cartridge=%d" %
-                                                            (msg.expType, msg.expTime, msg.cartridge)),
-                                                    keyVars=[], timeLim=timeLim)
+        if not handle(actor, msg):
+            return
 
-                msg.replyQueue.put(Msg.EXPOSURE_FINISHED, cmd=msg.cmd, success=not cmdVar.didFail)
+def handler(actor, queues):
+    """Return a handler for the gcamera ICC's messages, for an Executor."""
 
-            elif msg.type == Msg.STATUS:
-                msg.cmd.inform('text="%s thread"' % threadName)
-                msg.replyQueue.put(Msg.REPLY, cmd=msg.cmd, success=True)
-            else:
-                raise ValueError, ("Unknown message type %s" % msg.type)
-        except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
-        except Exception, e:
-            sopActor.handle_bad_exception(actor, e, threadName, msg)
+    return lambda msg: handle(actor, msg)
@@ -2,6 +2,7 @@ import Queue, threading
 
 from sopActor import *
 import sopActor.myGlobals
+from sopActor.utils.calls import call_async, wait_first_failure
 from opscore.utility.qstr import qstr
 
 def get_expTime(msg):
@@ -26,14 +27,17 @@ def guider_start(cmd, replyQueue, actorState, start, expTime, clearCorrections,
     """Start/stop the guider and put an appropriate message on replyQueue if it succeeded."""
 
     if clearCorrections:
-        for corr in ("axes", "scale", "focus"):
-            cmdVar = actorState.actor.cmdr.call(actor="guider", forUserCmd=cmd,
-                                                cmdStr=("%s off" % (corr)),
-                                                keyVars=[], timeLim=3)
-            if cmdVar.didFail:
-                cmd.error('text="failed to disable %s guider corrections!!!"' % (corr))
-                replyQueue.put(Msg.DONE, cmd=cmd, success=not cmdVar.didFail)
-                return
+        # these are independent, so send them all at once, and give up on the first failure.
+        corrs = ("axes", "scale", "focus")
+        futures = [call_async(actor="guider", forUserCmd=cmd,
+                              cmdStr=("%s off" % (corr)),
+                              keyVars=[], timeLim=3) for corr in corrs]
+        failed = wait_first_failure(futures)
+        if failed is not None:
+            corr = corrs[futures.index(failed)]
+            cmd.error('text="failed to disable %s guider corrections!!!"' % (corr))
+            replyQueue.put(Msg.DONE, cmd=cmd, success=False)
+            return
 
     # If we are starting a "permanent" guide loop, we can't wait for the command to finish.
     # So, wait long enough to see whether it blows up on the pad,
@@ -72,9 +76,9 @@ def decenter(cmd, state, actorState):
     """Activate or deactive decentered guiding."""
     cmd.respond('text="Turning decentered guiding %s."'%state)
     timeLim = 60 # could take as long as a 3xstack.
-    cmdVar = actorState.actor.cmdr.call(actor="guider", forUserCmd=cmd,
-                                        cmdStr="decenter %s"%(state),
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = sopActor.myGlobals.timeouts.call(actor="guider", forUserCmd=cmd,
+                                              cmdStr="decenter %s"%(state),
+                                              keyVars=[], timeLim=timeLim)
     if cmdVar.didFail:
         cmd.error('text=%s'%qstr("Failed to turn guider decentering %s."%state))
     return not cmdVar.didFail
@@ -84,9 +88,9 @@ def manga_dither(cmd, dither, actorState):
     cmd.respond('text=%s'%qstr("Changing guider dither position to %s."%dither))
     timeLim = 60 # could take as long as a long guider exposure+readout, etc.
     ditherPos = "ditherPos=%s"%dither
-    cmdVar = actorState.actor.cmdr.call(actor="guider", forUserCmd=cmd,
-                                        cmdStr="mangaDither %s" % (ditherPos),
-                                        keyVars=[], timeLim=timeLim)
+    cmdVar = sopActor.myGlobals.timeouts.call(actor="guider", forUserCmd=cmd,
+                                              cmdStr="mangaDither %s" % (ditherPos),
+                                              keyVars=[], timeLim=timeLim)
     if cmdVar.didFail:
         timeout = 'Timedout=%s'%("Timeout" in cmdVar.lastReply.keywords)
         cmd.error('text=%s'%qstr('Failed to move guider to new dither position: %s'%timeout))
@@ -115,9 +119,9 @@ def main(actor, queues):
                                 (("enabling" if msg.on else "disabling"), msg.what))
 
                 timeLim = 10
-                cmdVar = actorState.actor.cmdr.call(actor="guider", forUserCmd=msg.cmd,
-                                                    cmdStr=("%s %s" % (msg.what, "on" if msg.on else "off")),
-                                                    keyVars=[], timeLim=timeLim)
+                cmdVar = sopActor.myGlobals.timeouts.call(actor="guider", forUserCmd=msg.cmd,
+                                                          cmdStr=("%s %s" % (msg.what, "on" if msg.on else "off")),
+                                                          keyVars=[], timeLim=timeLim)
                 if cmdVar.didFail:
                     msg.cmd.error('text=%s'%qstr("Failed to set guider %s %s."%(msg.what, "on" if msg.on else "off")))
                 msg.replyQueue.put(Msg.DONE, cmd=msg.cmd, success=not cmdVar.didFail)
@@ -139,9 +143,9 @@ def main(actor, queues):
                 timeLim = expTime
                 timeLim += 30
 
-                cmdVar = actorState.actor.cmdr.call(actor="guider", forUserCmd=msg.cmd,
-                                                    cmdStr="flat %s" % (expTimeOpt),
-                                                    keyVars=[], timeLim=timeLim)
+                cmdVar = sopActor.myGlobals.timeouts.call(actor="guider", forUserCmd=msg.cmd,
+                                                          cmdStr="flat %s" % (expTimeOpt),
+                                                          nominal=expTime, keyVars=[], timeLim=timeLim)
                 if cmdVar.didFail:
                     msg.cmd.error('text="Failed to take guider flat"')
                 msg.replyQueue.put(Msg.DONE, cmd=msg.cmd, success=not cmdVar.didFail)
@@ -161,6 +165,6 @@ def main(actor, queues):
             else:
                 raise ValueError, ("Unknown message type %s" % msg.type)
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception, e:
             sopActor.handle_bad_exception(actor,e,threadName,msg)
@@ -0,0 +1,165 @@
+"""
+One heartbeat for all of sop's threads, rather than each saying it's alive.
+
+Every interval seconds we output a single threadHealth keyword, with for
+each queue: its name, its state, the seconds since it last got a message,
+and how many messages are waiting on it. The states are:
+
+* idle:  waiting for a message;
+* busy:  handling one (which may legitimately take a long time, e.g. an exposure);
+* stale: not waiting for messages, but not handling one either, for longer
+  than stale seconds; or handling one for more than stale seconds longer than
+  it was expected to take (see MultiCommand.setMsgDuration): something is wrong.
+  A message with no expected duration (e.g. a whole doBossScience on the
+  master queue) is busy for as long as it takes;
+* dead:  its thread has exited.
+
+A queue's thread "checks in" each time it asks the queue for its next
+message (see Queue.get), which it does at least every actorState.timeout
+seconds. Queues handled by an Executor have no thread of their own, so
+are only stale if a handler hangs, and can't be dead. We warn whenever
+anything is stale or dead.
+
+"status geek" probes the threads too, sending each a STATUS at once and
+timing its reply (see Heartbeat.probe); a thread in the middle of a long
+command is reported as busy rather than holding up or failing the probe.
+"""
+import Queue
+import threading
+import time
+
+from sopActor import Msg
+from sopActor import myGlobals
+
+
+class ProbeReply(object):
+    """Stands in for a probed thread's replyQueue, noting who answered and when."""
+
+    def __init__(self, name, replies):
+        self.name = name
+        self.replies = replies
+
+    def put(self, *args, **kwargs):
+        self.replies.put((self.name, time.time()))
+
+
+class Heartbeat(object):
+    """Output the health of sop's threads every interval seconds."""
+
+    def __init__(self, interval=60, stale=180):
+        self.interval = interval        # seconds between threadHealth keywords
+        self.stale = stale              # seconds without checking in (or overrunning) before a thread is stale
+        self._thread = None
+        self._stop = threading.Event()
+
+    def health(self, actorState, now=None):
+        """Return [(name, state, lastMsgAge, depth)] for each of actorState's queues."""
+        if now is None:
+            now = time.time()
+        health = []
+        for tid, queue in sorted(actorState.queues.items(), key=lambda item: item[1].name):
+            thread = actorState.threads.get(tid)
+            if getattr(queue, 'executor', None) is not None:
+                thread = None           # the executor's workers handle it
+            if thread is not None and not thread.is_alive():
+                state = "dead"
+            elif queue._current is not None:
+                state = "stale" if self._hung(queue._current, now) else "busy"
+            elif thread is not None and queue.checkedIn is not None and now - queue.checkedIn > self.stale:
+                state = "stale"
+            else:
+                state = "idle"
+            age = -1 if queue.lastGot is None else now - queue.lastGot
+            health.append((queue.name, state, age, queue.qsize()))
+        return health
+
+    def _hung(self, msg, now):
+        """Has msg been handled for more than stale seconds longer than it was expected to take?"""
+        getTime = getattr(msg, 'getTime', None)
+        duration = getattr(msg, 'duration', 0)
+        if getTime is None or not duration > 0:
+            return False                # we don't know how long it should take
+        return now - getTime > duration + self.stale
+
+    def report(self, cmd, actorState):
+        """Output threadHealth to cmd, and warn about any threads that have hung or stopped checking in."""
+        health = self.health(actorState)
+        cmd.inform("threadHealth=%s" % ",".join('"%s","%s",%0.1f,%d' % h for h in health))
+        bad = ["%s (%s)" % (name, state) for name, state, age, depth in health
+               if state in ("stale", "dead")]
+        if bad:
+            cmd.warn('text="sop threads hung or not checking in: %s"' % ", ".join(bad))
+
+    def probe(self, cmd, actorState, timeout=5.0):
+        """
+        Send a STATUS to all of actorState's queues at once, and return
+        [(name, state, latency)] as soon as every one has answered, or
+        timeout seconds have passed. The states are:
+
+        * ok:     answered, latency seconds after we asked;
+        * busy:   handling another message, for the last latency seconds;
+        * dead:   its thread has exited, so wasn't asked;
+        * failed: wasn't busy, but didn't answer within timeout seconds.
+
+        A queue that's already busy isn't asked, so as not to leave a STATUS
+        waiting behind e.g. an exposure.
+        """
+        replies = Queue.Queue()
+        probe = {}                      # name: (queue, msg, when sent) for those we asked
+        results = {}
+        start = time.time()
+        for tid, queue in actorState.queues.items():
+            thread = actorState.threads.get(tid)
+            if getattr(queue, 'executor', None) is not None:
+                thread = None
+            elif thread is None:
+                continue                # nobody to answer
+            current = queue._current
+            if thread is not None and not thread.is_alive():
+                results[queue.name] = ("dead", -1)
+            elif current is not None:
+                results[queue.name] = ("busy", start - current.getTime)
+            else:
+                msg = Msg(Msg.STATUS, cmd, replyQueue=ProbeReply(queue.name, replies))
+                probe[queue.name] = (queue, msg, time.time())
+                queue.put(msg)
+
+        deadline = start + timeout
+        while probe:
+            try:
+                name, when = replies.get(timeout=max(0, deadline - time.time()))
+            except Queue.Empty:
+                break
+            if name in probe:
+                queue, msg, sent = probe.pop(name)
+                results[name] = ("ok", when - sent)
+
+        now = time.time()
+        for name, (queue, msg, sent) in probe.items():
+            current = queue._current
+            if current is not None and current is not msg:
+                results[name] = ("busy", now - current.getTime)
+            else:
+                results[name] = ("failed", now - sent)
+
+        return [(name,) + results[name] for name in sorted(results)]
+
+    def start(self, actor):
+        """Start reporting to actor.bcast, unless we already are."""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(actor,), name="heartbeat")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop reporting."""
+        self._stop.set()
+
+    def _run(self, actor):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report(actor.bcast, myGlobals.actorState)
+            except Exception, e:
+                actor.bcast.warn('text="heartbeat failed: %s"' % e)
@@ -0,0 +1,131 @@
+"""
+How long the telescope takes to move between two (az, alt, rot) mount
+positions, and where to send it so that it gets there soonest.
+
+Each axis accelerates at up to its maxAccel to at most its maxVel, and
+decelerates the same way, so a short move never reaches full speed; an axis
+with no maxAccel is taken to reach maxVel at once. The axes
+move at the same time, except that az may not move while alt is below
+altLimit (the same interlock tccThread.below_alt_limit checks): a slew from
+low altitude waits for alt to clear the limit before moving az, and one down
+to low altitude finishes moving az before going below it.
+
+Positions are mount coordinates, which already say which wrap to take, so a
+move is just the difference between them.
+"""
+
+from __future__ import division
+
+import math
+
+# the axes, in the order of tcc's axePos.
+AZ, ALT, ROT = 0, 1, 2
+axisNames = ('az', 'alt', 'rot')
+
+# az may not move below this altitude (degrees).
+altLimit = 18
+
+# seconds to allow a slew when we don't know where the telescope is.
+defaultSlewDuration = 60
+
+
+class Axis(object):
+    """
+    One axis of the mount: how fast (deg/s) and how hard (deg/s^2) it can be
+    driven; maxAccel None if we don't know, to ignore acceleration.
+    """
+
+    def __init__(self, name, maxVel, maxAccel):
+        self.name = name
+        self.maxVel = maxVel
+        self.maxAccel = maxAccel
+
+    def moveTime(self, distance):
+        """Return the seconds it takes to move distance degrees, from rest to rest."""
+        distance = abs(distance)
+        v, a = self.maxVel, self.maxAccel
+        if a is None:
+            return distance/v
+        if distance < v*v/a:
+            # never gets up to full speed.
+            return 2*math.sqrt(distance/a)
+        return distance/v + v/a
+
+    def distanceIn(self, time):
+        """Return how many degrees we can move in time seconds, from rest to rest."""
+        v, a = self.maxVel, self.maxAccel
+        if time <= 0:
+            return 0
+        if a is None:
+            return v*time
+        if time <= 2*v/a:
+            return a*time*time/4
+        return v*(time - v/a)
+
+
+class Mount(object):
+    """The telescope's az, alt and rot Axes, and the altitude below which az can't move."""
+
+    def __init__(self, az, alt, rot, altLimit=altLimit):
+        self.axes = (az, alt, rot)
+        self.altLimit = altLimit
+
+    def slewTime(self, start, target):
+        """Return the seconds it takes to slew from start to target (both (az, alt, rot))."""
+        az, alt, rot = self.axes
+        azTime = az.moveTime(target[AZ] - start[AZ])
+        rotTime = rot.moveTime(target[ROT] - start[ROT])
+        if azTime == 0 or min(start[ALT], target[ALT]) >= self.altLimit:
+            return max(azTime, alt.moveTime(target[ALT] - start[ALT]), rotTime)
+
+        # Up to the limit, move az (while alt carries on, if it's going higher), then down.
+        upTo = max(start[ALT], self.altLimit)
+        downFrom = max(target[ALT], self.altLimit)
+        altTime = (alt.moveTime(upTo - start[ALT]) +
+                   max(azTime, alt.moveTime(downFrom - upTo)) +
+                   alt.moveTime(target[ALT] - downFrom))
+        return max(altTime, rotTime)
+
+    def toward(self, start, target, optional=(ROT,), pacing=None):
+        """
+        Return the position to slew to from start, to reach target on every
+        axis except those in optional, which go only as far toward target as
+        they can in the time the axes in pacing take to get there; if pacing
+        is None, as far as they can without making the slew take any longer.
+        """
+        if pacing is None:
+            required = [target[i] if i not in optional else start[i] for i in range(3)]
+            time = self.slewTime(start, required)
+        else:
+            time = max(self.axes[i].moveTime(target[i] - start[i]) for i in pacing)
+        position = list(target)
+        for i in optional:
+            distance = target[i] - start[i]
+            reach = self.axes[i].distanceIn(time)
+            if reach < abs(distance):
+                position[i] = start[i] + math.copysign(reach, distance)
+        return tuple(position)
+
+
+# A 2.5m's axes, at the alt and rot rates gotoGangChange has always assumed (and
+# az as alt), with acceleration ignored; SopActor sets them from sop.cfg's [mount].
+mount = Mount(Axis('az', 1.5, None), Axis('alt', 1.5, None), Axis('rot', 2.0, None))
+
+
+def position(actorState):
+    """Return the telescope's current (az, alt, rot) from the tcc, or None if it doesn't know."""
+    try:
+        axePos = actorState.models['tcc'].keyVarDict['axePos']
+        pos = tuple(axePos[i] for i in range(3))
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None
+    if None in pos:
+        return None
+    return pos
+
+def slewDuration(actorState, az, alt, rot):
+    """Return how many seconds a slew from where we are now to (az, alt, rot) should take."""
+    start = position(actorState)
+    if start is None or None in (az, alt, rot):
+        return defaultSlewDuration
+    return mount.slewTime(start, (az, alt, rot))
@@ -0,0 +1,96 @@
+"""
+When each lamp last went on or off, remembered across restarts.
+
+The mcp's lamp keywords only tell us when we last heard them, which after a
+sop (or hub) restart, or when the mcp simply repeats itself, is not when the
+lamps changed. So we note each transition, whether we commanded it or saw it
+in the keywords, and judge a lamp's warmup by the earliest time we know it has
+been in its current state since.
+
+Lamps go by their mcp names (ff, hgcd, ne). The journal is a small JSON file
+of {lamp: [on, since]}, rewritten whenever a lamp changes. A lamp switched
+off and on again while sop isn't running can't be noticed, so it is trusted
+as if it had stayed on.
+"""
+import json
+import threading
+import time
+
+from sopActor.utils.jsonFile import save_json
+
+
+class LampJournal(object):
+    """The last transition of each lamp: whether it went on, and when."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saveLock = threading.Lock() # one save at a time: they share the tmp file
+        self.fileName = None            # where we're saved; None to not save
+        self.clear()
+
+    def clear(self):
+        """Forget every transition."""
+        with self._lock:
+            self.lamps = {}             # name: (on, since)
+
+    def load(self, fileName):
+        """Load the transitions from fileName (if it exists), and save there from now on."""
+        lamps = {}
+        try:
+            with open(fileName) as fd:
+                for name, (on, since) in json.load(fd).items():
+                    lamps[str(name)] = (bool(on), float(since))
+        except (IOError, ValueError, TypeError):
+            lamps = {}                  # a missing or damaged file: start afresh
+        with self._lock:
+            self.lamps = lamps
+            self.fileName = fileName
+
+    def save(self):
+        """Write the transitions to our file (atomically, so a crash can't leave half of it)."""
+        if self.fileName is None:
+            return
+        with self._saveLock:
+            with self._lock:
+                data = dict((name, list(state)) for name, state in self.lamps.items())
+            save_json(self.fileName, data)
+
+    def commanded(self, name, on, when=None):
+        """We've just turned lamp name on (or off)."""
+        self._transition(name, on, time.time() if when is None else when)
+
+    def observed(self, name, on, when):
+        """
+        The keywords say lamp name has been on (or off) since when: return
+        (on, the earliest time we know it's been so since).
+        """
+        return on, self._transition(name, on, when)
+
+    def earliest(self, name, on, when):
+        """
+        Return the earliest time we know lamp name has been on (or off) since,
+        if it has been since when; without noting anything.
+        """
+        with self._lock:
+            last = self.lamps.get(name)
+        if last is not None and last[0] == on and last[1] <= when:
+            return last[1]
+        return when
+
+    def _transition(self, name, on, when):
+        """Note that lamp name is on (or off) as of when, and return when it became so."""
+        with self._lock:
+            last = self.lamps.get(name)
+            if last is not None and last[0] == on and last[1] <= when:
+                return last[1]
+            self.lamps[name] = (on, when)
+        try:
+            self.save()
+        except (IOError, OSError):
+            pass                        # we'll try again next time; don't fail the command over it
+        return when
+
+    def since(self, name):
+        """Return (on, since) for lamp name, or None if we've never seen it change."""
+        with self._lock:
+            return self.lamps.get(name)
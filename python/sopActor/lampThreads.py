@@ -9,6 +9,16 @@ from opscore.utility.qstr import qstr
 # don't bother doing anything with these lamps, as they aren't used for anything.
 ignore_lamps = ['uv', 'wht']
 
+# the lamp queues, and what we call their lamps.
+lamps = {sopActor.FF_LAMP: "FF",
+         sopActor.NE_LAMP: "Ne",
+         sopActor.HGCD_LAMP: "HgCd",
+         sopActor.UV_LAMP: "uv",
+         sopActor.WHT_LAMP: "wht"}
+
+# seconds between status outputs while lamps warm up.
+warmupStatusInterval = 5
+
 
 class LampHandler(object):
     def __init__(self, actorState, queue, lampName):
@@ -35,9 +45,14 @@ class LampHandler(object):
 
         # seconds
         timeLim = 0.1 if noWait else 30.0
-        cmdVar = self.actorState.actor.cmdr.call(actor="mcp", forUserCmd=cmd,
-                                                 cmdStr=("%s.%s" % (self.name, action)),
-                                                 timeLim=timeLim)
+        # Not waiting is the point of noWait, so don't let the policy stretch it.
+        call = self.actorState.actor.cmdr.call if noWait else myGlobals.timeouts.call
+        cmdVar = call(actor="mcp", forUserCmd=cmd,
+                      cmdStr=("%s.%s" % (self.name, action)),
+                      timeLim=timeLim)
+        if noWait or not cmdVar.didFail:
+            myGlobals.lampJournal.commanded(self.name, action == "on")
+
         if noWait:
             cmd.warn('text="Not waiting for response from: %s %s"' % (self.lampName, action))
             replyQueue.put(Msg.LAMP_COMPLETE, cmd=cmd, success=True)
@@ -60,7 +75,13 @@ class LampHandler(object):
             replyQueue.put(Msg.LAMP_COMPLETE, cmd=cmd, success=True)
 
     def wait_until(self, cmd, endTime, replyQueue):
-        """Wait until we reach endTime, to allow the lamp to warm up."""
+        """
+        Wait until we reach endTime, to allow the lamp to warm up.
+
+        Rather than blocking this thread, we ask the timers to put another
+        WAIT_UNTIL on our queue when there's next something to say, which
+        is every warmupStatusInterval seconds of time left, or endTime.
+        """
         timeToGo = endTime - time.time()
 
         if timeToGo <= 0:
@@ -69,76 +90,97 @@ class LampHandler(object):
             cmd.warn('text="Aborting warmup for %s lamps"' % (self.lampName))
             replyQueue.put(Msg.LAMP_COMPLETE, cmd=cmd, success=False)
         else:
-            # output status every 5 seconds, unless we're almost done.
-            if timeToGo > 1 and int(timeToGo)%5 == 0:
+            # output status unless we're almost done.
+            if timeToGo > 1:
                 cmd.inform('text="Warming up %s lamps; %ds left"' % (self.lampName, timeToGo))
 
-            time.sleep(1)
-            self.queue.put(Msg.WAIT_UNTIL, cmd=cmd, replyQueue=replyQueue, endTime=endTime)
+            nextLeft = warmupStatusInterval*int((timeToGo - 1e-3)/warmupStatusInterval)
+            msg = Msg(Msg.WAIT_UNTIL, cmd=cmd, replyQueue=replyQueue, endTime=endTime)
+            myGlobals.timers.add(endTime - nextLeft, self.queue, msg)
 #...
 
 
+def handle(actor, lampHandler, msg):
+    """Handle one msg for lampHandler's lamps. Return False if we should exit."""
+
+    threadName = lampHandler.lampName
+    try:
+        if msg.type == Msg.EXIT:
+            if msg.cmd:
+                msg.cmd.inform('text="Exiting thread %s"' % (threading.current_thread().name))
+
+            return False
+        elif msg.type == Msg.LAMP_ON:
+            action = "on" if msg.on else "off"
+            noWait = hasattr(msg, 'noWait')
+            delay = getattr(msg, "delay", None)
+            lampHandler.do_lamp(msg.cmd, action, msg.replyQueue, delay=delay, noWait=noWait)
+
+        elif msg.type == Msg.WAIT_UNTIL:
+            # used to delay while the lamps warm up
+            lampHandler.wait_until(msg.cmd, msg.endTime, msg.replyQueue)
+
+
+        elif msg.type == Msg.STATUS:
+            # ignored lamps have nothing to say, but must still answer (e.g. status geek's probe).
+            if lampHandler.lampName not in ignore_lamps:
+                msg.cmd.inform('text="%s thread"' % threadName)
+            msg.replyQueue.put(Msg.REPLY, cmd=msg.cmd, success=True)
+
+        else:
+            raise ValueError, ("Unknown message type %s" % msg.type)
+    except Exception, e:
+        sopActor.handle_bad_exception(actor, e, threadName, msg)
+    return True
+
 def lamp_main(actor, queue, lampName):
     """Main loop for lamps thread"""
 
     actorState = myGlobals.actorState
     timeout = actorState.timeout
-    threadName = lampName
     lampHandler = LampHandler(actorState, queue, lampName)
 
     while True:
         try:
             msg = queue.get(timeout=timeout)
+        except Queue.Empty:
+            continue                    # queue.get() checked in with the heartbeat
 
-            if msg.type == Msg.EXIT:
-                if msg.cmd:
-                    msg.cmd.inform('text="Exiting thread %s"' % (threading.current_thread().name))
-
-                return
-            elif msg.type == Msg.LAMP_ON:
-                action = "on" if msg.on else "off"
-                noWait = hasattr(msg, 'noWait')
-                delay = getattr(msg, "delay", None)
-                lampHandler.do_lamp(msg.cmd, action, msg.replyQueue, delay=delay, noWait=noWait)
+        if not handle(actor, lampHandler, msg):
+            return
 
-            elif msg.type == Msg.WAIT_UNTIL:
-                # used to delay while the lamps warm up
-                lampHandler.wait_until(msg.cmd, msg.endTime, msg.replyQueue)
+def lamp_handler(actor, queue, lampName):
+    """Return a handler for lampName's messages, for an Executor."""
 
+    lampHandler = LampHandler(myGlobals.actorState, queue, lampName)
+    return lambda msg: handle(actor, lampHandler, msg)
 
-            elif msg.type == Msg.STATUS:
-                if lampName not in ignore_lamps:
-                    msg.cmd.inform('text="%s thread"' % threadName)
-                    msg.replyQueue.put(Msg.REPLY, cmd=msg.cmd, success=True)
+def handler(tid):
+    """Return a function making a handler for the messages on lamp queue tid, for an Executor."""
 
-            else:
-                raise ValueError, ("Unknown message type %s" % msg.type)
-        except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
-        except Exception, e:
-            sopActor.handle_bad_exception(actor, e, threadName, msg)
+    return lambda actor, queues: lamp_handler(actor, queues[tid], lamps[tid])
 
 def ff_main(actor, queues):
     """Main loop for FF lamps thread"""
 
-    lamp_main(actor, queues[sopActor.FF_LAMP], "FF")
+    lamp_main(actor, queues[sopActor.FF_LAMP], lamps[sopActor.FF_LAMP])
 
 def ne_main(actor, queues):
     """Main loop for Ne lamps thread"""
 
-    lamp_main(actor, queues[sopActor.NE_LAMP], "Ne")
+    lamp_main(actor, queues[sopActor.NE_LAMP], lamps[sopActor.NE_LAMP])
 
 def hgcd_main(actor, queues):
     """Main loop for HgCd lamps thread"""
 
-    lamp_main(actor, queues[sopActor.HGCD_LAMP], "HgCd")
+    lamp_main(actor, queues[sopActor.HGCD_LAMP], lamps[sopActor.HGCD_LAMP])
 
 def uv_main(actor, queues):
     """Main loop for UV lamps thread"""
 
-    lamp_main(actor, queues[sopActor.UV_LAMP], "uv")
+    lamp_main(actor, queues[sopActor.UV_LAMP], lamps[sopActor.UV_LAMP])
 
 def wht_main(actor, queues):
     """Main loop for WHT lamps thread"""
 
-    lamp_main(actor, queues[sopActor.WHT_LAMP], "wht")
+    lamp_main(actor, queues[sopActor.WHT_LAMP], lamps[sopActor.WHT_LAMP])
@@ -7,8 +7,11 @@ from sopActor import Msg
 from sopActor import Queue as SopQueue # used to get to the reply queue?
 import sopActor
 import sopActor.myGlobals as myGlobals
+from sopActor import kinematics
+from sopActor import CmdState
 # from opscore.utility.qstr import qstr
 from sopActor.multiCommand import Precondition, MultiCommand
+from sopActor.utils.calls import call_async
 
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
@@ -21,8 +24,9 @@ class SopPrecondition(Precondition):
 
     def __init__(self, queueName, msgId=None, timeout=None, **kwargs):
         Precondition.__init__(self, queueName, msgId, timeout, **kwargs)
+        self.delay = None               # how long the lamps still need to warm up, as of required()
 
-    def required(self):
+    def required(self, state=None):
         """
         If the system is not in the desired state, return True, otherwise False.
 
@@ -30,12 +34,18 @@ class SopPrecondition(Precondition):
         command to get the system into the desired state.
         Also accounts for lamp warm-up time, so if the lamp was turned on
         and enough time has passed, it is ok, but if not, require (the full time).
+
+        All the state is taken from a single instrumentState snapshot: state,
+        if given, otherwise the current one.
         """
 
+        state = self._state(state)
+        self.delay = None
+
         if hasattr(myGlobals, 'warmupTime') and self.queueName in myGlobals.warmupTime.keys():
             assert self.msgId == Msg.LAMP_ON
 
-            isOn, timeSinceTransition = self.lampIsOn(self.queueName)
+            isOn, timeSinceTransition = self.lampIsOn(self.queueName, state)
             # we want to turn them on
             if self.kwargs.get('on'):
                 # we want the time since turn on
@@ -46,7 +56,7 @@ class SopPrecondition(Precondition):
                 delay = warmupTime - timeSinceTransition
                 if delay > 0:
                     isOn = False
-                    self.kwargs["delay"] = self.kwargs["duration"] = int(delay)
+                    self.delay = int(delay)
                 # operation is required if they are not warmed up
                 if not isOn:
                     return True
@@ -59,100 +69,88 @@ class SopPrecondition(Precondition):
             # we want to open them
             if self.kwargs.get('open'):
                 # operation is required if they are not already open
-                return not self.ffsAreOpen()
+                return not self.ffsAreOpen(state)
             else:
                 # operation is required if they are currently open
-                return self.ffsAreOpen()
+                return self.ffsAreOpen(state)
 
         elif self.queueName == sopActor.APOGEE and self.msgId == Msg.APOGEE_SHUTTER:
             # move if we are not where we want to be.
-            return self.apogeeShutterIsOpen() != self.kwargs.get('open')
+            return self.apogeeShutterIsOpen(state) != self.kwargs.get('open')
         elif self.queueName == sopActor.GUIDER:
             if self.msgId == Msg.DECENTER:
                 # We have to turn on if decentering is off, and vice versa.
                 if self.kwargs.get('on'):
-                    return not self.isDecentered()
+                    return not self.isDecentered(state)
                 else:
-                    return self.isDecentered()
+                    return self.isDecentered(state)
             elif self.msgId == Msg.MANGA_DITHER:
                 dither = self.kwargs.get('dither')
-                return not self.atCorrectMangaDither(dither)
+                return not self.atCorrectMangaDither(dither, state)
 
         return True
+
+    def msgKwargs(self):
+        """Return the data for the Msg to send, including any lamp warmup delay required() found."""
+        if self.delay is None:
+            return self.kwargs
+        kwargs = dict(self.kwargs)
+        kwargs["delay"] = kwargs["duration"] = self.delay
+        return kwargs
     #
     # Commands to get state from e.g. the MCP
     #
-    def ffsAreOpen(self):
+    def _state(self, state):
+        """Return state, or a fresh snapshot of the instrument state if it's None."""
+        return state if state is not None else myGlobals.actorState.instrumentState.snapshot()
+
+    def ffsAreOpen(self, state=None):
         """
         Return True if flat field petals are open,
         False if they are closed, and None if indeterminate.
         """
-        ffsStatus = myGlobals.actorState.models["mcp"].keyVarDict["ffsStatus"]
+        ffs = self._state(state).ffs
+        if ffs is None:
+            raise RuntimeError("Unable to read FFS status")
 
-        open, closed = 0, 0
-        for s in ffsStatus:
-            if s == None:
-                raise RuntimeError("Unable to read FFS status")
-
-            open += int(s[0])
-            closed += int(s[1])
-
-        if open == 8:
+        if ffs == 'open':
             return True
-        elif closed == 8:
+        elif ffs == 'closed':
             return False
         else:
             return None
 
-    def apogeeShutterIsOpen(self):
+    def apogeeShutterIsOpen(self, state=None):
         """Return True if APOGEE shutter is open; False if closed, and None if indeterminate"""
+        return self._state(state).apogeeShutter
 
-        shutterStatus = myGlobals.actorState.models["apogee"].keyVarDict["shutterLimitSwitch"]
-
-        if shutterStatus[0] and not shutterStatus[1]:
-            return True
-        elif shutterStatus[1] and not shutterStatus[0]:
-            return False
-        return None
-
-    def lampIsOn(self, queueName):
+    def lampIsOn(self, queueName, state=None):
         """
         Return (True iff some lamps are on, timeSinceTransition)
         The transition time can be used to determine if a lamp has been on long enough.
         """
 
-        if queueName == sopActor.FF_LAMP:
-            status = myGlobals.actorState.models["mcp"].keyVarDict["ffLamp"]
-        elif queueName == sopActor.HGCD_LAMP:
-            status = myGlobals.actorState.models["mcp"].keyVarDict["hgCdLamp"]
-        elif queueName == sopActor.NE_LAMP:
-            status = myGlobals.actorState.models["mcp"].keyVarDict["neLamp"]
-        elif queueName == sopActor.UV_LAMP:
-            return myGlobals.actorState.models["mcp"].keyVarDict["uvLampCommandedOn"][0], 0
-        elif queueName == sopActor.WHT_LAMP:
-            return myGlobals.actorState.models["mcp"].keyVarDict["whtLampCommandedOn"][0], 0
-        else:
+        try:
+            status = self._state(state).lamp(queueName)
+        except KeyError:
             print("Unknown lamp queue %s" % queueName)
             return False, 0
 
-        if status == None:
+        if status is None:
             raise RuntimeError("Unable to read %s lamp status" % queueName)
 
-        on = 0
-        for i in status:
-            on += i
+        isOn, since = status
+        if queueName in (sopActor.UV_LAMP, sopActor.WHT_LAMP):
+            return isOn, 0
+        return isOn, (time.time() - since)
 
-        return (True if on == 4 else False), (time.time() - status.timestamp)
-
-    def isDecentered(self):
+    def isDecentered(self, state=None):
         """Return true if the guider currently has decenter mode active."""
-        decenter = myGlobals.actorState.models["guider"].keyVarDict["decenter"]
-        return decenter[1]
+        return self._state(state).decentered
 
-    def atCorrectMangaDither(self,newDither):
+    def atCorrectMangaDither(self, newDither, state=None):
         """Return true if the guider currently is at the correct mangaDither position."""
-        dither = myGlobals.actorState.models["guider"].keyVarDict["mangaDither"][0]
-        return newDither == dither
+        return newDither == self._state(state).mangaDither
 
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
 
@@ -164,19 +162,47 @@ hartmannDuration = 240                  # take a Hartmann sequence and move the
 readoutDuration = 90                    # read the BOSS chips
 guiderDecenterDuration = 30             # Applying decenters could take as long as the longest reasonable guider exposure
 
+expectedPercentile = 50                 # of the learned durations, to expect
+
 class SopMultiCommand(MultiCommand):
     """A MultiCommand for sop that knows about how long sop commands take to execute"""
 
+    batchPreconditions = True
+
     def __init__(self, cmd, timeout, label, *args, **kwargs):
         MultiCommand.__init__(self, cmd, timeout, label, *args, **kwargs)
 
-    # NOTE: TBD: The durations here need to be expanded to incorporate all the
-    # various other cases, and then we need a way to output it and have an
-    # internal countdown timer to make it actually useful.
+    def snapshot(self):
+        """Judge all our preconditions by the same view of the instrument."""
+        return myGlobals.actorState.instrumentState.snapshot()
+
+    def getMsgTimeout(self, queue, msg):
+        """
+        Allow what the timeout policy says, once it's seen enough of msg; else the usual.
+        Slews we can't estimate (e.g. to a field's ra, dec) vary too much to learn from.
+        """
+        timeout = MultiCommand.getMsgTimeout(self, queue, msg)
+        if msg.type == Msg.SLEW and getattr(msg, 'nominal', None) is None:
+            return timeout
+        return myGlobals.timeouts.msgTimeout(queue, msg, timeout)
+
     def setMsgDuration(self, queueName, msg):
-        """Set msg's expected duration in seconds"""
+        """
+        Set msg's expected duration in seconds: how long the axes take, for
+        a slew to a mount position (which is also its nominal time, so we learn
+        its overhead beyond that); otherwise the median of what it's taken
+        before, if we've learned that, otherwise our best guess.
+        """
+
+        if msg.type == Msg.SLEW and getattr(msg, 'az', None) is not None:
+            msg.duration = msg.nominal = kinematics.slewDuration(msg.actorState, msg.az, msg.alt, msg.rot)
+            return
 
-        if msg.type == Msg.FFS_MOVE:
+        duration = myGlobals.durations.percentile(myGlobals.actorState.queues[queueName], msg,
+                                                  expectedPercentile)
+        if duration is not None:
+            msg.duration = duration
+        elif msg.type == Msg.FFS_MOVE:
             msg.duration = ffsDuration
         elif msg.type == Msg.EXPOSE:
             msg.duration = 0
@@ -216,8 +242,8 @@ def doLamps(cmd, actorState, FF=False, Ne=False, HgCd=False, WHT=False, UV=False
     # There's no Hartmann thread, so just open them synchronously for now.  This should be rare.
     #
     if openHartmann is not None:
-        cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=cmd,
-                                            cmdStr=("hartmann out"), keyVars=[], timeLim=actorState.timeout)
+        cmdVar = myGlobals.timeouts.call(actor="boss", forUserCmd=cmd,
+                                         cmdStr=("hartmann out"), keyVars=[], timeLim=actorState.timeout)
 
         if cmdVar.didFail:
             cmd.warn('text="Failed to take Hartmann mask out"')
@@ -225,12 +251,38 @@ def doLamps(cmd, actorState, FF=False, Ne=False, HgCd=False, WHT=False, UV=False
 
     return multiCmd.run()
 
+def move_collimators(cmd, spN, moved, move=None, timeout=60, failMsg="Failed to move collimator for %s"):
+    """
+    Move the collimators of all the spectrographs in spN at once, each by
+    move, or back to where it started if move is None; moved[sp] is how far
+    sp's collimator has moved so far, and is updated for those that move.
+    Wait for all the moves to finish, even if some fail; return True if they all succeeded.
+    """
+    moves = [(sp, -moved[sp] if move is None else move) for sp in spN]
+    futures = [call_async(actor="boss", forUserCmd=cmd,
+                          cmdStr=("moveColl spec=%s a=%d b=%d c=%d" % (sp, dA, dA, -dA)),
+                          keyVars=[], timeLim=timeout) for sp, dA in moves]
+    success = True
+    for (sp, dA), future in zip(moves, futures):
+        if future.didFail:              # waits for future to finish
+            cmd.warn('text="%s"' % (failMsg % sp))
+            success = False
+        else:
+            moved[sp] += dA
+    return success
+
 #
 # Helpers for dealing with lamps and FFS
 #
 
 # TBD: It'd be nice to have a way to unify the precondition and non-precondition
 # calls. I previously tried to be clever with *args/**kwargs, but to no avail.
+#
+# Each helper returns the queues it appended to, so that a command can state
+# which of those preconditions it actually dependsOn.
+
+lampQueues = (sopActor.WHT_LAMP, sopActor.UV_LAMP, sopActor.FF_LAMP, sopActor.HGCD_LAMP, sopActor.NE_LAMP)
+arcLamps = (sopActor.HGCD_LAMP, sopActor.NE_LAMP)
 
 def prep_for_science(multiCmd,precondition=False):
     """Prepare for science exposure, by making sure lamps off and FFS open."""
@@ -238,7 +290,7 @@ def prep_for_science(multiCmd,precondition=False):
         multiCmd.append(SopPrecondition(sopActor.FFS, Msg.FFS_MOVE, open=True))
     else:
         multiCmd.append(sopActor.FFS, Msg.FFS_MOVE, open=True)
-    prep_lamps_off(multiCmd,precondition)
+    return (sopActor.FFS,) + prep_lamps_off(multiCmd,precondition)
 
 def prep_lamps_off(multiCmd,precondition=False):
     """Prepare for something needing darkness, by turning off all lamps."""
@@ -254,9 +306,13 @@ def prep_lamps_off(multiCmd,precondition=False):
         multiCmd.append(sopActor.FF_LAMP  , Msg.LAMP_ON,  on=False)
         multiCmd.append(sopActor.HGCD_LAMP, Msg.LAMP_ON,  on=False)
         multiCmd.append(sopActor.NE_LAMP  , Msg.LAMP_ON,  on=False)
+    return lampQueues
 
-def prep_for_arc(multiCmd,precondition=False):
-    """Prepare for an arc/hartmann, by closing the FFS and turning on arc lamps."""
+def prep_for_arc(multiCmd,precondition=False,warm=()):
+    """
+    Prepare for an arc/hartmann, by closing the FFS and turning on arc lamps.
+    The lamps in warm were already turned on to warm up, so don't command them again.
+    """
     if precondition:
         multiCmd.append(SopPrecondition(sopActor.FFS      , Msg.FFS_MOVE, open=False))
         multiCmd.append(SopPrecondition(sopActor.WHT_LAMP , Msg.LAMP_ON, on=False))
@@ -269,8 +325,28 @@ def prep_for_arc(multiCmd,precondition=False):
         multiCmd.append(sopActor.WHT_LAMP , Msg.LAMP_ON, on=False)
         multiCmd.append(sopActor.UV_LAMP  , Msg.LAMP_ON, on=False)
         multiCmd.append(sopActor.FF_LAMP  , Msg.LAMP_ON, on=False)
-        multiCmd.append(sopActor.HGCD_LAMP, Msg.LAMP_ON, on=True)
-        multiCmd.append(sopActor.NE_LAMP  , Msg.LAMP_ON, on=True)
+        for lamp in arcLamps:
+            if lamp not in warm:
+                multiCmd.append(lamp, Msg.LAMP_ON, on=True)
+    return (sopActor.FFS,) + lampQueues
+
+def run_warming_arcs(cmd, actorState, multiCmd):
+    """
+    Run multiCmd, turning the arc lamps on to warm up for a later arc while it
+    runs. They get a MultiCommand of their own, so that if they fail it isn't
+    multiCmd that fails, but the arc, if they still won't turn on for it.
+    Return (multiCmd's status, the arc lamps that are warming up).
+    """
+    multiCmd.start()
+    warmup = SopMultiCommand(cmd, actorState.timeout, None)
+    for lamp in arcLamps:
+        warmup.append(lamp, Msg.LAMP_ON, on=True)
+    if warmup.run():
+        warm = arcLamps
+    else:
+        cmd.warn('text="Failed to start warming up the arc lamps; will turn them on for the arcs"')
+        warm = ()
+    return multiCmd.finish(), warm
 
 def prep_quick_hartmann(multiCmd):
     """Prepare for quick Hartmanns, which don't need the HgCd lamps fully warm."""
@@ -280,33 +356,41 @@ def prep_quick_hartmann(multiCmd):
     multiCmd.append(SopPrecondition(sopActor.FF_LAMP  , Msg.LAMP_ON, on=False))
     multiCmd.append(sopActor.HGCD_LAMP, Msg.LAMP_ON, on=True) # intentional!
     multiCmd.append(SopPrecondition(sopActor.NE_LAMP  , Msg.LAMP_ON, on=True))
+    return (sopActor.FFS,) + lampQueues
 
-def prep_for_flat(multiCmd,precondition=False):
+def prep_for_flat(multiCmd,precondition=False,warm=()):
     """Prepare for a flat, by closing the FFS and turning on flat lamps."""
     if precondition:
         multiCmd.append(SopPrecondition(sopActor.FFS, Msg.FFS_MOVE, open=False))
     else:
         multiCmd.append(sopActor.FFS, Msg.FFS_MOVE, open=False)
-    prep_lamps_for_flat(multiCmd,precondition)
+    return (sopActor.FFS,) + prep_lamps_for_flat(multiCmd,precondition,warm)
 
-def prep_lamps_for_flat(multiCmd,precondition=False):
-    """Prepare for a flat by turning the flat lamps on, and the others off."""
+def prep_lamps_for_flat(multiCmd,precondition=False,warm=()):
+    """
+    Prepare for a flat by turning the flat lamps on, and the others off,
+    except for the arc lamps in warm, which are warming up for a later arc.
+    """
     if precondition:
         multiCmd.append(SopPrecondition(sopActor.WHT_LAMP , Msg.LAMP_ON, on=False))
         multiCmd.append(SopPrecondition(sopActor.UV_LAMP  , Msg.LAMP_ON, on=False))
         multiCmd.append(SopPrecondition(sopActor.FF_LAMP  , Msg.LAMP_ON, on=True))
-        multiCmd.append(SopPrecondition(sopActor.HGCD_LAMP, Msg.LAMP_ON, on=False))
-        multiCmd.append(SopPrecondition(sopActor.NE_LAMP  , Msg.LAMP_ON, on=False))
+        for lamp in arcLamps:
+            if lamp not in warm:
+                multiCmd.append(SopPrecondition(lamp, Msg.LAMP_ON, on=False))
     else:
         multiCmd.append(sopActor.WHT_LAMP , Msg.LAMP_ON, on=False)
         multiCmd.append(sopActor.UV_LAMP  , Msg.LAMP_ON, on=False)
         multiCmd.append(sopActor.FF_LAMP  , Msg.LAMP_ON, on=True)
-        multiCmd.append(sopActor.HGCD_LAMP, Msg.LAMP_ON, on=False)
-        multiCmd.append(sopActor.NE_LAMP  , Msg.LAMP_ON, on=False)
+        for lamp in arcLamps:
+            if lamp not in warm:
+                multiCmd.append(lamp, Msg.LAMP_ON, on=False)
+    return lampQueues
 
 def prep_apogee_shutter(multiCmd,open=True):
     """Open or close the APOGEE shutter, as a precondition."""
     multiCmd.append(SopPrecondition(sopActor.APOGEE, Msg.APOGEE_SHUTTER, open=open))
+    return (sopActor.APOGEE,)
 
 def prep_guider_decenter_on(multiCmd):
     """Prepare for MaNGA dithers by activating decentered guiding.
@@ -316,6 +400,7 @@ def prep_guider_decenter_on(multiCmd):
     Command: guider decenter on
     """
     multiCmd.append(SopPrecondition(sopActor.GUIDER, Msg.DECENTER, on=True))
+    return (sopActor.GUIDER,)
 
 def prep_guider_decenter_off(multiCmd):
     """Prepare for on-center guiding by de-activating decentered guiding.
@@ -325,6 +410,7 @@ def prep_guider_decenter_off(multiCmd):
     Command: guider decenter off
     """
     multiCmd.append(SopPrecondition(sopActor.GUIDER, Msg.DECENTER, on=False))
+    return (sopActor.GUIDER,)
 
 def prep_manga_dither(multiCmd, dither='C', precondition=False):
     """Prepare for MaNGA exposures by dithering the guider.
@@ -340,6 +426,7 @@ def prep_manga_dither(multiCmd, dither='C', precondition=False):
         multiCmd.append(SopPrecondition(sopActor.GUIDER, Msg.MANGA_DITHER, dither=dither, timeout=guiderDecenterDuration))
     else:
         multiCmd.append(sopActor.GUIDER, Msg.MANGA_DITHER, dither=dither, timeout=guiderDecenterDuration)
+    return (sopActor.GUIDER,)
 
 def close_apogee_shutter_if_gang_on_cart(cmd, cmdState, actorState, stageName):
     """
@@ -416,6 +503,33 @@ def update_exp_counts(cmdState,expType):
         return False
     return True
 
+def warm_arcs_during(cmdState, step):
+    """
+    Return True if a doBossCalibs should start warming up the arc lamps with
+    step ('readout': the pending readout of the last exposure; 'expose': the
+    next exposure), so that they are warm by its first arc.
+
+    The arc lamps may be on during flats and their readouts, but never during
+    biases or darks: we start them as late as still gives them their full
+    warmup, or as early as that allows, if nothing does.
+    """
+    nFlat = cmdState.nFlat - cmdState.nFlatDone
+    if (cmdState.nArcDone >= cmdState.nArc or nFlat <= 0 or
+        cmdState.nBiasDone < cmdState.nBias or cmdState.nDarkDone < cmdState.nDark):
+        return False
+
+    if cmdState.flatTime > 0:
+        expose, readout = flushDuration + cmdState.flatTime, readoutDuration
+    else:
+        expose, readout = cmdState.guiderFlatTime + guiderReadoutDuration, 0
+    # how long until the first arc, if we wait until after this step.
+    if step == 'readout':
+        left = nFlat*(expose + readout)
+    else:
+        left = readout + (nFlat - 1)*(expose + readout)
+    warmupTime = max(getattr(myGlobals, 'warmupTime', {}).get(lamp, 0) for lamp in arcLamps)
+    return left < warmupTime
+
 def is_gang_at_cart(cmd, cmdState, actorState):
     """Fail, and return False if the gang is not at the cart, else return True."""
     if not actorState.apogeeGang.atCartridge():
@@ -471,8 +585,10 @@ def guider_flat(cmd, cmdState, actorState, stageName, apogeeShutter=False):
     multiCmd = SopMultiCommand(cmd, actorState.timeout + guiderDelay, '.'.join((cmdState.name+stageName,'.guiderFlat')))
     if apogeeShutter:
         prep_apogee_shutter(multiCmd,open=False)
-    prep_for_flat(multiCmd,precondition=True)
-    multiCmd.append(sopActor.GUIDER, Msg.EXPOSE,expTime=cmdState.guiderFlatTime, expType="flat")
+    flatQueues = prep_for_flat(multiCmd,precondition=True)
+    # the guider doesn't care about the APOGEE shutter.
+    multiCmd.append(sopActor.GUIDER, Msg.EXPOSE,expTime=cmdState.guiderFlatTime, expType="flat",
+                    dependsOn=flatQueues)
     if not handle_multiCmd(multiCmd,cmd,cmdState,stageName,"Failed to take a guider flat"):
         return False
     show_status(cmdState.cmd, cmdState, actorState.actor, oneCommand=cmdState.name)
@@ -490,9 +606,9 @@ def do_lco_lamp(cmd, actorState, mode, timeout=15):
         cmd.debug('text="FF lamps already in commanded state."')
         return True
 
-    cmdVar = actorState.actor.cmdr.call(actor='tcc', forUserCmd=cmd,
-                                        cmdStr='lamp {0}'.format(modeStr),
-                                        timeLim=timeout)
+    cmdVar = myGlobals.timeouts.call(actor='tcc', forUserCmd=cmd,
+                                     cmdStr='lamp {0}'.format(modeStr),
+                                     timeLim=timeout)
     if cmdVar.didFail:
         return False
 
@@ -799,18 +915,19 @@ def do_one_apogeemanga_dither(cmd, cmdState, actorState):
     if readout:
         duration += readoutDuration
     multiCmd = SopMultiCommand(cmd, duration, cmdState.name+".expose")
-    multiCmd.append(sopActor.BOSS, Msg.EXPOSE,
+    scienceQueues = prep_for_science(multiCmd, precondition=True)
+    prep_apogee_shutter(multiCmd,open=True)
+    scienceQueues += prep_manga_dither(multiCmd, dither=mangaDither, precondition=True)
+    # BOSS needn't wait for the APOGEE shutter.
+    multiCmd.append(sopActor.BOSS, Msg.EXPOSE, dependsOn=scienceQueues,
                     expTime=mangaExpTime, expType="science", readout=readout)
     multiCmd.append(sopActor.APOGEE, Msg.APOGEE_DITHER_SET,
                     expTime=apogeeExpTime,dithers=apogeeDithers,
                     expType="object", comment=cmdState.comment)
     if cmdState.apogee_long:
-        multiCmd.append(sopActor.BOSS, Msg.EXPOSE,
+        multiCmd.append(sopActor.BOSS, Msg.EXPOSE, dependsOn=scienceQueues,
                         expTime=mangaExpTime, expType='science',
                         readout=readout)
-    prep_for_science(multiCmd, precondition=True)
-    prep_apogee_shutter(multiCmd,open=True)
-    prep_manga_dither(multiCmd, dither=mangaDither, precondition=True)
 
     cmdState.setStageState(stageName, 'running')
     return multiCmd.run()
@@ -905,6 +1022,7 @@ def do_boss_calibs(cmd, cmdState, actorState):
 
     ffsInitiallyOpen = SopPrecondition(None).ffsAreOpen()
     pendingReadout = False
+    warm = ()               # the arc lamps we've turned on early, to warm up for the arcs
     finishMsg = "Your calibration data are ready."
     failMsg = ""            # message to use if we've failed
 
@@ -935,15 +1053,22 @@ def do_boss_calibs(cmd, cmdState, actorState):
                                         cmdState.name+".pendingReadout")
             multiCmd.append(sopActor.BOSS, Msg.EXPOSE, expTime=-1, readout=True)
             pendingReadout = False
+            warmNow = not warm and warm_arcs_during(cmdState, 'readout')
+            if warmNow:
+                warm = arcLamps     # so that the prep leaves them alone
             if expType == "arc":
-                prep_for_arc(multiCmd)
+                prep_for_arc(multiCmd, warm=warm)
             elif expType == "flat":
-                prep_for_flat(multiCmd)
+                prep_for_flat(multiCmd, warm=warm)
             else:
                 failMsg = "Impossible condition: exposure type is not arc or flat!"
                 break
 
-            if not multiCmd.run():
+            if warmNow:
+                success, warm = run_warming_arcs(cmd, actorState, multiCmd)
+            else:
+                success = multiCmd.run()
+            if not success:
                 failMsg = "Failed to prepare for %s" % expType
                 break
 
@@ -959,6 +1084,7 @@ def do_boss_calibs(cmd, cmdState, actorState):
             timeout += myGlobals.warmupTime[sopActor.HGCD_LAMP]
 
         multiCmd = SopMultiCommand(cmd, timeout, cmdState.name+'.expose')
+        warmNow = False
 
         if expType in ("bias", "dark"):
             pendingReadout = False
@@ -974,19 +1100,27 @@ def do_boss_calibs(cmd, cmdState, actorState):
                 cmd.inform('text="Taking a %gs guider flat exposure"' % (cmdState.guiderFlatTime))
                 multiCmd.append(sopActor.GUIDER, Msg.EXPOSE,
                                 expTime=cmdState.guiderFlatTime, expType="flat")
-            prep_for_flat(multiCmd,precondition=True)
+            warmNow = not warm and warm_arcs_during(cmdState, 'expose')
+            if warmNow:
+                warm = arcLamps
+            prep_for_flat(multiCmd,precondition=True,warm=warm)
         elif expType == "arc":
             pendingReadout = True
             multiCmd.append(sopActor.BOSS, Msg.EXPOSE,
                             expTime=expTime, expType=expType, readout=False)
             prep_for_arc(multiCmd,precondition=True)
+            warm = ()       # from here on, the arc lamps are simply on.
         else:
             failMsg = "Impossible condition: unknown exposure type when setting up for next exposure!"
             break
 
         cmd.inform('text="Taking %s %s exposure"' %
                     (("an" if expType[0] in ("a", "e", "i", "o", "u") else "a"), expType))
-        if not multiCmd.run():
+        if warmNow:
+            success, warm = run_warming_arcs(cmd, actorState, multiCmd)
+        else:
+            success = multiCmd.run()
+        if not success:
             failMsg = "Failed to take %s exposure" % expType
             break
 
@@ -1030,6 +1164,7 @@ def start_slew(cmd, cmdState, actorState, slewTimeout, location='APO'):
 
     multiCmd = SopMultiCommand(cmd, slewTimeout + actorState.timeout, cmdState.name + '.slew')
 
+    ffScreen = False
     if location == 'APO':
         # At LCO, we don't do axis init.
         # start with an axis init
@@ -1046,9 +1181,11 @@ def start_slew(cmd, cmdState, actorState, slewTimeout, location='APO'):
     if ffScreen:
         cmdState.setStageState('screen', 'running')
 
+    # Lamps can warm up while we slew.
     multiCmd.append(sopActor.TCC, Msg.SLEW, actorState=actorState,
                     ra=cmdState.ra, dec=cmdState.dec, rot=cmdState.rotang,
-                    keepOffsets=cmdState.keepOffsets, ffScreen=ffScreen)
+                    keepOffsets=cmdState.keepOffsets, ffScreen=ffScreen,
+                    dependsOn=(sopActor.TCC, sopActor.FFS, sopActor.APOGEE))
 
     return multiCmd
 
@@ -1061,14 +1198,16 @@ def _run_slew(cmd, cmdState, actorState, multiCmd):
     else:
         failMsg = 'Failed to slew to field.'
 
+    # Only LCO has a separate screen stage.
+    doScreen = getattr(cmdState, 'doScreen', False)
     if not multiCmd.run():
         cmdState.setStageState('slew', 'failed')
-        if cmdState.doScreen:
+        if doScreen:
             cmdState.setStageState('screen', 'failed')
         return fail_command(cmd, cmdState, 'slew', failMsg)
     else:
         cmdState.setStageState('slew', 'done')
-        if cmdState.doScreen:
+        if doScreen:
             cmdState.setStageState('screen', 'done')
         return True
 
@@ -1381,9 +1520,9 @@ def do_apogee_sky_flats(cmd, cmdState, actorState):
 
     # NOTE: I don't like using raw call()s here, but it's probably not worth
     # creating a tccThread Msg just for this arc offset.
-    cmdVar = actorState.actor.cmdr.call(actor="tcc", forUserCmd=cmd,
-                                        cmdStr="offset arc 0.01,0.0",
-                                        timeLim=actorState.timeout)
+    cmdVar = myGlobals.timeouts.call(actor="tcc", forUserCmd=cmd,
+                                     cmdStr="offset arc 0.01,0.0",
+                                     timeLim=actorState.timeout)
     if cmdVar.didFail:
         if myGlobals.bypass.get(name='axes'):
             cmd.warn("text='Failed to make tcc offset for sky flats, but axes bypass is set.'")
@@ -1471,11 +1610,12 @@ def collimate_boss(cmd,cmdState,actorState):
     finish_command(cmd, cmdState, actorState, finishMsg)
 
 def show_status(cmd, cmdState, actor, oneCommand=""):
-    """Output status of a new state or just one command."""
+    """Output status of a new state or just one command (only what's changed, if incremental)."""
     if cmd:
         cmdSet = 'SopCmd_{0}'.format(actor.location.upper())
         actor.commandSets[cmdSet].status(cmd, threads=False, finish=False,
-                                         oneCommand=oneCommand)
+                                         oneCommand=oneCommand,
+                                         changedOnly=CmdState.incremental)
 
 # Define the command that we use to communicate our state to e.g. STUI
 def main(actor, queues):
@@ -1559,59 +1699,38 @@ def main(actor, queues):
                     continue
 
                 success = True          # let's be optimistic
-                moved = 0
+                moved = dict((sp, 0) for sp in spN)
                 for i in range(nStep + 1):  # +1: final large move to get back to where we started
                     expose = True
                     if i == 0:
                         move = nTick*(nStep//2)
                     elif i == nStep:
-                        move = -moved
+                        move = None         # back to where we started
                         expose = False
                     else:
                         move = -nTick
 
-                    dA = dB = move
-                    dC = -dA
-
-                    for sp in spN:
-                        cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=cmd,
-                                                            cmdStr=("moveColl spec=%s a=%d b=%d c=%d" % (sp, dA, dB, dC)),
-                                                            keyVars=[], timeLim=timeout)
-
-                        if cmdVar.didFail:
-                            cmd.warn('text="Failed to move collimator for %s"' % sp)
-                            success = False
-                            break
-
-                    if not success:
+                    # move all the spectrographs' collimators at once.
+                    if not move_collimators(cmd, spN, moved, move, timeout=timeout):
+                        success = False
                         break
 
-                    moved += move
-                    cmd.inform('text="After %dth collimator move: at %d"' % (i, moved))
+                    cmd.inform('text="After %dth collimator move: at %d"' % (i, moved[spN[0]]))
 
                     if expose:
                         if False:
                             cmd.inform('text="XXXXX Not taking a %gs exposure"' % expTime)
                         else:
-                            cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=cmd,
-                                                                cmdStr=("exposure %s itime=%g" % ("flat", expTime)),
-                                                                keyVars=[], timeLim=expTime + overhead)
+                            cmdVar = myGlobals.timeouts.call(actor="boss", forUserCmd=cmd,
+                                                             cmdStr=("exposure %s itime=%g" % ("flat", expTime)),
+                                                             nominal=expTime, keyVars=[], timeLim=expTime + overhead)
 
                             if cmdVar.didFail:
                                 cmd.warn('text="Failed to take %gs exposure"' % expTime)
                                 cmd.warn('text="Moving collimators back to initial positions"')
 
-                                dA = dB = -moved
-                                dC = -dA
-
-                                for sp in spN:
-                                    cmdVar = actorState.actor.cmdr.call(actor="boss", forUserCmd=cmd,
-                                                                        cmdStr=("moveColl spec=%s a=%d b=%d c=%d" % (sp, dA, dB, dC)),
-                                                                        keyVars=[], timeLim=timeout)
-
-                                    if cmdVar.didFail:
-                                        cmd.warn('text="Failed to move collimator for %s back to initial position"' % sp)
-                                        break
+                                move_collimators(cmd, spN, moved, timeout=timeout,
+                                                 failMsg="Failed to move collimator for %s back to initial position")
 
                                 success = False
                                 break
@@ -1632,6 +1751,6 @@ def main(actor, queues):
             else:
                 raise ValueError("Unknown message type %s" % (msg.type))
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception as e:
             sopActor.handle_bad_exception(actor,e,threadName,msg)
@@ -2,15 +2,16 @@
 System for handling multiple commands in sequence or in parallel.
 """
 
+import heapq
 import time
-import re
 
 from sopActor import Queue, Msg, myGlobals
 
 class Precondition(object):
     """
     A class to capture a precondition for a MultiCommand; we require
-    that it be satisfied before the non-Precondition actions are begun
+    that it be satisfied before the non-Precondition actions that depend
+    on it are begun (by default, all of them).
     """
 
     def __init__(self, queueName, msgId=None, timeout=None, **kwargs):
@@ -19,13 +20,142 @@ class Precondition(object):
         self.timeout = timeout
         self.kwargs = kwargs
 
-    def required(self):
-        """Is this precondition needed?"""
+    def required(self, state=None):
+        """
+        Is this precondition needed?
+
+        state is a snapshot of the system state to judge by, if the caller
+        has one (see MultiCommand.snapshot).
+        """
         return True
 
+    def msgKwargs(self):
+        """Return the data for the Msg to send, as of the last required()."""
+        return self.kwargs
+
+
+class Deadlines(object):
+    """
+    The aggregate deadline of a set of outstanding Msgs.
+
+    A thread handles the Msgs on its queue one at a time, so only the oldest
+    outstanding Msg on each queue is on the clock: the next one's deadline
+    starts when its predecessor replies. The Msgs on the clock are kept in a
+    heap, so the earliest deadline is always at hand. As a queue's priorities
+    may reorder its Msgs, a reply is matched to the Msg it says it answers
+    (see Msg.inReplyTo) where it can be.
+    """
+
+    def __init__(self):
+        self._waiting = {}              # queue name: [msg, ...] in the order sent
+        self._heap = []                 # (deadline, id(msg), msg) for Msgs on the clock
+        self._timeouts = {}             # id(msg): seconds msg may take once on the clock
+        self._names = {}                # id(msg): the name of the queue it was sent to
+
+    def __len__(self):
+        return len(self._timeouts)
+
+    def __contains__(self, msg):
+        return id(msg) in self._timeouts
+
+    def add(self, queue, msg, timeout):
+        """Track msg, just put on queue, which must reply within timeout seconds of starting."""
+        self._timeouts[id(msg)] = timeout
+        self._names[id(msg)] = str(queue)
+        waiting = self._waiting.setdefault(str(queue), [])
+        waiting.append(msg)
+        if len(waiting) == 1:
+            self._start_clock(msg)
+
+    def _start_clock(self, msg):
+        msg.deadline = time.time() + self._timeouts[id(msg)]
+        heapq.heappush(self._heap, (msg.deadline, id(msg), msg))
+
+    def answered(self, reply):
+        """
+        Return the Msg of ours that reply says it answers, following inReplyTo
+        back through any Msgs it was passed on as; or None if it doesn't say.
+        """
+        msg = getattr(reply, 'inReplyTo', None)
+        while msg is not None and msg not in self:
+            msg = msg.inReplyTo
+        return msg
+
+    def replied(self, reply):
+        """
+        Stop the clock on the Msg that reply answers, and start it on the next
+        one sent to the same queue if that was on the clock. Return (msg, known):
+        the Msg that was answered, and whether reply said it was that one. If
+        it didn't, we guess: the oldest Msg sent to the replying thread's queue,
+        or for replies from another thread, the Msg with the earliest deadline.
+        """
+        msg = self.answered(reply)
+        known = msg is not None
+        if known:
+            name = self._names[id(msg)]
+        else:
+            name = getattr(reply, 'senderName0', None)
+            if not self._waiting.get(name):
+                name = self._earliest()[2]
+                if name is None:
+                    return None, False
+            msg = self._waiting[name][0]
+
+        waiting = self._waiting[name]
+        onClock = waiting[0] is msg
+        # NOTE: not list.remove(), as Msg.__cmp__ makes different Msgs compare equal.
+        waiting[:] = [m for m in waiting if m is not msg]
+        del self._timeouts[id(msg)]
+        del self._names[id(msg)]
+        if onClock and waiting:
+            self._start_clock(waiting[0])
+        return msg, known
+
+    def expire(self):
+        """
+        Stop tracking the Msgs whose deadlines have passed, starting the clock
+        on the next one sent to each of their queues; return the expired Msgs.
+        """
+        now = time.time()
+        expired = []
+        for name, waiting in self._waiting.items():
+            if waiting and waiting[0].deadline <= now:
+                msg = waiting.pop(0)
+                del self._timeouts[id(msg)]
+                del self._names[id(msg)]
+                expired.append(msg)
+                if waiting:
+                    self._start_clock(waiting[0])
+        return expired
+
+    def _earliest(self):
+        """Return (deadline, msg, queue name) of the earliest live deadline, or Nones."""
+        while self._heap:
+            deadline, msgId, msg = self._heap[0]
+            if msgId in self._timeouts:
+                for name, waiting in self._waiting.items():
+                    if waiting and waiting[0] is msg:
+                        return deadline, msg, name
+            heapq.heappop(self._heap)
+        return None, None, None
+
+    def timeLeft(self):
+        """Seconds until the earliest deadline (may be negative), or None if nothing is outstanding."""
+        deadline = self._earliest()[0]
+        return None if deadline is None else deadline - time.time()
+
+    def outstanding(self):
+        """Return the names of the queues that still owe us a reply."""
+        return [name for name, waiting in sorted(self._waiting.items()) if waiting]
+
 
 class MultiCommand(object):
     """Process a set of commands, waiting for the last to complete"""
+
+    # If True, append() holds on to Preconditions, and start() evaluates them
+    # all together against a single snapshot(), dropping those superseded by
+    # a later Precondition for the same queue and message.
+    batchPreconditions = False
     
     def __init__(self, cmd, timeout, label, *args, **kwargs):
         self.cmd = cmd
@@ -34,28 +164,56 @@ class MultiCommand(object):
         self.label = label
         self.commands = []
         self.status = True
+        self._pending = []              # Preconditions not yet evaluated
         
         if args:
             self.append(*args, **kwargs)
 
+    def snapshot(self):
+        """Return the state to judge batched Preconditions by (None: let each look for itself)"""
+        return None
+
     def setMsgDuration(self, queueName, msg):
         """Set msg's expected duration in seconds"""
         pass
 
-    def append(self, queueName, msgId=None, timeout=None, isPrecondition=False, **kwargs):
+    def getMsgTimeout(self, queue, msg):
+        """
+        Return how long msg may take to reply, once queue starts on it.
+
+        That is its expected duration plus the queue timeout, or our overall
+        timeout if it has no expected duration; never less than the timeout
+        it was appended with.
+        """
+        if msg.duration > 0:
+            timeout = msg.duration + myGlobals.actorState.timeout
+        else:
+            timeout = self.timeout
+        if msg.timeout is not None:
+            timeout = max(timeout, msg.timeout)
+        return timeout
+
+    def append(self, queueName, msgId=None, timeout=None, isPrecondition=False, dependsOn=None, **kwargs):
         """
         Append msgId or Precondition.msgId (one of the classes under try: Msg in
         __init__) to this MultiCommand, to be run under queue queueName (one of
         the classes under 'try: MASTER' in __init__).
+
+        dependsOn lists the queues whose preconditions must be satisfied before
+        this command is sent; by default a command depends on all of the
+        preconditions, and a precondition on none of the others.
         """
         if isinstance(queueName, Precondition):
             assert msgId is None
             
             pre = queueName
+            if self.batchPreconditions:
+                self._pending.append(pre)
+                return
             if not pre.required():
                 return
 
-            return self.append(pre.queueName, pre.msgId, pre.timeout, isPrecondition=True, **pre.kwargs)
+            return self.append(pre.queueName, pre.msgId, pre.timeout, isPrecondition=True, **pre.msgKwargs())
 
         assert msgId is not None
 
@@ -63,6 +221,9 @@ class MultiCommand(object):
             self.timeout = timeout
             
         msg = Msg(msgId, cmd=self.cmd, replyQueue=self._replyQueue, **kwargs)
+        msg.timeout = timeout
+        if dependsOn is not None:
+            msg.dependsOn = [myGlobals.actorState.queues[q] for q in dependsOn]
         self.setMsgDuration(queueName, msg)
         self.commands.append((myGlobals.actorState.queues[queueName], isPrecondition, msg))
         
@@ -72,78 +233,220 @@ class MultiCommand(object):
 
         return self.finish()
 
+    def _evaluate_preconditions(self):
+        """
+        Evaluate the pending Preconditions against one snapshot, and put the
+        required ones ahead of the other commands.
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        latest = {}
+        for pre in pending:
+            latest[(pre.queueName, pre.msgId)] = pre
+
+        state = self.snapshot()
+        commands, self.commands = self.commands, []
+        for pre in pending:
+            if latest[(pre.queueName, pre.msgId)] is not pre:
+                continue                # a later one will leave the system in its own state
+            if pre.required(state):
+                self.append(pre.queueName, pre.msgId, pre.timeout, isPrecondition=True, **pre.msgKwargs())
+        self.commands += commands
+
     def start(self):
-        """Actually submit that set of commands"""
+        """
+        Actually submit that set of commands.
 
-        nPre = 0
-        duration = 0                    # guess at duration
-        for queue, isPrecondition, msg in self.commands:
-            if isPrecondition:
-                nPre += 1
-                if msg.duration > duration:
-                    duration = msg.duration
+        Each command is sent as soon as the preconditions it depends on are
+        satisfied, so this returns once every command has been sent, or
+        cancelled because a precondition failed; finish() waits for the rest.
+        """
 
-                queue.put(msg)
+        self._evaluate_preconditions()
+        self._deadlines = Deadlines()
+        self._failed = False
+        self._unsent = list(self.commands)
+        self._preconditions = [(queue, msg) for queue, isPrecondition, msg in self.commands if isPrecondition]
+        self._prepping = bool(self._preconditions)
+        self._running = False
 
-        if nPre:
+        if self._preconditions:
+            duration = max(msg.duration for queue, msg in self._preconditions)
             self.cmd.inform('text="%s expectedDuration=%d expectedEnd=%d"' %
                             (self.label, duration, time.time() + duration))
             if self.label:
-                self.cmd.inform('stageState="%s","prepping",0.0,0.0' % (self.label))
+                self._stageState('stageState="%s","prepping",0.0,0.0' % (self.label), final=False)
+
+        self._send_ready()
+        while self._unsent and self._deadlines:
+            if not self._handle_reply():
+                self._expire()
+        if self._unsent:
+            # nothing left to wait for can unblock them.
+            self._cancel()
+
+        if self._prepping:
+            self._prepped()
+        if not self._running:
+            self._run()
+
+    def _blocked(self, isPrecondition, msg):
+        """Return True if any of the preconditions msg depends on are still outstanding."""
+        for queue, pre in self._preconditions:
+            if pre is msg or not self._outstanding(pre):
+                continue
+            if self._dependsOn(isPrecondition, msg, queue):
+                return True
+        return False
 
-            if not self.finish(runningPreconditions=True):
-                self.commands = []
-                self.status = False
+    def _dependsOn(self, isPrecondition, msg, queue):
+        """Return True if msg waits on the precondition sent to queue."""
+        if msg.dependsOn is None:
+            return not isPrecondition
+        return queue in msg.dependsOn
 
-        if myGlobals.actorState.aborting: # don't schedule those commands
-            if not myGlobals.actorState.ignoreAborting: # override for e.g. status command
-                self.commands = []
-                self.status = False
+    def _outstanding(self, msg):
+        """Return True if msg has not been sent, or has not replied yet."""
+        return msg in self._deadlines or any(msg is unsent for queue, isPrecondition, unsent in self._unsent)
 
+    def _send_ready(self):
+        """Send every unsent command whose dependencies are satisfied."""
+        for queue, isPrecondition, msg in list(self._unsent):
+            if self._blocked(isPrecondition, msg):
+                continue
+            if not isPrecondition and myGlobals.actorState.aborting: # don't schedule those commands
+                if not myGlobals.actorState.ignoreAborting: # override for e.g. status command
+                    self._cancel()
+                    return
+            # NOTE: not list.remove(), as Msg.__cmp__ makes different Msgs compare equal.
+            self._unsent = [command for command in self._unsent if command[2] is not msg]
+            self._put(queue, msg)
+            if not isPrecondition and not self._running:
+                self._run()
+
+    def _cancel(self, failed=None):
+        """
+        Don't send the commands we haven't sent yet that depend, directly or
+        through other preconditions, on the failed [(queue, precondition)];
+        or any of them, if failed is None. And fail.
+        """
+        if failed is None:
+            cancelled = list(self._unsent)
+        else:
+            cancelled = []
+            failed = list(failed)
+            while failed:
+                failedQueue, failedPre = failed.pop()
+                for command in self._unsent:
+                    queue, isPrecondition, msg = command
+                    if any(msg is c[2] for c in cancelled):
+                        continue
+                    if self._dependsOn(isPrecondition, msg, failedQueue):
+                        cancelled.append(command)
+                        if isPrecondition:
+                            failed.append((queue, msg))
+        cancelled = set(id(msg) for queue, isPrecondition, msg in cancelled)
+        self.commands = [command for command in self.commands if id(command[2]) not in cancelled]
+        self._unsent = [command for command in self._unsent if id(command[2]) not in cancelled]
+        self.status = False
+
+    def _expire(self):
+        """
+        Stop waiting on the commands that overran their deadlines, cancelling
+        whatever depends on them, but keep the clock on those still in time.
+        """
+        expired = self._deadlines.expire()
+        failed = [(queue, pre) for queue, pre in self._preconditions
+                  if any(pre is msg for msg in expired)]
+        if failed:
+            self._cancel(failed)
+        if self._prepping:
+            if not self.status or not any(self._outstanding(pre) for queue, pre in self._preconditions):
+                self._prepped()
+        self._send_ready()
+
+    def _prepped(self):
+        """Output the stage state at the end of the preconditions."""
+        self._prepping = False
+        if self.label:
+            state = "prepped" if self.status else "failed"
+            self._stageState('stageState="%s","%s",0.0,0.0' % (self.label, state), final=not self.status)
+
+    def _run(self):
+        """Output the stage state once the main commands are running."""
+        self._running = True
         duration = 0
         for queue, isPrecondition, msg in self.commands:
             if not isPrecondition:
                 if msg.duration > duration:
                     duration = msg.duration
 
-                queue.put(msg)
-
         if self.label:
-            self.cmd.inform('stageState="%s","running",%0.1f,0.0' % (self.label, duration))
+            self._stageState('stageState="%s","running",%0.1f,0.0' % (self.label, duration), final=False)
         self.cmd.inform('text="expectedDuration=%d"' % duration)
 
-    def finish(self, runningPreconditions=False):
-        """Wait for set of commands to reply. Return status"""
+    def _put(self, queue, msg):
+        """Send msg to queue, and start tracking its deadline."""
+        queue.put(msg)
+        self._deadlines.add(queue, msg, self.getMsgTimeout(queue, msg))
 
-        seen = {}
-        for tname in myGlobals.actorState.threads.values():
-            seen[tname.name] = False
+    def _handle_reply(self):
+        """
+        Wait for the next reply, and send whatever it unblocks.
+        Return False if something failed to reply by its deadline.
+        """
+        deadlines = self._deadlines
+        timeLeft = deadlines.timeLeft()
+        try:
+            if timeLeft <= 0:
+                raise Queue.Empty
+            reply = self._replyQueue.get(timeout=timeLeft)
+        except Queue.Empty:
+            nonResponsive = deadlines.outstanding()
+            self.cmd.warn('text="%d tasks failed to respond: %s"' % (
+                len(nonResponsive), " ".join(nonResponsive)))
+            self._failed = True
+            return False
 
-        failed = False
-        for queue, isPrecondition, msg in self.commands:
-            if runningPreconditions != isPrecondition:
-                continue
+        msg, known = deadlines.replied(reply)
+        # only learn from replies that say what they answer, lest a guess learn the wrong step.
+        if reply.success and known and getattr(msg, 'getTime', None) is not None:
+            myGlobals.durations.observed(msg.senderQueue, msg, time.time() - msg.getTime)
+        if not reply.success and not myGlobals.bypass.get(reply.senderName0, cmd=self.cmd):
+            failed = [(queue, pre) for queue, pre in self._preconditions if pre is msg]
+            if failed:
+                self._cancel(failed)
+            else:
+                self._failed = True
+        if self._prepping:
+            if not self.status or not any(self._outstanding(pre) for queue, pre in self._preconditions):
+                self._prepped()
+
+        self._send_ready()
+        return True
 
-            try:
-                msg = self._replyQueue.get(timeout=self.timeout)
-                seen[msg.senderName] = True
+    def finish(self):
+        """
+        Wait for set of commands to reply. Return status
 
-                if not msg.success and not myGlobals.bypass.get(msg.senderName0, cmd=self.cmd):
-                    failed = True
-            except Queue.Empty:
-                responsive = [re.sub(r"(-\d+)?$", "", k) for k in seen.keys() if seen[k]]
-                cmdNames = [str(cmd[0]) for cmd in self.commands if cmd[1] == runningPreconditions]
-                nonResponsive = [cmd for cmd in cmdNames if cmd not in responsive]
+        Fails as soon as any outstanding command overruns its own deadline,
+        rather than waiting the full timeout for every reply.
+        """
 
-                self.cmd.warn('text="%d tasks failed to respond: %s"' % (
-                    len(nonResponsive), " ".join(nonResponsive)))
-                failed = True
+        while self._deadlines:
+            if not self._handle_reply():
                 break
 
         if self.label:
-            if failed or not self.status:
+            if self._failed or not self.status:
                 state = "failed"
             else:
-                state = "done" if not runningPreconditions else "prepped"
-            self.cmd.inform('stageState="%s","%s",0.0,0.0' % (self.label, state))
-        return not failed and self.status
+                state = "done"
+            self._stageState('stageState="%s","%s",0.0,0.0' % (self.label, state))
+        return not self._failed and self.status
+
+    def _stageState(self, msg, final=True):
+        """Output our stageState msg; unless it's final, it may be coalesced with the next one."""
+        myGlobals.coalescer.write(self.cmd, ('stageState', self.label), msg, final=final)
@@ -0,0 +1,84 @@
+"""
+Latency statistics for sop's message queues and their handlers.
+
+sopActor.Queue stamps each Msg when it is put and got, and notes when its
+handler finished with it. Here we accumulate those times in fixed-size
+histograms per (queue, Msg type), so that a night's worth of messages
+costs no more memory than a few of them, and "sop perf" can report them.
+"""
+import bisect
+import threading
+
+# histogram bin upper edges, in seconds; roughly logarithmic, 1 ms to ~1 hour.
+binEdges = [m*10**e for e in range(-3, 4) for m in (1, 2, 5)] + [3600]
+
+
+class Histogram(object):
+    """A bounded histogram of durations, with a count, total and maximum."""
+
+    def __init__(self):
+        self.counts = [0]*(len(binEdges) + 1) # the last bin is for overflows
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(binEdges, value)] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total/self.n if self.n else 0.0
+
+    def percentile(self, p):
+        """Return the upper edge of the bin containing the p'th percentile (never more than max)."""
+        if not self.n:
+            return 0.0
+        target = p/100.0*self.n
+        cumulative = 0
+        for edge, count in zip(binEdges, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(edge, self.max)
+        return self.max
+
+
+class Perf(object):
+    """Time spent waiting on, and being handled from, each queue, per Msg type."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything we've seen."""
+        with self._lock:
+            self.waits = {}             # (queue name, Msg type name): Histogram
+            self.handles = {}           # ditto
+
+    def _add(self, histograms, queue, msg, value):
+        key = (str(queue), msg.type.__name__)
+        with self._lock:
+            if key not in histograms:
+                histograms[key] = Histogram()
+            histograms[key].add(value)
+
+    def waited(self, queue, msg):
+        """msg was just got from queue: record how long it waited there."""
+        self._add(self.waits, queue, msg, msg.getTime - msg.putTime)
+
+    def handled(self, queue, msg, endTime):
+        """msg's handler finished with it at endTime: record how long it took."""
+        self._add(self.handles, queue, msg, endTime - msg.getTime)
+
+    def genKeys(self, cmd):
+        """Output our statistics as keywords, one per (queue, Msg type)."""
+        for keyword, histograms in (("perfQueueWait", self.waits), ("perfHandler", self.handles)):
+            with self._lock:
+                items = sorted((key, (h.n, h.mean(), h.percentile(50), h.percentile(90), h.max))
+                               for key, h in histograms.items())
+            for (queue, msgType), (n, mean, p50, p90, max) in items:
+                cmd.inform('%s="%s","%s",%d,%.3f,%.3f,%.3f,%.3f' %
+                           (keyword, queue, msgType, n, mean, p50, p90, max))
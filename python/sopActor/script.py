@@ -6,13 +6,25 @@ import sys
 
 from opscore.utility.qstr import qstr
 
+import sopActor.myGlobals as myGlobals
+
+defaultMaxTime = 30.0                   # seconds to allow a line that doesn't give a maxTime
+
 class Script(object):
     """
     Load and run a list of commands, including optional maximum timeouts for each.
-    
+
+    Lines between a "fork" line and a "join" line are run at the same time,
+    and the script carries on once they have all finished (and fails if any
+    of them did). e.g.:
+        fork
+        apogee dither namedpos=A
+        apogeecal SourceOn source=ThAr
+        join
+
     Default scripts reside in SOPACTOR_DIR/scripts
     """
-    def __init__(self, cmd, scriptName, loadFromText=None):
+    def __init__(self, cmd, scriptName, loadFromText=None, genKeys=True):
         self.cmd = cmd
         self.name = scriptName
         self.scriptLines = None
@@ -22,7 +34,8 @@ class Script(object):
             self.loadFromText(loadFromText)
         else:
             self.loadFromScriptFile(self.resolveFilename(self.name))
-        self.genStartKeys()
+        if genKeys:
+            self.genStartKeys()
 
     def loadFromText(self, rawScript):
         if type(rawScript) == str:
@@ -31,8 +44,22 @@ class Script(object):
         rawScript = [s for s in rawScript if len(s) > 0 and s[0] != '#']
 
         self.scriptLines = []
+        block = None                    # the fork block we're in, if any
+        nBlocks = 0
         for i, l in enumerate(rawScript):
             # print "parsing: %d %s" % (i, l)
+            if l == "fork":
+                if block is not None:
+                    raise RuntimeError("fork inside a fork at script line %d" % (i))
+                block = nBlocks
+                nBlocks += 1
+                continue
+            elif l == "join":
+                if block is None:
+                    raise RuntimeError("join without a fork at script line %d" % (i))
+                block = None
+                continue
+
             mat = re.search('^(?P<maxTime>\d+\.\d+ +)?(?P<actor>[a-zA-Z][a-zA-Z0-9_]*) +(?P<cmd>.*)', l)
             if not mat:
                 raise RuntimeError("failed to parse script line %d: %s" %
@@ -42,8 +69,11 @@ class Script(object):
             maxTime = matDict['maxTime']
             scriptLine = [matDict['actor'],
                           matDict['cmd'],
-                          float(maxTime) if maxTime != None else 0.0]
+                          float(maxTime) if maxTime != None else 0.0,
+                          block]
             self.scriptLines.append(scriptLine)
+        if block is not None:
+            raise RuntimeError("fork without a join at the end of the script")
 
         self.atStep = 0
         self.state = "idle"
@@ -86,6 +116,9 @@ class Script(object):
 
     def genStartKeys(self):
         self.genStatus()
+        self.genLineKeys()
+
+    def genLineKeys(self):
         for i, l in enumerate(self.scriptLines):
             self.cmd.respond('scriptLine=%s,%d,%0.1f,%s' %
                              (self.name, i+1,
@@ -93,7 +126,11 @@ class Script(object):
                               self.scriptLineAsString(l)))
 
     def fetchNextStep(self):
-        """ return (actor, command) or the next step, or None if done. """
+        """
+        Return the lines [(actor, command, maxTime, block), ...] of the next
+        step, to be run together, or None if done. A step is one line, or
+        all those of a fork block.
+        """
 
         if self.state == "idle":
             self.state = "running"
@@ -107,11 +144,60 @@ class Script(object):
             self.genStatus()
             return None
 
-        line = self.scriptLines[self.atStep]
         self.genStatus()
-        self.atStep += 1
-
-        return line
+        end = self.stepEnd(self.atStep)
+        lines = self.scriptLines[self.atStep:end]
+        self.atStep = end
+
+        return lines
+
+    def stepEnd(self, i):
+        """Return the index of the first line after the step that starts with line i."""
+        block = self.scriptLines[i][3]
+        i += 1
+        while block is not None and i < len(self.scriptLines) and self.scriptLines[i][3] == block:
+            i += 1
+        return i
+
+    def expectedTime(self, line):
+        """Return how long line should take: the median of its learned history, else its maxTime."""
+        actor, cmdStr, maxTime, block = line
+        expected = myGlobals.durations.callPercentile(actor, cmdStr, 50, literal=True)
+        if expected is not None:
+            return expected
+        return maxTime if maxTime > 0 else defaultMaxTime
+
+    def timing(self):
+        """
+        Return (expected time, expected end, critical) for each line, without
+        running any of them. The end is counted from the start of the script;
+        critical is True for the lines the script's length is made of (every
+        line outside a fork block, and the longest of each block).
+        """
+        timing = []
+        start = 0.0
+        i = 0
+        while i < len(self.scriptLines):
+            end = self.stepEnd(i)
+            expected = [self.expectedTime(line) for line in self.scriptLines[i:end]]
+            longest = expected.index(max(expected))
+            for j, t in enumerate(expected):
+                timing.append((t, start + t, j == longest))
+            start += expected[longest]
+            i = end
+        return timing
+
+    def expectedTotal(self):
+        """Return how long the whole script should take."""
+        return max([end for t, end, critical in self.timing()] or [0.0])
+
+    def genTimingKeys(self):
+        """Output when each line, and the script, should be done by, without running them."""
+        timing = self.timing()
+        for i, (t, end, critical) in enumerate(timing):
+            self.cmd.respond('scriptLineTiming=%s,%d,%0.1f,%0.1f,%s' %
+                             (self.name, i+1, t, end, 'T' if critical else 'F'))
+        self.cmd.respond('scriptTiming=%s,%0.1f' % (self.name, self.expectedTotal()))
 
 if __name__ == "__main__":
     class fakeCmd(object):
@@ -125,6 +211,12 @@ if __name__ == "__main__":
         15.0 apogee dark time=10.0 ; comment="what is this?"
         10.0 apogeecal shutter open
         """,
+        """ fork
+        apogee dither namedpos=A
+        apogeecal SourceOn source=ThAr
+        join
+        130.0 apogee expose nreads=12 ; object=ArcLamp
+        """,
         ]
 
     cmd = fakeCmd()
@@ -134,9 +226,9 @@ if __name__ == "__main__":
                             s)
 
             while True:
-                scriptLine = script.fetchNextStep()
-                print "got %s" % (scriptLine)
-                if not scriptLine:
+                scriptLines = script.fetchNextStep()
+                print "got %s" % (scriptLines)
+                if not scriptLines:
                     break
 
         except Exception, e:
@@ -7,10 +7,34 @@ import sopActor.myGlobals as myGlobals
 
 import script
 reload(script)
+from sopActor.utils.calls import call_async
 
 from opscore.utility.qstr import qstr
 from opscore.utility.tback import tback
 
+def run_lines(cmd, actorState, scriptLines):
+    """
+    Run scriptLines all at once, each allowed its own maxTime, and wait for
+    them all to finish. Return the "actor command"s of those that failed.
+    """
+    calls = []
+    for actorName, cmdStr, maxTime, block in scriptLines:
+        if maxTime == 0.0:
+            maxTime = script.defaultMaxTime
+
+        cmd.warn('text="firing off script line: %s %s (maxTime=%0.1f)"' % (actorName, cmdStr, maxTime))
+        # Learn how long the line takes (for dry runs), but keep to its maxTime.
+        kwargs = dict(actor=actorName, forUserCmd=cmd, cmdStr=cmdStr, timeLim=maxTime+15,
+                      keepTimeLim=True, literal=True)
+        if len(scriptLines) == 1:
+            calls.append(myGlobals.timeouts.call(**kwargs))
+        else:
+            calls.append(call_async(**kwargs))
+
+    return ["%s %s" % tuple(line)
+            for line, cmdVar in zip([l[:2] for l in scriptLines], calls)
+            if cmdVar.didFail]
+
 def main(actor, queues):
     """Main loop for general scripting thread.
 
@@ -49,22 +73,16 @@ def main(actor, queues):
                              (threadName))
                     continue
 
-                scriptLine = runningScript.fetchNextStep()
-                if not scriptLine:
+                scriptLines = runningScript.fetchNextStep()
+                if not scriptLines:
                     msg.cmd.finish('text="script %s appears to be done"' % (runningScript.name))
                     runningScript = None
                     continue
 
-                actorName, cmdStr, maxTime = scriptLine
-                if maxTime == 0.0:
-                    maxTime = 30.0
-
-                msg.cmd.warn('text="firing off script line: %s %s (maxTime=%0.1f)"' % (actorName, cmdStr, maxTime))
-                cmdVar = actorState.actor.cmdr.call(actor=actorName, forUserCmd=msg.cmd,
-                                                    cmdStr=cmdStr,
-                                                    timeLim=maxTime+15)
-                if cmdVar.didFail:
-                    msg.cmd.fail('text="Script %s failed to run %s %s"' % (runningScript.name, actorName, cmdStr))
+                failed = run_lines(msg.cmd, actorState, scriptLines)
+                if failed:
+                    msg.cmd.fail('text="Script %s failed to run %s"' %
+                                 (runningScript.name, "; ".join(failed)))
                     runningScript = None
                 else:
                     actorState.queues[myQueueName].put(Msg.SCRIPT_STEP, msg.cmd)
@@ -85,6 +103,6 @@ def main(actor, queues):
                 raise ValueError, ("Unknown message type %s" % msg.type)
 
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception, e:
             sopActor.handle_bad_exception(actor, e, threadName, msg)
@@ -0,0 +1,547 @@
+"""
+Simulate sop's master-thread commands on a virtual clock.
+
+The real masterThread functions (do_boss_calibs, goto_field_boss, ...) are run
+against stand-in subsystem queues, which handle each Msg the moment it is put,
+taking the time that SopMultiCommand.setMsgDuration (from what sop has learned,
+see durations, when it can) and the lamp warmup table say it would (or the
+time in Simulator.durations, for the Msgs they don't know about). Nothing waits in real time, so a whole night's plan takes
+milliseconds, and the result is a Timeline of every step and stage, with the
+critical path and the expected end time.
+
+    timeline = simulate('doBossCalibs', nFlat=2, nArc=1)
+    print("\\n".join(timeline.format()))
+
+or from the shell:
+
+    python -m sopActor.simulator doBossCalibs nFlat=2 nArc=1
+
+The simulation replaces myGlobals.actorState while it runs: don't use it in a
+running actor.
+"""
+from __future__ import print_function
+
+import heapq
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import ConfigParser
+
+import sopActor
+from sopActor import Msg, CmdState
+import sopActor.myGlobals as myGlobals
+import sopActor.masterThread as masterThread
+from sopActor.bypass import Bypass
+from sopActor.timers import Timers
+from sopActor.durations import Durations
+from sopActor.timeouts import TimeoutPolicy
+from sopActor.coalesce import Coalescer
+from sopActor.lampJournal import LampJournal
+from sopActor.utils.instrumentState import InstrumentState
+
+# How long the Msgs that setMsgDuration doesn't know about take, in seconds.
+defaultDurations = {Msg.SLEW: lambda msg: 120,
+                    Msg.AXIS_INIT: lambda msg: 10,
+                    Msg.START: lambda msg: msg.expTime,
+                    Msg.DECENTER: lambda msg: 5,
+                    Msg.MANGA_DITHER: lambda msg: masterThread.guiderDecenterDuration,
+                    Msg.APOGEE_SHUTTER: lambda msg: 5,
+                    Msg.APOGEE_DITHER_SET: lambda msg: msg.expTime*len(msg.dithers),
+                    Msg.SINGLE_HARTMANN: lambda msg: (masterThread.flushDuration + msg.expTime +
+                                                      masterThread.readoutDuration),
+                    }
+
+# name: (masterThread function, CmdState class, setup(cmdState), extra args(simulator))
+commands = {'doBossCalibs': (masterThread.do_boss_calibs, CmdState.DoBossCalibsCmd,
+                             lambda cmdState: None, lambda sim: ()),
+            'gotoField': (masterThread.goto_field_boss, CmdState.GotoFieldCmd,
+                          lambda cmdState: None, lambda sim: (sim.slewTimeout,)),
+            'doMangaSequence': (masterThread.do_manga_sequence, CmdState.DoMangaSequenceCmd,
+                                lambda cmdState: cmdState.set_mangaDither(), lambda sim: ()),
+            'doApogeeMangaSequence': (masterThread.do_apogeemanga_sequence,
+                                      CmdState.DoApogeeMangaSequenceCmd,
+                                      lambda cmdState: cmdState.set_mangaDither(), lambda sim: ()),
+            'hartmann': (masterThread.hartmann, CmdState.HartmannCmd,
+                         lambda cmdState: None, lambda sim: ()),
+            'collimateBoss': (masterThread.collimate_boss, CmdState.CollimateBossCmd,
+                              lambda cmdState: None, lambda sim: ()),
+            }
+
+# (queue, thread name) of the subsystems we stand in for.
+simQueues = ((sopActor.BOSS, 'boss'), (sopActor.APOGEE, 'apogee'), (sopActor.GUIDER, 'guider'),
+             (sopActor.GCAMERA, 'gcamera'), (sopActor.FF_LAMP, 'ff'), (sopActor.HGCD_LAMP, 'hgcd'),
+             (sopActor.NE_LAMP, 'ne'), (sopActor.UV_LAMP, 'uv'), (sopActor.WHT_LAMP, 'wht'),
+             (sopActor.FFS, 'ffs'), (sopActor.TCC, 'tcc'), (sopActor.SLEW, 'slew'))
+
+
+class Step(object):
+    """One simulated piece of work: a Msg handled by a subsystem, or a cmdr call."""
+
+    def __init__(self, who, what, stage, start, end, cause):
+        self.who = who                  # the queue (or actor) that did it
+        self.what = what                # the Msg type or command string
+        self.stage = stage              # the stage that was running when it was sent
+        self.start = start
+        self.end = end
+        self.cause = cause              # the Step whose completion it had to wait for, or None
+
+    def __repr__(self):
+        return "Step(%s, %s, %g-%g)" % (self.who, self.what, self.start, self.end)
+
+
+class Timeline(object):
+    """The result of a simulation: every Step, every stage transition, and when it all ended."""
+
+    def __init__(self, name, steps, stages, end, succeeded, messages):
+        self.name = name
+        self.steps = steps
+        self.stages = stages            # [(time, stage, state), ...]
+        self.end = end
+        self.succeeded = succeeded
+        self.messages = messages        # [(time, level, text), ...] sent to the command
+
+    def criticalPath(self):
+        """Return the chain of Steps that determined the end time, earliest first."""
+        if not self.steps:
+            return []
+        step = max(reversed(self.steps), key=lambda s: s.end)
+        path = []
+        while step is not None:
+            path.append(step)
+            step = step.cause
+        return path[::-1]
+
+    def format(self):
+        """Return a human-readable report, as a list of lines."""
+        lines = ["%s: %s, expected end at %s" %
+                 (self.name, "succeeded" if self.succeeded else "FAILED", _hms(self.end))]
+        lines.append("Stages:")
+        for t, stage, state in self.stages:
+            lines.append("  %9s  %-40s %s" % (_hms(t), stage, state))
+        lines.append("Steps:")
+        for step in self.steps:
+            lines.append("  %9s  %9s  %-8s %-24s %s" % (_hms(step.start), _hms(step.end),
+                                                          step.who, step.what, step.stage))
+        lines.append("Critical path:")
+        for step in self.criticalPath():
+            if step.end > step.start:
+                lines.append("  %9s  %9s  %-8s %s" % (_hms(step.start), _hms(step.end),
+                                                       step.who, step.what))
+        return lines
+
+def _hms(t):
+    """Format t seconds as h:mm:ss."""
+    t = int(round(t))
+    return "%d:%02d:%02d" % (t//3600, t//60%60, t%60)
+
+
+class SimQueue(sopActor.Queue):
+    """
+    A stand-in for a subsystem thread's queue: handles each Msg as it is put,
+    on the simulator's clock, and replies with the reply's priority set to
+    the simulated time it completes, so that the MultiCommand waiting on the
+    replies sees them in simulated order.
+    """
+
+    def __init__(self, name, simulator):
+        sopActor.Queue.__init__(self, name, 0)
+        self.simulator = simulator
+        self.busyUntil = 0.0
+        self.lastStep = None
+
+    def put(self, arg0, *args, **kwds):
+        msg = arg0 if isinstance(arg0, Msg) else Msg(arg0, *args, **kwds)
+        self.simulator._handle(self, msg)
+
+
+class SimCmd(object):
+    """A stand-in for the user's command, that records what is said to it."""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.finished = False
+        self.didFail = False
+
+    def isAlive(self):
+        return not self.finished
+
+    def _say(self, level, text):
+        self.simulator._message(level, text)
+
+    def diag(self, text):
+        self._say('d', text)
+
+    def inform(self, text):
+        self._say('i', text)
+
+    def respond(self, text):
+        self._say('i', text)
+
+    def warn(self, text):
+        self._say('w', text)
+
+    def error(self, text):
+        self._say('e', text)
+
+    def finish(self, text=''):
+        self.finished = True
+        self._say(':', text)
+
+    def fail(self, text=''):
+        self.finished = self.didFail = True
+        self._say('f', text)
+
+
+class SimCmdVar(object):
+    """What a cmdr.call() returns."""
+    didFail = False
+    lastReply = None
+
+
+class SimCmdr(object):
+    """A stand-in for actor.cmdr, whose calls take callDurations[actor] seconds."""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def call(self, actor=None, cmdStr='', **kwargs):
+        self.simulator._call(actor, cmdStr)
+        return SimCmdVar()
+
+
+class _StatusCmdSet(object):
+    """show_status() asks for our status, which nobody is listening to."""
+    def status(self, *args, **kwargs):
+        pass
+
+
+class _Model(object):
+    def __init__(self, keyVarDict):
+        self.keyVarDict = keyVarDict
+
+
+class _Gang(object):
+    def __init__(self, atCart):
+        self.atCart = atCart
+
+    def atCartridge(self):
+        return self.atCart
+
+
+class _Actor(object):
+    def __init__(self, simulator, location):
+        self.location = location
+        self.cmdr = SimCmdr(simulator)
+        self.bcast = SimCmd(simulator)
+        self.commandSets = {'SopCmd_%s' % location.upper(): _StatusCmdSet()}
+
+
+class _ActorState(object):
+    pass
+
+
+class Simulator(object):
+    """
+    Run masterThread commands against stand-in subsystems on a virtual clock,
+    which starts at 0.
+
+    The initial instrument state is given by ffs ('open' or 'closed'), lampsOn
+    (the lamp queues that are on and warm), apogeeShutter, decentered,
+    mangaDither and apogeeDither. durations overrides defaultDurations, and
+    callDurations[actor] is how long a direct cmdr.call to actor takes.
+    """
+
+    def __init__(self, location='APO', warmupTime=None, timeout=None, durations=None, callDurations=None,
+                 slewTimeout=180, ffs='closed', lampsOn=(), apogeeShutter=False, decentered=False,
+                 mangaDither='C', apogeeDither='A', gangAtCart=True):
+        self._lock = threading.RLock()
+        self.now = 0.0
+        self.lastStep = None            # the Step whose completion brought the clock to now
+        self.steps = []
+        self.stages = []
+        self.messages = []
+        self.stage = ''                 # the MultiCommand stage currently running
+        self._unlabelled = []           # Steps sent before their MultiCommand announced its stage
+        self.slewTimeout = slewTimeout
+        self.durations = dict(defaultDurations)
+        self.durations.update(durations or {})
+        self.callDurations = dict(callDurations or {})
+        self.warmupTime = warmupTime if warmupTime is not None else getattr(myGlobals, 'warmupTime', {})
+
+        self._pending = []              # (reply, replyQueue, Step) we've replied with, but not seen got
+        self._effects = []              # heap of (when, seq, function) changes to the instrument state
+        self._seq = itertools.count()
+        self._cmdStates = []            # the CmdStates whose stages we follow
+        self._lastStages = {}
+
+        self.ffs = ffs
+        self.lamps = dict((queueName, (queueName in lampsOn, -1e6)) for queueName, _ in simQueues)
+        self.apogeeShutter = apogeeShutter
+        self.decentered = decentered
+        self.mangaDither = mangaDither
+
+        actorState = self.actorState = _ActorState()
+        actorState.actor = _Actor(self, location)
+        actorState.timeout = timeout if timeout is not None else 60
+        actorState.aborting = False
+        actorState.ignoreAborting = False
+        actorState.survey = sopActor.BOSS
+        actorState.apogeeGang = _Gang(gangAtCart)
+        actorState.models = {'apogee': _Model({'ditherPosition': [0.0, apogeeDither]})}
+        actorState.instrumentState = self
+        actorState.queues = dict((queueName, SimQueue(name, self)) for queueName, name in simQueues)
+        actorState.threads = {}
+        actorState.doMangaDither = CmdState.DoMangaDitherCmd()
+        actorState.doApogeeMangaDither = CmdState.DoApogeeMangaDitherCmd()
+
+    #
+    # The virtual clock
+    #
+    def _sync(self):
+        """Advance the clock past the replies that have been got since we last looked."""
+        stillQueued = set()
+        for reply, replyQueue, step in self._pending:
+            with replyQueue.mutex:
+                stillQueued.update(id(entry[2]) for entry in replyQueue.queue)
+        pending = []
+        for reply, replyQueue, step in self._pending:
+            if id(reply) in stillQueued:
+                pending.append((reply, replyQueue, step))
+            elif step.end >= self.now:
+                self.now, self.lastStep = step.end, step
+        self._pending = pending
+
+        while self._effects and self._effects[0][0] <= self.now:
+            heapq.heappop(self._effects)[2]()
+
+    def _effect(self, when, function):
+        """Call function once the clock reaches when."""
+        heapq.heappush(self._effects, (when, next(self._seq), function))
+
+    def _step(self, who, what, duration, busyUntil=0.0, lastStep=None):
+        """Record a Step starting when both the clock and who are free; return it."""
+        if busyUntil > self.now:
+            start, cause = busyUntil, lastStep
+        else:
+            start, cause = self.now, self.lastStep
+        step = Step(who, what, self.stage, start, start + duration, cause)
+        self.steps.append(step)
+        if not self.stage:
+            self._unlabelled.append(step)
+        return step
+
+    #
+    # The stand-in subsystems
+    #
+    def _duration(self, msg):
+        """How long the subsystem would take to handle msg."""
+        if msg.duration > 0:
+            return msg.duration
+        elif msg.type in self.durations:
+            return self.durations[msg.type](msg)
+        return 0
+
+    def _handle(self, queue, msg):
+        """Handle msg, as queue's thread would, and reply at the simulated time it finishes."""
+        with self._lock:
+            self._sync()
+            duration = self._duration(msg)
+            if msg.type == Msg.FFS_MOVE and self.ffs == ('open' if msg.open else 'closed'):
+                duration = 0            # the ffs thread does nothing if they're already there
+            step = self._step(str(queue), msg.type.__name__, duration, queue.busyUntil, queue.lastStep)
+            queue.busyUntil, queue.lastStep = step.end, step
+            self._apply(queue, msg, step)
+
+            if msg.replyQueue is not None:
+                reply = Msg(Msg.REPLY, msg.cmd, success=True, priority=step.end)
+                reply.inReplyTo = msg
+                msg.replyQueue.put(reply)
+                reply.senderName = reply.senderName0 = str(queue) # as if from queue's own thread
+                self._pending.append((reply, msg.replyQueue, step))
+
+    def _apply(self, queue, msg, step):
+        """Schedule msg's effect on the instrument state."""
+        queueName = [q for q, name in simQueues if name == str(queue)][0]
+        if msg.type == Msg.FFS_MOVE:
+            state = 'open' if msg.open else 'closed'
+            self._effect(step.end, lambda: setattr(self, 'ffs', state))
+        elif msg.type == Msg.LAMP_ON:
+            wasOn, since = self.lamps[queueName]
+            lamp = (bool(msg.on), since if wasOn == bool(msg.on) else step.start)
+            self._effect(step.end, lambda: self.lamps.__setitem__(queueName, lamp))
+        elif msg.type == Msg.APOGEE_SHUTTER:
+            self._effect(step.end, lambda: setattr(self, 'apogeeShutter', msg.open))
+        elif msg.type == Msg.DECENTER:
+            self._effect(step.end, lambda: setattr(self, 'decentered', msg.on))
+        elif msg.type == Msg.MANGA_DITHER:
+            self._effect(step.end, lambda: setattr(self, 'mangaDither', msg.dither))
+        elif msg.type == Msg.APOGEE_DITHER_SET:
+            ditherPosition = self.actorState.models['apogee'].keyVarDict['ditherPosition']
+            self._effect(step.end, lambda: ditherPosition.__setitem__(1, msg.dithers[-1]))
+
+    def _call(self, actor, cmdStr):
+        """A cmdr.call blocks the caller until it's done."""
+        with self._lock:
+            self._sync()
+            step = self._step(actor, cmdStr, self.callDurations.get(actor, 0))
+            self.now, self.lastStep = step.end, step
+
+    def _message(self, level, text):
+        """Something was said to the command: note any change in the stages."""
+        with self._lock:
+            self._sync()
+            self.messages.append((self.now, level, text))
+            match = re.search(r'^stageState="([^"]*)","(\w+)"', text)
+            if match:
+                label, state = match.groups()
+                self.stages.append((self.now, label, state))
+                if state in ('prepping', 'running'):
+                    # A MultiCommand announces that it's running after sending the first command.
+                    for step in self._unlabelled:
+                        step.stage = label
+                    self._unlabelled = []
+                    self.stage = label
+                else:
+                    self.stage = ''
+            elif text.startswith('text="expectedDuration='):
+                self._unlabelled = []   # an unlabelled MultiCommand is running
+            for cmdState in self._cmdStates:
+                for stage in cmdState.allStages:
+                    state = cmdState.stages.get(stage)
+                    key = (cmdState.name, stage)
+                    if self._lastStages.get(key) != state:
+                        self._lastStages[key] = state
+                        self.stages.append((self.now, "%s[%s]" % key, state))
+
+    def snapshot(self):
+        """The InstrumentState at the current simulated time (we stand in for instrumentState)."""
+        with self._lock:
+            self._sync()
+            now = time.time()
+            def lamp(queueName):
+                isOn, since = self.lamps[queueName]
+                return isOn, now - (self.now - since)
+            return InstrumentState(timestamp=now, ffs=self.ffs,
+                                   ffsCounts=(8, 0) if self.ffs == 'open' else (0, 8),
+                                   ffLamp=lamp(sopActor.FF_LAMP),
+                                   hgcdLamp=lamp(sopActor.HGCD_LAMP),
+                                   neLamp=lamp(sopActor.NE_LAMP),
+                                   uvLamp=self.lamps[sopActor.UV_LAMP][0],
+                                   whtLamp=self.lamps[sopActor.WHT_LAMP][0],
+                                   apogeeShutter=self.apogeeShutter,
+                                   decentered=self.decentered,
+                                   mangaDither=self.mangaDither,
+                                   axePos=None)
+
+    #
+    # Running commands
+    #
+    def run(self, function, cmdState, *args):
+        """Run masterThread function(cmd, cmdState, actorState, *args); return its Timeline."""
+        saved = dict((name, getattr(myGlobals, name, None))
+                     for name in ('actorState', 'warmupTime', 'bypass', 'timers', 'durations',
+                                  'timeouts', 'coalescer', 'lampJournal'))
+        myGlobals.actorState = self.actorState
+        myGlobals.warmupTime = self.warmupTime
+        myGlobals.bypass = Bypass()
+        myGlobals.timers = Timers()
+        # use what's been learned, if anything, but don't learn from these times, which aren't real.
+        myGlobals.durations = saved['durations'] or Durations()
+        myGlobals.timeouts = saved['timeouts'] or TimeoutPolicy()
+        myGlobals.coalescer = Coalescer()
+        myGlobals.lampJournal = LampJournal()
+        learning, myGlobals.durations.learning = myGlobals.durations.learning, False
+        try:
+            cmd = SimCmd(self)
+            cmdState.cmd = cmd
+            self._cmdStates = [cmdState, self.actorState.doMangaDither, self.actorState.doApogeeMangaDither]
+            for state in self._cmdStates:
+                for stage in state.allStages:
+                    self._lastStages[(state.name, stage)] = state.stages.get(stage)
+            function(cmd, cmdState, self.actorState, *args)
+            with self._lock:
+                self._sync()
+                # anything still outstanding (e.g. a readout nobody waited for) finishes eventually.
+                end = max([self.now] + [step.end for step in self.steps])
+        finally:
+            myGlobals.durations.learning = learning
+            for name, value in saved.items():
+                setattr(myGlobals, name, value)
+
+        return Timeline(cmdState.name, self.steps, self.stages, end, not cmd.didFail, self.messages)
+
+
+def simulate(name, simulator=None, **settings):
+    """
+    Simulate the sop command name (one of commands), with the given settings
+    of its CmdState (e.g. nFlat=2), on simulator (default: a new Simulator).
+    Return the Timeline.
+    """
+    function, cmdStateClass, setup, args = commands[name]
+    if simulator is None:
+        simulator = Simulator()
+    cmdState = cmdStateClass()
+    setup(cmdState)
+    for key, value in settings.items():
+        setattr(cmdState, key, value)
+    for resetter in ('reset_ditherSeq',):
+        if hasattr(cmdState, resetter):
+            getattr(cmdState, resetter)()
+    return simulator.run(function, cmdState, *args(simulator))
+
+
+def readWarmupTimes(configFile):
+    """Read the lamp warmup times from sop's configuration file."""
+    config = ConfigParser.ConfigParser()
+    config.read(configFile)
+    warmupList = config.get('lamps', 'warmupTime').split()
+    warmupTime = {}
+    for i in range(0, len(warmupList), 2):
+        k, v = warmupList[i:i + 2]
+        warmupTime[{'ff': sopActor.FF_LAMP,
+                    'hgcd': sopActor.HGCD_LAMP,
+                    'ne': sopActor.NE_LAMP,
+                    'wht': sopActor.WHT_LAMP,
+                    'uv': sopActor.UV_LAMP
+                    }[k.lower()]] = float(v)
+    return warmupTime
+
+
+def _parseValue(value):
+    """Return value (a string) as an int, float or bool, if it looks like one."""
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return {'True': True, 'False': False}.get(value, value)
+
+
+def main(argv=sys.argv):
+    """simulator command [name=value ...]: print the timeline of a sop command."""
+    if len(argv) < 2 or argv[1] not in commands:
+        print("Usage: %s {%s} [name=value ...]" % (argv[0], ",".join(sorted(commands))))
+        return 1
+
+    settings = {}
+    for arg in argv[2:]:
+        key, value = arg.split('=', 1)
+        settings[key] = _parseValue(value)
+
+    configFile = os.path.join(os.environ.get('SOPACTOR_DIR', os.path.join(os.path.dirname(__file__),
+                                                                          '..', '..')), 'etc', 'sop.cfg')
+    config = ConfigParser.ConfigParser()
+    config.read(configFile)
+    if config.has_option('durations', 'file') and config.get('durations', 'file'):
+        myGlobals.durations = Durations()
+        myGlobals.durations.load(os.path.expandvars(config.get('durations', 'file')))
+    simulator = Simulator(warmupTime=readWarmupTimes(configFile))
+    timeline = simulate(argv[1], simulator, **settings)
+    print("\n".join(timeline.format()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
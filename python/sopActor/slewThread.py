@@ -32,6 +32,7 @@ import sopActor
 import sopActor.myGlobals as myGlobals
 from sopActor.multiCommand import MultiCommand
 from sopActor import masterThread as master
+from sopActor import kinematics
 
 
 def goto_position(cmd, cmdState, actorState):
@@ -39,8 +40,6 @@ def goto_position(cmd, cmdState, actorState):
 
     finishMsg = "On position."
 
-    multiCmd = master.SopMultiCommand(cmd, actorState.timeout + 100,
-                                      cmdState.name + ".slew")
     cmdState.setStageState('slew', 'running')
 
     # Heading towards the instrument change pos.
@@ -48,8 +47,8 @@ def goto_position(cmd, cmdState, actorState):
     alt = cmdState.alt
     rot = cmdState.rot
 
-    slewDuration = 60
-    multiCmd = MultiCommand(cmd, slewDuration + actorState.timeout, None)
+    slewDuration = kinematics.slewDuration(actorState, az, alt, rot)
+    multiCmd = master.SopMultiCommand(cmd, slewDuration + actorState.timeout, None)
 
     # Start with an axis init, in case the axes are not clear.
     multiCmd.append(master.SopPrecondition(sopActor.TCC, Msg.AXIS_INIT))
@@ -157,15 +156,10 @@ def goto_gang_change(cmd, cmdState, actorState, failMsg=None):
 
             # Try to move the rotator as far as we can while the altitude
             # is moving.
-            thisAlt = tccDict['axePos'][1]
-            thisRot = tccDict['axePos'][2]
-            dRot = rot - thisRot
-            if dRot != 0:
-                dAlt = alt - thisAlt
-                dAltTime = abs(dAlt) / 1.5  # deg/sec
-                dRotTime = abs(dRot) / 2.0  # deg/sec
-                dCanRot = dRot * min(1.0, dAltTime / dRotTime)
-                rot = thisRot + dCanRot
+            start = kinematics.position(actorState)
+            if start is not None:
+                az, alt, rot = kinematics.mount.toward(start, (az, alt, rot),
+                                                       pacing=(kinematics.ALT,))
         else:
             # Nod up: going to the commanded altitude,
             # leaving az and rot where they are.
@@ -173,8 +167,8 @@ def goto_gang_change(cmd, cmdState, actorState, failMsg=None):
             alt = cmdState.alt
             rot = tccDict['axePos'][2]
 
-        slewDuration = 60
-        multiCmd = MultiCommand(cmd, slewDuration + actorState.timeout, None)
+        slewDuration = kinematics.slewDuration(actorState, az, alt, rot)
+        multiCmd = master.SopMultiCommand(cmd, slewDuration + actorState.timeout, None)
 
         # Start with an axis init, in case the axes are not clear.
         multiCmd.append(master.SopPrecondition(sopActor.TCC, Msg.AXIS_INIT))
@@ -239,7 +233,7 @@ def main(actor, queues):
                 raise ValueError('Unknown message type {0}'.format(msg.type))
 
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
 
         except Exception, ee:
             sopActor.handle_bad_exception(actor, ee, threadName, msg)
@@ -4,6 +4,7 @@ import time
 from sopActor import Msg
 import sopActor
 import sopActor.myGlobals as myGlobals
+from sopActor import kinematics
 
 print "Loading TCC thread"
 
@@ -63,7 +64,7 @@ def some_axes_state(axisCmdState, state, axes=('az','alt','rot')):
 
 def below_alt_limit(actorState):
     """Check if we are below the alt=18 limit that prevents init/motion in az."""
-    return actorState.models['tcc'].keyVarDict['axePos'][1] < 18
+    return actorState.models['tcc'].keyVarDict['axePos'][1] < kinematics.altLimit
 
 def mcp_semaphore_ok(cmd, actorState):
     """
@@ -323,6 +324,6 @@ def main(actor, queues):
             else:
                 msg.cmd.warn("Unknown message type %s" % msg.type)
         except Queue.Empty:
-            actor.bcast.diag('text="%s alive"' % threadName)
+            pass                        # queue.get() checked in with the heartbeat
         except Exception, e:
             sopActor.handle_bad_exception(actor, e, threadName, msg)
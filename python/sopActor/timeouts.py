@@ -0,0 +1,75 @@
+"""
+How long to wait for a step before deciding that it has hung.
+
+The hand-built timeouts (e.g. expTime + 180 + 100 for a BOSS exposure) have
+to allow for the slowest night at either site, so a hang takes a long time
+to notice. Once we've seen a step enough times (see durations), we instead
+allow a high percentile of how long it has taken, plus a margin; until then,
+the hand-built timeout stands. Unless told to shorten, we only ever lengthen
+the hand-built timeouts, for steps that have turned out slower than they
+allow; and a call that times out is learned from too, as taking at least its
+timeLim, so that a limit that has become too tight loosens again.
+
+MultiCommand asks the policy for each Msg's timeout, and the threads send
+their commands to other actors with myGlobals.timeouts.call() rather than
+cmdr.call(), so that it can choose the timeLim and learn from how long the
+command took.
+"""
+import time
+
+import sopActor.myGlobals as myGlobals
+
+
+class TimeoutPolicy(object):
+    """
+    Allow the percentile'th percentile of how long a step has taken before,
+    plus margin seconds; or the caller's default if we've seen it fewer than
+    minSamples times. Never less than the default, unless shorten.
+    """
+
+    def __init__(self, percentile=99, margin=15, minSamples=10, shorten=False):
+        self.percentile = percentile
+        self.margin = margin
+        self.minSamples = minSamples
+        self.shorten = shorten
+
+    def msgTimeout(self, queue, msg, default):
+        """
+        Return how long to allow msg to take on queue, once it's started on it;
+        never less than the timeout it was explicitly given, if any.
+        """
+        learned = myGlobals.durations.percentile(queue, msg, self.percentile, self.minSamples)
+        if learned is None:
+            return default
+        timeout = learned + self.margin
+        if msg.timeout is not None:
+            timeout = max(timeout, msg.timeout)
+        return timeout if self.shorten else max(timeout, default)
+
+    def callTimeout(self, actor, cmdStr, default, nominal=0):
+        """Return the timeLim to give actor's cmdStr, which is asked to take nominal seconds."""
+        learned = myGlobals.durations.callPercentile(actor, cmdStr, self.percentile, nominal, self.minSamples)
+        if learned is None:
+            return default
+        timeout = learned + self.margin
+        return timeout if self.shorten or default is None else max(timeout, default)
+
+    def call(self, nominal=0, keepTimeLim=False, literal=False, **kwargs):
+        """
+        Return actor.cmdr.call(**kwargs), with timeLim (today's constant)
+        replaced by what we've learned, and learn from how long it took; if it
+        failed, only if it ran out of time, when it would have taken longer.
+        nominal is how long the command is asked to take (e.g. its exposure time).
+        keepTimeLim: use timeLim as given (e.g. a script's maxTime), only learning.
+        literal: learn under cmdStr as written, numbers and all (see durations.callKey).
+        """
+        actor, cmdStr = kwargs['actor'], kwargs['cmdStr']
+        if 'timeLim' in kwargs and not keepTimeLim:
+            kwargs['timeLim'] = self.callTimeout(actor, cmdStr, kwargs['timeLim'], nominal)
+        startTime = time.time()
+        cmdVar = myGlobals.actorState.actor.cmdr.call(**kwargs)
+        took = time.time() - startTime
+        timeLim = kwargs.get('timeLim')
+        if not cmdVar.didFail or (timeLim is not None and took >= timeLim):
+            myGlobals.durations.observedCall(actor, cmdStr, took, nominal, literal)
+        return cmdVar
@@ -0,0 +1,93 @@
+"""
+A shared service for putting Msgs onto queues at given times.
+
+Rather than sleeping in a thread and requeueing a Msg until something is
+done (e.g. a lamp warming up), a thread can ask to have a Msg put onto its
+queue at the time it next needs to look, and get on with other messages.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class Timers(object):
+    """
+    A heap of pending (time, queue, Msg) wakeups, serviced by one thread.
+
+    The thread is only started when there's something to wait for, and exits
+    when there's nothing left, so an idle Timers costs nothing. stop() it
+    before the interpreter exits, lest it be caught mid-wait as modules are
+    torn down.
+    """
+
+    def __init__(self):
+        self._heap = []                 # [when, sequence, queue, msg]; msg is None if cancelled
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len([timer for timer in self._heap if timer[3] is not None])
+
+    def add(self, when, queue, msg):
+        """Put msg onto queue at time when (as from time.time()). Returns a handle for cancel()."""
+        timer = [when, next(self._counter), queue, msg]
+        with self._cond:
+            heapq.heappush(self._heap, timer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timers")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Don't put timer's Msg onto its queue, if it hasn't been already."""
+        with self._cond:
+            timer[3] = None
+            self._cond.notify()
+
+    def pending(self, cmd):
+        """Return the handles of the timers not yet fired whose Msgs are for cmd."""
+        with self._cond:
+            return [timer for timer in self._heap if timer[3] is not None and timer[3].cmd is cmd]
+
+    def fire(self, timer):
+        """
+        Put timer's Msg onto its queue now instead of at its time, e.g. so that
+        its handler notices that we're aborting; a no-op if it's already gone.
+        """
+        with self._cond:
+            queue, msg = timer[2], timer[3]
+            timer[3] = None
+            self._cond.notify()
+        if msg is not None:
+            queue.put(msg)
+
+    def stop(self, timeout=1):
+        """Drop every pending timer, and wait (up to timeout seconds) for the thread to exit."""
+        with self._cond:
+            del self._heap[:]
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        """Put each Msg onto its queue when its time comes; return when there are none left."""
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._heap[0][3] is None:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._thread = None
+                        return
+                    timeLeft = self._heap[0][0] - time.time()
+                    if timeLeft <= 0:
+                        break
+                    self._cond.wait(timeLeft)
+                when, sequence, queue, msg = heapq.heappop(self._heap)
+            queue.put(msg)
@@ -0,0 +1,119 @@
+"""
+Send several independent commands at once, and wait on their results.
+
+actor.cmdr.call() blocks until its command finishes, so a sequence of
+independent calls (e.g. moving each spectrograph's collimator) takes the sum
+of their latencies. call_async() runs cmdr.call in the background and returns
+a CallFuture, so the sequence can send them all and wait, taking only the
+longest of their latencies.
+
+    futures = [call_async(actor="boss", forUserCmd=cmd, cmdStr=...) for sp in spN]
+    failed = [sp for sp, future in zip(spN, futures) if future.didFail]
+
+wait_first_failure() instead returns as soon as any of them fails, for when
+one failure is enough to give up on the rest.
+"""
+import threading
+
+import sopActor.myGlobals as myGlobals
+
+
+class CallFuture(object):
+    """
+    The eventual cmdVar of a cmdr.call() running in the background: via the
+    timeout policy, unless call is given to call it with instead.
+    """
+
+    def __init__(self, call=None, **kwargs):
+        self.call = call if call is not None else myGlobals.timeouts.call
+        self.kwargs = kwargs
+        self._finished = False          # the result is known
+        self._done = threading.Event()  # ... and the callbacks have been called
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._cmdVar = None
+        self._exception = None
+        self._thread = threading.Thread(target=self._call, name="call %s" % kwargs.get('actor'))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _call(self):
+        try:
+            self._cmdVar = self.call(**self.kwargs)
+        except Exception as e:
+            self._exception = e
+        with self._lock:
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+        self._done.set()
+
+    def done(self):
+        """Has the call finished (and its callbacks been called)?"""
+        return self._done.is_set()
+
+    def _wait_for_result(self):
+        if not self._finished:
+            self._done.wait()
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds (forever if None) for the call to finish. Return done()."""
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self):
+        """Wait for, and return, the call's cmdVar; re-raise anything the call raised."""
+        self._wait_for_result()
+        if self._exception is not None:
+            raise self._exception
+        return self._cmdVar
+
+    @property
+    def didFail(self):
+        """Wait for the call; True if it failed (or raised)."""
+        self._wait_for_result()
+        return self._exception is not None or self._cmdVar.didFail
+
+    def add_callback(self, callback):
+        """Call callback(self) when the call finishes (now, if it already has)."""
+        with self._lock:
+            if not self._finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+
+def call_async(call=None, **kwargs):
+    """Start actor.cmdr.call(**kwargs) (or call(**kwargs)) in the background; return its CallFuture."""
+    return CallFuture(call, **kwargs)
+
+
+def wait_all(futures):
+    """Wait for every future to finish; return their cmdVars, in order."""
+    return [future.result() for future in futures]
+
+
+def wait_first_failure(futures):
+    """
+    Wait until one of futures fails, or all of them have finished.
+    Return the first to fail (in the order they finished), or None if none did.
+    """
+    finished = threading.Event()
+    lock = threading.Lock()
+    state = dict(failed=None, left=len(futures))
+
+    def check(future):
+        with lock:
+            state['left'] -= 1
+            if state['failed'] is None and future.didFail:
+                state['failed'] = future
+            if state['failed'] is not None or state['left'] == 0:
+                finished.set()
+
+    if not futures:
+        return None
+    for future in futures:
+        future.add_callback(check)
+    finished.wait()
+    return state['failed']
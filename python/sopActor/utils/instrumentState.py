@@ -0,0 +1,193 @@
+"""
+A consistent, cached view of the instrument state that sop makes decisions on.
+"""
+import collections
+import functools
+import threading
+import time
+
+import sopActor
+import sopActor.myGlobals as myGlobals
+
+# The keywords we derive state from, per actor.
+watchedKeys = {'mcp': ('ffsStatus', 'ffLamp', 'hgCdLamp', 'neLamp',
+                       'uvLampCommandedOn', 'whtLampCommandedOn'),
+               'apogee': ('shutterLimitSwitch',),
+               'guider': ('decenter', 'mangaDither'),
+               'tcc': ('axePos',),
+               }
+# The mcp lamp keywords, and the lamp journal's names for their lamps.
+lampKeys = {'ffLamp': 'ff', 'hgCdLamp': 'hgcd', 'neLamp': 'ne'}
+
+_InstrumentState = collections.namedtuple('_InstrumentState',
+                                          ('timestamp', 'ffs', 'ffsCounts', 'ffLamp', 'hgcdLamp', 'neLamp',
+                                           'uvLamp', 'whtLamp', 'apogeeShutter', 'decentered',
+                                           'mangaDither', 'axePos'))
+
+class InstrumentState(_InstrumentState):
+    """
+    An immutable snapshot of the instrument state, made at timestamp.
+
+    ffs:  'open', 'closed', 'mixed', or None if the petals can't be read;
+          ffsCounts is the (open, closed) number of petals.
+    ffLamp, hgcdLamp, neLamp: (all on, time of last change, as the lamp journal
+          knows it), or None if unknown.
+    uvLamp, whtLamp: True if commanded on.
+    apogeeShutter: True if open, False if closed, None if indeterminate.
+    decentered: True if the guider is in decenter mode.
+    mangaDither: the current MaNGA dither position.
+    axePos: the (az, alt, rot) of the telescope.
+    """
+    __slots__ = ()
+
+    def lamp(self, queueName):
+        """
+        Return (True iff queueName's lamps are on, time of last change), or
+        None if unknown.
+        """
+        if queueName == sopActor.FF_LAMP:
+            return self.ffLamp
+        elif queueName == sopActor.HGCD_LAMP:
+            return self.hgcdLamp
+        elif queueName == sopActor.NE_LAMP:
+            return self.neLamp
+        elif queueName == sopActor.UV_LAMP:
+            return self.uvLamp, 0
+        elif queueName == sopActor.WHT_LAMP:
+            return self.whtLamp, 0
+        raise KeyError("Unknown lamp queue %s" % queueName)
+
+
+def _ffs(ffsStatus):
+    """Return the (ffs, ffsCounts) of ffsStatus."""
+    if ffsStatus is None:
+        return None, (0, 0)
+    open, closed = 0, 0
+    for s in ffsStatus:
+        if s == None:
+            return None, (0, 0)
+        open += int(s[0])
+        closed += int(s[1])
+
+    if open == 8:
+        return 'open', (open, closed)
+    elif closed == 8:
+        return 'closed', (open, closed)
+    else:
+        return 'mixed', (open, closed)
+
+def _lamp(status):
+    """Return (True iff all lamps in status are on, time status last changed), or None."""
+    if status == None or any(x == None for x in status):
+        return None
+    return sum(status) == 4, status.timestamp
+
+def _shutter(shutterStatus):
+    """Return True if shutterStatus says open, False if closed, and None if indeterminate"""
+    if shutterStatus is None:
+        return None
+    elif shutterStatus[0] and not shutterStatus[1]:
+        return True
+    elif shutterStatus[1] and not shutterStatus[0]:
+        return False
+    return None
+
+
+class InstrumentStateCache(object):
+    """
+    Subscribe to the keywords in watchedKeys, and keep an InstrumentState
+    snapshot up to date with them, so that readers needn't re-derive it.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self._lock = threading.Lock()
+        self._subscribed = {}           # actor: the model we have callbacks on
+        self._generation = 0            # bumped whenever a watched keyword changes
+        self._snapshot = None
+        self._snapshotGeneration = None
+
+    def _subscribe(self):
+        """Register for the watched keywords of any models we aren't listening to yet."""
+        for actor, keys in watchedKeys.items():
+            model = self.models.get(actor)
+            if model is None or self._subscribed.get(actor) is model:
+                continue
+            for key in keys:
+                if key in model.keyVarDict:
+                    model.keyVarDict[key].addCallback(self._invalidate, callNow=False)
+                    if actor == 'mcp' and key in lampKeys:
+                        model.keyVarDict[key].addCallback(functools.partial(self._lampChanged, lampKeys[key]),
+                                                          callNow=False)
+            self._subscribed[actor] = model
+            self._generation += 1
+
+    def _invalidate(self, keyVar=None):
+        """A watched keyword changed: the next snapshot() will be a fresh one."""
+        with self._lock:                # not a lost update, racing snapshot() or another keyword
+            self._generation += 1
+
+    def _lampChanged(self, name, keyVar):
+        """
+        A lamp keyword changed: record it in the lamp journal now, so that a
+        lamp switched off and on again between snapshots isn't judged warm.
+        """
+        status = _lamp(keyVar)
+        if status is not None:
+            myGlobals.lampJournal.observed(name, *status)
+
+    def _get(self, actor, key, index=None):
+        """Return actor's keyVar key (or its index'th value), or None if we don't have it."""
+        model = self.models.get(actor)
+        if model is None or key not in model.keyVarDict:
+            return None
+        keyVar = model.keyVarDict[key]
+        return keyVar if index is None else keyVar[index]
+
+    def _lamp(self, name, key, transitions):
+        """
+        Return lamp name's (all on, time of last change) from mcp's key, or None
+        if unknown; append it to transitions if it's news to the lamp journal.
+        """
+        status = _lamp(self._get('mcp', key))
+        if status is None:
+            return None
+        on, when = status
+        since = myGlobals.lampJournal.earliest(name, on, when)
+        if since == when:
+            transitions.append((name, on, when))
+        return on, since
+
+    def _update(self, transitions):
+        """
+        Return a new InstrumentState from the current keyword values, appending
+        the lamp transitions that should be recorded to transitions.
+        """
+        ffs, ffsCounts = _ffs(self._get('mcp', 'ffsStatus'))
+        axePos = self._get('tcc', 'axePos')
+        return InstrumentState(timestamp=time.time(),
+                               ffs=ffs, ffsCounts=ffsCounts,
+                               ffLamp=self._lamp('ff', 'ffLamp', transitions),
+                               hgcdLamp=self._lamp('hgcd', 'hgCdLamp', transitions),
+                               neLamp=self._lamp('ne', 'neLamp', transitions),
+                               uvLamp=self._get('mcp', 'uvLampCommandedOn', 0),
+                               whtLamp=self._get('mcp', 'whtLampCommandedOn', 0),
+                               apogeeShutter=_shutter(self._get('apogee', 'shutterLimitSwitch')),
+                               decentered=self._get('guider', 'decenter', 1),
+                               mangaDither=self._get('guider', 'mangaDither', 0),
+                               axePos=None if axePos is None else tuple(axePos[:3]))
+
+    def snapshot(self):
+        """Return the current InstrumentState; all its values are consistent with each other."""
+        transitions = []
+        with self._lock:
+            self._subscribe()
+            if self._snapshot is None or self._snapshotGeneration != self._generation:
+                generation = self._generation
+                self._snapshot = self._update(transitions)
+                self._snapshotGeneration = generation
+            snapshot = self._snapshot
+        # the journal may write to disk: not while the keyword callbacks wait on us.
+        for name, on, when in transitions:
+            myGlobals.lampJournal.observed(name, on, when)
+        return snapshot
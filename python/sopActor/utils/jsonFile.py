@@ -0,0 +1,16 @@
+"""
+Small JSON files that sop keeps across restarts (e.g. durations, the lamp journal).
+"""
+import json
+import os
+
+
+def save_json(fileName, data):
+    """
+    Write data to fileName as compact JSON, atomically: via a temporary file
+    renamed over it, so that a crash can't leave half of it.
+    """
+    tmpName = fileName + ".tmp"
+    with open(tmpName, "w") as fd:
+        json.dump(data, fd, separators=(',', ':'))
+    os.rename(tmpName, fileName)
@@ -17,6 +17,13 @@ from actorcore import TestHelper
 import sopActor
 
 from sopActor.bypass import Bypass
+from sopActor.timers import Timers
+from sopActor import durations
+from sopActor import timeouts
+from sopActor import lampJournal
+from sopActor import CmdState
+from sopActor import coalesce
+from sopActor import perf
 
 from sopActor.Commands.SopCmd_APO import SopCmd_APO
 from sopActor.Commands.SopCmd_LCO import SopCmd_LCO
@@ -24,6 +31,7 @@ from sopActor.Commands.SopCmd_LOCAL import SopCmd_LOCAL
 
 from sopActor.utils.gang import ApogeeGang
 from sopActor.utils.guider import GuiderState
+from sopActor.utils.instrumentState import InstrumentStateCache
 import sopActor.myGlobals as myGlobals
 
 
@@ -35,14 +43,6 @@ def FakeThread(actor,queues):
     # how to get the actual name and ID of this thread.
     name = threading.current_thread().name
     tid = [t for t in queues if name == queues[t].name][0]
-    # Let me strip out Msg members that are always there,
-    # to find useful parts of messages that are the command arguments.
-    genericMsg = sopActor.Msg(None,None)
-    genericMsg.senderName = ''
-    genericMsg.senderName0 = ''
-    genericMsg.senderQueue = None
-    genericMsg.replyQueue = None
-    redundant = set(dir(genericMsg))
     while True:
         try:
             msg = queues[tid].get(timeout=2.)
@@ -50,14 +50,106 @@ def FakeThread(actor,queues):
                 #msg.cmd.inform('text="Exiting thread %s"'%name)
                 return
             else:
-                unique = set(dir(msg)) - redundant
-                txt = ' '.join(['='.join((str(u),str(getattr(msg,u)))) for u in unique])
+                # just the useful parts of messages that are the command arguments.
+                data = msg.data()
+                txt = ' '.join(['='.join((str(u),str(data[u]))) for u in set(data)])
                 cmdVar = msg.cmd.call('%s %s %s'%(name,str(msg.type),txt))
                 msg.replyQueue.put(sopActor.Msg.DONE, cmd=msg.cmd, success=not cmdVar.didFail)
         except Queue.Empty:
             actor.bcast.diag('text="%s alive"' % name)
 
 
+class FakeCmd(object):
+    """
+    A cmd that just remembers what it was told, for tests of the parts of sop
+    that don't need a whole actor. messages is every (level, msg), in order,
+    with levels as in TestHelper.Cmd: 'd', 'i', 'w', 'e', ':' (finish) and 'f' (fail).
+    """
+    def __init__(self):
+        self.messages = []
+
+    def _levels(self, levels):
+        return [msg for level, msg in self.messages if level in levels]
+
+    @property
+    def informs(self):
+        return self._levels('i')
+
+    @property
+    def warns(self):
+        return self._levels('w')
+
+    def diag(self, msg):
+        self.messages.append(('d', msg))
+
+    def inform(self, msg):
+        self.messages.append(('i', msg))
+
+    respond = inform
+
+    def warn(self, msg):
+        self.messages.append(('w', msg))
+
+    def error(self, msg):
+        self.messages.append(('e', msg))
+
+    def finish(self, msg=''):
+        self.messages.append((':', msg))
+
+    def fail(self, msg=''):
+        self.messages.append(('f', msg))
+
+
+class FakeCmdVar(object):
+    """What a FakeCmdr's call returns."""
+    def __init__(self, didFail=False):
+        self.didFail = didFail
+
+
+class FakeCmdr(object):
+    """
+    A cmdr that remembers the timeLims it was called with, and fails every
+    call if didFail. Each call takes took seconds of clock, if it has one
+    (anything with a settable now).
+    """
+    def __init__(self):
+        self.timeLims = []
+        self.didFail = False
+        self.clock = None
+        self.took = 0
+
+    def call(self, actor=None, cmdStr=None, timeLim=None, **kwargs):
+        self.timeLims.append(timeLim)
+        if self.clock is not None:
+            self.clock.now += self.took
+        return FakeCmdVar(self.didFail)
+
+
+class FakeActor(object):
+    """An actor with a FakeCmdr, and a FakeCmd to broadcast on."""
+    def __init__(self):
+        self.cmdr = FakeCmdr()
+        self.bcast = FakeCmd()
+
+
+class FakeModel(object):
+    """An actor's model, holding the given keyVars (e.g. FakeModel(axePos=[121, 30, 0]))."""
+    def __init__(self, **keyVars):
+        self.keyVarDict = keyVars
+
+
+class FakeActorState(object):
+    """The parts of an actorState that the parts of sop under test look for."""
+    def __init__(self, queues=None, models=None, actor=None):
+        self.queues = queues if queues is not None else {}
+        self.threads = {}
+        self.models = models if models is not None else {}
+        self.actor = actor
+        self.aborting = False
+        self.ignoreAborting = False
+        self.timeout = 1
+
+
 def updateModel(name,model):
     """Update the named actorState model with new parameters."""
     myGlobals.actorState.models[name] = TestHelper.Model(name,model)
@@ -77,6 +169,7 @@ class SopTester(TestHelper.ActorTester):
         myGlobals.actorState = self.actorState
         actorState = myGlobals.actorState
         actorState.guiderState = GuiderState(actorState.models["guider"])
+        actorState.instrumentState = InstrumentStateCache(actorState.models)
         actorState.apogeeGang = ApogeeGang()
         actorState.threads = {} # so things that look for threads here don't fail.
 
@@ -86,6 +179,15 @@ class SopTester(TestHelper.ActorTester):
         # so we can set bypasses!
         myGlobals.bypass = Bypass()
         self._clear_bypasses()
+        myGlobals.timers = Timers()
+        myGlobals.durations = durations.Durations()
+        myGlobals.timeouts = timeouts.TimeoutPolicy()
+        myGlobals.lampJournal = lampJournal.LampJournal()
+        CmdState.statusKeys.clear()
+        # the cmd_calls expectations are of the full output: tests of incremental output ask for it.
+        CmdState.incremental = False
+        myGlobals.coalescer = coalesce.Coalescer()
+        myGlobals.perf = perf.Perf()
 
         # because we use bcast and cmdr in sop often (whether we should is a separate question)
         self.actor.bcast = self.cmd
@@ -133,7 +235,7 @@ class SopTester(TestHelper.ActorTester):
         """Clear all bypasses, so they don't screw up other tests."""
         self.cmd.verbose = False
         for name in myGlobals.bypass._bypassed:
-            myGlobals.bypass._bypassed[name] = False
+            myGlobals.bypass.set(name, False)
         self.cmd.clear_msgs()
         self.cmd.verbose = self.verbose
 
@@ -231,6 +333,7 @@ class SopThreadTester(SopTester,unittest.TestCase):
 
     def tearDown(self):
         self.killQueues()
+        myGlobals.timers.stop()
         sys.stderr.flush()
         sys.stdout.flush()
         # give a newline after everything's done.
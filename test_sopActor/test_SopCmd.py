@@ -9,10 +9,12 @@ correctly when called via a SopCmd (assuming test_masterThread clears).
 """
 import unittest
 import threading
+import time
 
 import sopActor
 import sopActor.myGlobals as myGlobals
 from sopActor import Queue, CmdState
+from sopActor import lampThreads
 
 from actorcore import TestHelper
 import sopTester
@@ -392,6 +394,73 @@ class TestStatus(SopCmdTester,unittest.TestCase):
     def test_status_noFinish(self):
         self.sopCmd.status(self.cmd,finish=False)
         self._check_cmd(0,53,0,0,False)
+    def test_status_geek_lamps(self):
+        """Every lamp thread answers the probe, including the ignored uv and wht."""
+        lamps = [('ff', sopActor.FF_LAMP, lampThreads.ff_main),
+                 ('hgcd', sopActor.HGCD_LAMP, lampThreads.hgcd_main),
+                 ('ne', sopActor.NE_LAMP, lampThreads.ne_main),
+                 ('uv', sopActor.UV_LAMP, lampThreads.uv_main),
+                 ('wht', sopActor.WHT_LAMP, lampThreads.wht_main)]
+        for tname, tid, target in lamps:
+            self.actorState.queues[tid] = Queue(tname, 0)
+            self.actorState.threads[tid] = threading.Thread(target=target, name=tname,
+                                                            args=[self.actor, self.actorState.queues])
+            self.actorState.threads[tid].daemon = True
+            self.actorState.threads[tid].start()
+        try:
+            start = time.time()
+            self._run_cmd('status geek', None)
+            self.assertLess(time.time() - start, 5)
+            self.assertTrue(self.cmd.finished)
+            self.assertFalse(self.cmd.didFail)
+            probe = [m for m in self.cmd.messages if m.startswith('threadProbe=')]
+            self.assertEqual(len(probe), 1)
+            for tname, tid, target in lamps:
+                self.assertIn('"%s","ok",' % tname, probe[0])
+        finally:
+            for tname, tid, target in lamps:
+                self.actorState.queues[tid].put(sopActor.Msg.EXIT, None)
+                self.actorState.threads[tid].join(1)
+            self.actorState.threads = {}
+    def test_status_cached(self):
+        self.sopCmd.status(self.cmd,finish=False)
+        lines = self.sopCmd._statusCache[None][1]
+        self.sopCmd.status(self.cmd,finish=False)
+        self.assertIs(self.sopCmd._statusCache[None][1], lines)
+        self._check_cmd(0,106,0,0,False)
+    def test_status_cached_changed(self):
+        self.sopCmd.status(self.cmd,finish=False)
+        self.actorState.doBossScience.nExp = 5
+        self.sopCmd.status(self.cmd,finish=False)
+        self.assertIn(('inform', 'doBossScience_nExp=0,5'), self.sopCmd._statusCache[None][1])
+    def test_status_cached_changed_in_place(self):
+        self.sopCmd.status(self.cmd,finish=False)
+        self.actorState.doApogeeScience.set_apogee_expTime(1000.)
+        self.actorState.doBossScience.stages['expose'] = 'running'
+        self.sopCmd.status(self.cmd,finish=False)
+        msgs = [msg for level, msg in self.sopCmd._statusCache[None][1]]
+        self.assertTrue(any('doApogeeScience_expTime=1000.0,1000.0' in msg for msg in msgs))
+        self.assertIn('doBossScienceState="idle","OK","running"', msgs)
+    def test_status_cached_unreported(self):
+        """A change to something status doesn't report doesn't force a re-render."""
+        self.sopCmd.status(self.cmd,finish=False)
+        lines = self.sopCmd._statusCache[None][1]
+        self.actorState.doApogeeScience.aborted = True
+        self.sopCmd.status(self.cmd,finish=False)
+        self.assertIs(self.sopCmd._statusCache[None][1], lines)
+    def test_status_cached_bypass(self):
+        self.sopCmd.status(self.cmd,finish=False)
+        myGlobals.bypass.set('axes')
+        self.sopCmd.status(self.cmd,finish=False)
+        self._check_cmd(0,105,1,0,False)
+    def test_status_changedOnly(self):
+        """Nothing has changed since initCommands output everything."""
+        self.sopCmd.status(self.cmd,finish=False,changedOnly=True)
+        self._check_cmd(0,0,0,0,False)
+    def test_status_changedOnly_bypass(self):
+        self._prep_bypass('axes',clear=True)
+        self.sopCmd.status(self.cmd,finish=False,changedOnly=True)
+        self._check_cmd(0,0,1,0,False)
 
     def _oneCommand(self, nInfo, oneCommand):
         """
@@ -430,6 +499,23 @@ class TestStatus(SopCmdTester,unittest.TestCase):
         self._oneCommand(1,'gotoInstrumentChange')
 
 
+class TestPerf(SopCmdTester,unittest.TestCase):
+    def setUp(self):
+        super(TestPerf,self).setUp()
+        queue = myGlobals.actorState.queues[sopActor.MASTER]
+        queue.stats = myGlobals.perf
+        queue.put(sopActor.Msg.STATUS, None)
+        queue.get(timeout=0)
+        queue.done()
+    def test_perf(self):
+        self._run_cmd('perf', None)
+        self._check_cmd(0,2,0,0,True)
+    def test_perf_clear(self):
+        self._run_cmd('perf clear', None)
+        self._check_cmd(0,2,0,0,True)
+        self.assertEqual(myGlobals.perf.waits, {})
+
+
 class TestGotoGangChange(SopCmdTester,unittest.TestCase):
     def _gotoGangChange(self, nCart, survey, args, expect):
         allStages = ['domeFlat','slew']
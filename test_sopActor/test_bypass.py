@@ -66,6 +66,12 @@ class TestBypass(unittest.TestCase):
     def test_set_lamp_ff(self):
         self._set_bypass('lamp_ff')
 
+    def test_set_version(self):
+        version = self.bypass.version
+        self.bypass.set('axes')
+        self.bypass.clear_gang_bypasses()
+        self.assertEqual(self.bypass.version, version + 2)
+
     def test_set_bad(self):
         result = self.bypass.set('NotARealBypass')
         self.assertIsNone(result)
@@ -0,0 +1,82 @@
+"""
+Test sending commands in the background with call_async.
+"""
+import threading
+import unittest
+
+from sopActor.utils.calls import call_async, wait_all, wait_first_failure
+
+import sopTester
+
+class TestCalls(sopTester.SopTester,unittest.TestCase):
+    def setUp(self):
+        self.verbose = True
+        super(TestCalls,self).setUp()
+
+    def _moveColls(self, *specs):
+        return [call_async(actor="boss", forUserCmd=self.cmd, cmdStr="moveColl spec=%s" % sp)
+                for sp in specs]
+
+    def test_call_async(self):
+        future = self._moveColls('sp1')[0]
+        self.assertFalse(future.didFail)
+        self.assertTrue(future.done())
+        self.assertEqual(self.cmd.calls, ['boss moveColl spec=sp1'])
+
+    def test_call_async_call(self):
+        future = call_async(self.actorState.actor.cmdr.call,
+                            actor="boss", forUserCmd=self.cmd, cmdStr="moveColl spec=sp1")
+        self.assertFalse(future.didFail)
+        self.assertEqual(self.cmd.calls, ['boss moveColl spec=sp1'])
+
+    def test_add_callback(self):
+        called = []
+        future = self._moveColls('sp1')[0]
+        future.add_callback(called.append)
+        future.wait()
+        self.assertEqual(called, [future])
+        future.add_callback(called.append)
+        self.assertEqual(called, [future, future])
+
+    def test_wait_all(self):
+        futures = self._moveColls('sp1', 'sp2')
+        cmdVars = wait_all(futures)
+        self.assertEqual(len(cmdVars), 2)
+        self.assertItemsEqual(self.cmd.calls, ['boss moveColl spec=sp1', 'boss moveColl spec=sp2'])
+
+    def test_didFail(self):
+        """Each future says whether its own call failed, waiting for it if need be."""
+        self.cmd.failOn = 'boss moveColl spec=sp2'
+        futures = self._moveColls('sp1', 'sp2')
+        self.assertEqual([future.didFail for future in futures], [False, True])
+
+    def test_wait_first_failure(self):
+        self.cmd.failOn = 'boss moveColl spec=sp2'
+        futures = self._moveColls('sp1', 'sp2')
+        self.assertIs(wait_first_failure(futures), futures[1])
+
+    def test_wait_first_failure_none_fail(self):
+        futures = self._moveColls('sp1', 'sp2')
+        self.assertIsNone(wait_first_failure(futures))
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertIsNone(wait_first_failure([]))
+
+    def test_wait_first_failure_doesnt_wait_for_the_rest(self):
+        """A failure is returned while a slower call is still running."""
+        release = threading.Event()
+        def slow(**kwargs):
+            release.wait()
+            return self.actorState.actor.cmdr.call(**kwargs)
+        self.cmd.failOn = 'boss moveColl spec=sp2'
+        futures = [call_async(slow, actor="boss", forUserCmd=self.cmd, cmdStr="moveColl spec=sp1"),
+                   self._moveColls('sp2')[0]]
+        self.assertIs(wait_first_failure(futures), futures[1])
+        self.assertFalse(futures[0].done())
+        release.set()
+        self.assertFalse(futures[0].didFail)
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -5,6 +5,7 @@ Test creating, modifying, and destroying the many different CmdStates.
 import unittest
 import abc
 import copy
+import time
 import sopActor
 
 from actorcore import TestHelper
@@ -40,6 +41,42 @@ class TestKeywords(sopTester.SopTester,unittest.TestCase):
         self.assertFalse(self.cmdState.aborted)
         self.assertFalse(self.actorState.aborting)
 
+    def test_abort_fires_own_timers(self):
+        """Aborting wakes this command's pending timers now, but no one else's."""
+        queue = sopActor.Queue('timers', 0)
+        self.cmdState.cmd = self.cmd
+        sopActor.myGlobals.timers.add(time.time() + 100, queue, sopActor.Msg(sopActor.Msg.WAIT_UNTIL, self.cmd))
+        other = sopActor.myGlobals.timers.add(time.time() + 100, queue, sopActor.Msg(sopActor.Msg.WAIT_UNTIL, object()))
+        self.cmdState.abort()
+        self.assertIs(queue.get(timeout=1).cmd, self.cmd)
+        self.assertTrue(queue.empty())
+        self.assertEqual(len(sopActor.myGlobals.timers), 1)
+        sopActor.myGlobals.timers.cancel(other)
+
+    def test_stateVersion_reported_only(self):
+        """Only changes to what status reports make it stale."""
+        stateVersion = sopActor.CmdState.stateVersion
+        version = stateVersion.value
+        self.cmdState.aborted = True
+        self.cmdState.somethingElse = 1
+        self.assertEqual(stateVersion.value, version)
+        self.cmdState.a = self.cmdState.a
+        self.assertEqual(stateVersion.value, version)
+        self.cmdState.a = 100
+        self.assertGreater(stateVersion.value, version)
+
+    def test_stateVersion_in_place(self):
+        """Changing the keywords' defaults or the stages in place makes it stale too."""
+        stateVersion = sopActor.CmdState.stateVersion
+        version = stateVersion.value
+        self.cmdState.keywords['a'] = self.cmdState.keywords['a']
+        self.assertEqual(stateVersion.value, version)
+        self.cmdState.keywords['a'] = 100
+        self.assertGreater(stateVersion.value, version)
+        version = stateVersion.value
+        self.cmdState.stages[self.cmdState.allStages[0]] = 'running'
+        self.assertGreater(stateVersion.value, version)
+
     def test_set_item_ok(self):
         x = 1000
         self.cmdState.set('a',x)
@@ -51,6 +88,39 @@ class TestKeywords(sopTester.SopTester,unittest.TestCase):
         self.cmdState.set('a',None)
         self.assertEqual(self.cmdState.a,self.cmdState.keywords['a'])
 
+    def test_genKeys_changedOnly(self):
+        """Stages, State and keywords the first time, then only what changed."""
+        self.cmdState.genKeys(self.cmd, changedOnly=True)
+        self._check_levels(3)
+        self.cmdState.genKeys(self.cmd, changedOnly=True)
+        self._check_levels(3)
+        self.cmdState.a = 100
+        self.cmdState.genKeys(self.cmd, changedOnly=True)
+        self._check_levels(4)
+        self.assertEqual(self.cmdState.emitted.version('tester_keywords'), 2)
+        # a full dump outputs them all.
+        self.cmdState.genKeys(self.cmd)
+        self._check_levels(7)
+
+    def test_setStageState_unchanged(self):
+        sopActor.CmdState.incremental = True
+        try:
+            self.cmdState.setStageState('1','running')
+            self.cmdState.setStageState('1','running')
+            self.cmdState.setStageState('1','done')
+        finally:
+            sopActor.CmdState.incremental = False
+        self._check_levels(2)
+
+    def test_setStageState_not_incremental(self):
+        sopActor.CmdState.incremental = False
+        self.cmdState.setStageState('1','running')
+        self.cmdState.setStageState('1','running')
+        self._check_levels(2)
+
+    def _check_levels(self, nInfo):
+        self.assertEqual(self.cmd.levels.count('i'), nInfo)
+
 
 class CmdStateTester(sopTester.SopTester):
     def setUp(self):
@@ -209,7 +279,7 @@ class TestGotoGangChange(CmdStateTester,unittest.TestCase):
 
     def test_abort(self):
         super(TestGotoGangChange,self).test_abort()
-        self.assertEqual(self.cmd.calls, ['apogee expose stop', 'tcc axis stop',])
+        self.assertItemsEqual(self.cmd.calls, ['apogee expose stop', 'tcc axis stop',])
         self.assertFalse(self.cmdState.doDomeFlat)
         self.assertFalse(self.cmdState.doSlew)
 
@@ -232,7 +302,7 @@ class TestGotoField(CmdStateTester,unittest.TestCase):
         self.cmdState.setStages(['slew','calibs'])
         self._fake_boss_exposing()
         super(TestGotoField,self).test_abort()
-        self.assertEqual(self.cmd.calls, ['boss exposure stop','tcc axis stop'])
+        self.assertItemsEqual(self.cmd.calls, ['boss exposure stop','tcc axis stop'])
 
 
 class TestGotoPosition(CmdStateTester, unittest.TestCase):
@@ -652,7 +722,7 @@ class TestDoApogeeMangaSequence(CmdStateTester,unittest.TestCase):
     def test_abort(self):
         self._fake_boss_exposing()
         super(TestDoApogeeMangaSequence,self).test_abort()
-        self.assertEqual(self.cmd.calls, ['boss exposure stop','apogee expose stop'])
+        self.assertItemsEqual(self.cmd.calls, ['boss exposure stop','apogee expose stop'])
 
     def test_exposures_remain(self):
         self.assertTrue(self.cmdState.exposures_remain())
@@ -860,7 +930,7 @@ class TestDoApogeeMangaDither(CmdStateTester,unittest.TestCase):
     def test_abort(self):
         self._fake_boss_exposing()
         super(TestDoApogeeMangaDither,self).test_abort()
-        self.assertEqual(self.cmd.calls, ['boss exposure stop','apogee expose stop'])
+        self.assertItemsEqual(self.cmd.calls, ['boss exposure stop','apogee expose stop'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+"""
+Test coalescing bursts of state keywords.
+"""
+import time
+import unittest
+
+from sopActor import coalesce
+
+from sopTester import FakeCmd
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        # long enough that the timer never fires during a test.
+        self.coalescer = coalesce.Coalescer(window=60)
+        self.cmd = FakeCmd()
+
+    def tearDown(self):
+        self.coalescer.clear()
+
+    def test_first_goes_out(self):
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.assertEqual(self.cmd.informs, ['a=prepping'])
+
+    def test_burst(self):
+        """Only the last of a burst goes out, when the window ends."""
+        for state in ('prepping', 'prepped', 'running'):
+            self.coalescer.write(self.cmd, 'a', 'a=%s' % state, final=False)
+        self.assertEqual(self.cmd.informs, ['a=prepping'])
+        self.coalescer.flush()
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=running'])
+
+    def test_final(self):
+        """A final value goes out at once, replacing what's held for it."""
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=done')
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=done'])
+
+    def test_order(self):
+        """What's held goes out before anything after it."""
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.coalescer.write(self.cmd, 'b', 'b=done')
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=running', 'b=done'])
+
+    def test_say(self):
+        """Anything else the command says goes out behind what's held."""
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.cmd.warn('text="expectedDuration=10"')
+        self.assertEqual(self.cmd.messages, [('i', 'a=prepping'), ('i', 'a=running'),
+                                             ('w', 'text="expectedDuration=10"')])
+
+    def test_finish(self):
+        """A command's held states go out before it finishes."""
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.cmd.finish('text="ok"')
+        self.assertEqual(self.cmd.messages, [('i', 'a=prepping'), ('i', 'a=running'), (':', 'text="ok"')])
+
+    def test_fail_only_its_own(self):
+        """Failing one command doesn't flush what's held for another."""
+        other = FakeCmd()
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer.write(other, 'b', 'b=prepping', final=False)
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.coalescer.write(other, 'b', 'b=running', final=False)
+        self.cmd.fail('text="no"')
+        self.assertEqual(self.cmd.messages, [('i', 'a=prepping'), ('i', 'a=running'), ('f', 'text="no"')])
+        self.assertEqual(other.informs, ['b=prepping'])
+        self.coalescer.flush()
+        self.assertEqual(other.informs, ['b=prepping', 'b=running'])
+
+    def test_not_hooked(self):
+        """A command we've never held anything for is left alone."""
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.assertNotIn('finish', vars(self.cmd))
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.assertIn('finish', vars(self.cmd))
+
+    def test_window_ended(self):
+        self.coalescer.write(self.cmd, 'a', 'a=prepping', final=False)
+        self.coalescer._last['a'] -= 60
+        self.coalescer.write(self.cmd, 'a', 'a=running', final=False)
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=running'])
+
+    def test_no_window(self):
+        coalescer = coalesce.Coalescer()
+        for state in ('prepping', 'running'):
+            coalescer.write(self.cmd, 'a', 'a=%s' % state, final=False)
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=running'])
+
+    def test_timer(self):
+        coalescer = coalesce.Coalescer(window=0.1)
+        for state in ('prepping', 'prepped', 'running'):
+            coalescer.write(self.cmd, 'a', 'a=%s' % state, final=False)
+        time.sleep(0.3)
+        self.assertEqual(self.cmd.informs, ['a=prepping', 'a=running'])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -0,0 +1,104 @@
+"""
+Test learning how long things take.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from sopActor import Msg, durations
+
+class TestDurations(unittest.TestCase):
+    def setUp(self):
+        self.model = durations.Durations()
+        self.tmpdir = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tmpdir, 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _expose(self, expTime, readout=True):
+        return Msg(Msg.EXPOSE, None, expTime=expTime, expType='science', readout=readout)
+
+    def test_too_few(self):
+        self.model.observed('boss', self._expose(900), 1020)
+        self.assertIsNone(self.model.percentile('boss', self._expose(900), 50))
+
+    def test_percentiles(self):
+        for overhead in (110, 120, 130, 140, 200):
+            self.model.observed('boss', self._expose(900), 900 + overhead)
+        self.assertEqual(self.model.percentile('boss', self._expose(900), 50), 900 + 130)
+        self.assertEqual(self.model.percentile('boss', self._expose(900), 100), 900 + 200)
+
+    def test_overhead_serves_any_expTime(self):
+        for i in range(3):
+            self.model.observed('boss', self._expose(900), 1015)
+        self.assertEqual(self.model.percentile('boss', self._expose(30), 50), 145)
+
+    def test_buckets(self):
+        for i in range(3):
+            self.model.observed('boss', self._expose(900), 1015)
+        self.assertIsNone(self.model.percentile('boss', self._expose(900, readout=False), 50))
+        self.assertIsNone(self.model.percentile('ffs', self._expose(900), 50))
+
+    def test_lamp_delay(self):
+        for i in range(3):
+            self.model.observed('hgcd', Msg(Msg.LAMP_ON, None, on=True, delay=200), 202)
+        self.assertEqual(self.model.percentile('hgcd', Msg(Msg.LAMP_ON, None, on=True, delay=10), 50), 12)
+
+    def test_bounded(self):
+        for i in range(durations.maxSamples*2):
+            self.model.observed('ffs', Msg(Msg.FFS_MOVE, None, open=True), i)
+        self.assertEqual(len(self.model.samples.values()[0]), durations.maxSamples)
+        for i in range(durations.maxKeys + 10):
+            self.model.observed('boss', self._expose(900, readout=i), 1000)
+        self.assertEqual(len(self.model.samples), durations.maxKeys)
+
+    def test_calls(self):
+        for i in range(3):
+            self.model.observedCall('boss', 'exposure flat itime=30', 42, nominal=30)
+        self.assertEqual(self.model.callPercentile('boss', 'exposure flat itime=55', 50, nominal=55), 67)
+        self.assertIsNone(self.model.callPercentile('boss', 'exposure arc itime=4', 50))
+
+    def test_literal_calls(self):
+        for i in range(3):
+            self.model.observedCall('apogee', 'expose nreads=60', 660, literal=True)
+        self.assertEqual(self.model.callPercentile('apogee', 'expose nreads=60', 50, literal=True), 660)
+        self.assertIsNone(self.model.callPercentile('apogee', 'expose nreads=30', 50, literal=True))
+        self.assertIsNone(self.model.callPercentile('apogee', 'expose nreads=60', 50))
+
+    def test_calls_free_text(self):
+        """An APOGEE exposure's comment doesn't file it under a key of its own."""
+        for comment in ('"dither A"', '"a \\"quoted\\" 2nd"', '"B"'):
+            self.model.observedCall('apogee', 'expose time=500 object=object comment=%s' % comment,
+                                    510, nominal=500)
+        self.assertEqual(len(self.model.samples), 1)
+        self.assertEqual(self.model.callPercentile('apogee', 'expose time=1000 object=object comment="C"',
+                                                   50, nominal=1000), 1010)
+
+    def test_not_learning(self):
+        self.model.learning = False
+        for i in range(3):
+            self.model.observed('boss', self._expose(900), 1015)
+        self.assertEqual(len(self.model.samples), 0)
+
+    def test_save_and_load(self):
+        self.model.load(self.fileName)
+        for overhead in (10, 20, 30):
+            self.model.observed('ffs', Msg(Msg.FFS_MOVE, None, open=True), overhead)
+        self.model.save()
+        model = durations.Durations()
+        model.load(self.fileName)
+        self.assertEqual(model.percentile('ffs', Msg(Msg.FFS_MOVE, None, open=True), 50), 20)
+
+    def test_load_damaged(self):
+        with open(self.fileName, 'w') as fd:
+            fd.write('[["ffs,FFS_MOVE,open=True",[1,')
+        self.model.load(self.fileName)
+        self.assertEqual(len(self.model.samples), 0)
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -0,0 +1,121 @@
+"""
+Test running queue handlers on an Executor's pool.
+"""
+import threading
+import time
+import unittest
+
+from sopActor import Queue, Msg, myGlobals
+from sopActor.bypass import Bypass
+from sopActor.coalesce import Coalescer
+from sopActor.durations import Durations
+from sopActor.executor import Executor
+from sopActor.multiCommand import MultiCommand
+
+from sopTester import FakeCmd, FakeActor, FakeActorState
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = Executor(FakeActor(), 2)
+        self.executor.start()
+        self.handled = []
+        self.lock = threading.Lock()
+        self.running = {}
+
+    def _handler(self, name, delay=0):
+        """A handler that records what it handled, and checks it isn't run concurrently."""
+        def handler(msg):
+            with self.lock:
+                self.assertFalse(self.running.get(name))
+                self.running[name] = True
+            time.sleep(delay)
+            with self.lock:
+                self.handled.append((name, msg.n))
+                self.running[name] = False
+            return msg.type != Msg.EXIT
+        return handler
+
+    def _wait(self, n, timeout=2):
+        start = time.time()
+        while len(self.handled) < n and time.time() - start < timeout:
+            time.sleep(0.01)
+
+    def test_serialized_per_queue(self):
+        queue = Queue('ff', 0)
+        self.executor.register(queue, self._handler('ff', delay=0.01))
+        for i in range(5):
+            queue.put(Msg.WAIT_UNTIL, None, n=i)
+        self._wait(5)
+        self.assertEqual(self.handled, [('ff', i) for i in range(5)])
+
+    def test_queues_in_parallel(self):
+        queues = [Queue('ff', 0), Queue('ne', 0)]
+        for queue in queues:
+            self.executor.register(queue, self._handler(queue.name, delay=0.2))
+        start = time.time()
+        for queue in queues:
+            queue.put(Msg.WAIT_UNTIL, None, n=0)
+        self._wait(2)
+        self.assertEqual(len(self.handled), 2)
+        self.assertLess(time.time() - start, 0.39)
+
+    def test_exit_unregisters(self):
+        queue = Queue('ffs', 0)
+        self.executor.register(queue, self._handler('ffs'))
+        queue.put(Msg.EXIT, None, n=0)
+        self._wait(1)
+        time.sleep(0.05)
+        self.assertNotIn(queue, self.executor)
+        queue.put(Msg.WAIT_UNTIL, None, n=1)
+        time.sleep(0.05)
+        self.assertEqual(self.handled, [('ffs', 0)])
+        self.assertFalse(queue.empty())
+
+    def test_messages_put_before_register(self):
+        queue = Queue('gcamera', 0)
+        queue.put(Msg.WAIT_UNTIL, None, n=0)
+        self.executor.register(queue, self._handler('gcamera'))
+        self._wait(1)
+        self.assertEqual(self.handled, [('gcamera', 0)])
+
+
+class TestExecutorReplies(unittest.TestCase):
+    """Replies from the pool should look like they came from the queue's own thread."""
+    def setUp(self):
+        self.saved = dict((name, getattr(myGlobals, name, None))
+                          for name in ('actorState', 'bypass', 'durations', 'coalescer'))
+        self.queue = Queue('ffs', 0)
+        myGlobals.actorState = FakeActorState(queues={'ffs': self.queue})
+        myGlobals.bypass = Bypass()
+        myGlobals.durations = Durations()
+        myGlobals.coalescer = Coalescer()
+        self.executor = Executor(FakeActor(), 3)
+        self.executor.start()
+        self.executor.register(self.queue, self._fail)
+        self.cmd = FakeCmd()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(myGlobals, name, value)
+
+    def _fail(self, msg):
+        msg.replyQueue.put(Msg.FFS_COMPLETE, cmd=msg.cmd, success=False)
+
+    def _run(self):
+        multiCmd = MultiCommand(self.cmd, 2, None)
+        multiCmd.append('ffs', Msg.FFS_MOVE, open=True)
+        return multiCmd.run()
+
+    def test_fails(self):
+        self.assertFalse(self._run())
+
+    def test_bypassed(self):
+        myGlobals.bypass.set('ffs')
+        self.assertTrue(self._run())
+        self.assertEqual(self.cmd.warns, ['text="System ffs failed but is bypassed"'])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
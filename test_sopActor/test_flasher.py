@@ -0,0 +1,104 @@
+"""
+Test timing FF lamp flashes to the APOGEE reads.
+"""
+import time
+import unittest
+
+from sopActor import Msg, durations, flasher, lampJournal
+import sopActor.myGlobals as myGlobals
+
+from sopTester import FakeCmd
+
+class FakeLampQueue(object):
+    """The FF lamp thread's queue: keeps the Msgs, for the test to reply to."""
+    def __init__(self):
+        self.msgs = []
+
+    def put(self, msgType, cmd=None, **kwargs):
+        self.msgs.append(Msg(msgType, cmd, **kwargs))
+
+
+class TestFlashScheduler(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict((name, getattr(myGlobals, name, None)) for name in ('durations', 'lampJournal'))
+        myGlobals.durations = durations.Durations()
+        myGlobals.lampJournal = lampJournal.LampJournal()
+        self.cmd = FakeCmd()
+        self.later = []
+        self.lampQueue = FakeLampQueue()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(myGlobals, name, value)
+
+    def _callLater(self, seconds, function, *args):
+        self.later.append((seconds, function, args))
+
+    def _reply(self, msg, success=True):
+        """Reply to msg as the lamp thread does."""
+        msg.replyQueue.put(Msg.LAMP_COMPLETE, cmd=msg.cmd, success=success)
+
+    def _scheduler(self, pattern=(3,)):
+        return flasher.FlashScheduler(self.cmd, pattern, callLater=self._callLater,
+                                      lampQueue=self.lampQueue)
+
+    def test_window_default(self):
+        scheduler = self._scheduler()
+        onAt, offAt = scheduler.window(100)
+        middle = 100 + flasher.readInterval/2 - flasher.defaultLatency
+        self.assertAlmostEqual(onAt, middle - flasher.flashTime/2)
+        self.assertAlmostEqual(offAt, middle + flasher.flashTime/2)
+
+    def test_window_measured(self):
+        scheduler = self._scheduler()
+        scheduler.reads = [0, 10, 20]
+        for i in range(5):
+            myGlobals.durations.observedCall('mcp', 'ff.on', 0.2)
+        onAt, offAt = scheduler.window(20)
+        self.assertAlmostEqual(onAt, 20 + 5 - 0.1 - flasher.flashTime/2)
+
+    def test_only_pattern_reads(self):
+        scheduler = self._scheduler(pattern=(3, 5))
+        now = time.time()
+        for i in range(2):
+            scheduler.read(now + 10*i)
+        self.assertEqual(self.later, [])
+        scheduler.read(now + 20)
+        self.assertEqual([args for seconds, function, args in self.later], [(0, True), (0, False)])
+        self.assertFalse(scheduler.scheduled())
+        scheduler.read(now + 30)
+        scheduler.read(now + 40)
+        self.assertEqual(len(self.later), 4)
+        self.assertTrue(scheduler.scheduled())
+
+    def test_onTime(self):
+        scheduler = self._scheduler(pattern=(1,))
+        scheduler.read()
+        for seconds, function, args in self.later:
+            function(*args)
+        onMsg, offMsg = self.lampQueue.msgs
+        self.assertEqual((onMsg.type, onMsg.on, offMsg.type, offMsg.on),
+                         (Msg.LAMP_ON, True, Msg.LAMP_ON, False))
+        self._reply(onMsg)
+        self.assertEqual(self.cmd.informs, [])
+        self._reply(offMsg)
+        self.assertEqual(len(self.cmd.informs), 1)
+        self.assertTrue(self.cmd.informs[0].startswith('apogeeFlash=1,1,'))
+
+    def test_failed(self):
+        """The lamp thread failed to turn them on (and they aren't bypassed)."""
+        scheduler = self._scheduler(pattern=(1,))
+        scheduler.read()
+        for seconds, function, args in self.later:
+            function(*args)
+        onMsg, offMsg = self.lampQueue.msgs
+        self._reply(onMsg, success=False)
+        self._reply(offMsg)
+        self.assertEqual(len(self.cmd.warns), 1)
+        self.assertEqual(self.cmd.informs, [])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
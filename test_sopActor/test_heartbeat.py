@@ -0,0 +1,182 @@
+"""
+Test the one heartbeat for all of sop's threads.
+"""
+import threading
+import time
+import unittest
+
+import sopActor
+from sopActor import heartbeat
+
+from sopTester import FakeCmd, FakeActorState
+
+class FakeThread(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+class Responder(threading.Thread):
+    """Answer STATUS the way sop's threads do, after taking delay seconds over it."""
+    def __init__(self, queue, delay=0):
+        threading.Thread.__init__(self, name=queue.name)
+        self.daemon = True
+        self.queue = queue
+        self.delay = delay
+
+    def run(self):
+        while True:
+            msg = self.queue.get()
+            if msg.type == sopActor.Msg.EXIT:
+                return
+            time.sleep(self.delay)
+            msg.replyQueue.put(sopActor.Msg.REPLY, cmd=msg.cmd, success=True)
+
+
+class TestHeartbeat(unittest.TestCase):
+    def setUp(self):
+        self.heartbeat = heartbeat.Heartbeat(interval=60, stale=180)
+        self.actorState = FakeActorState()
+        self.cmd = FakeCmd()
+
+    def _queue(self, tid, name, alive=True):
+        queue = sopActor.Queue(name, 0)
+        self.actorState.queues[tid] = queue
+        self.actorState.threads[tid] = FakeThread(alive)
+        return queue
+
+    def _states(self, now=None):
+        return [(name, state) for name, state, age, depth in self.heartbeat.health(self.actorState, now)]
+
+    def test_idle(self):
+        queue = self._queue(sopActor.BOSS, 'boss')
+        self.assertRaises(queue.Empty, queue.get, timeout=0)
+        self.assertEqual(self.heartbeat.health(self.actorState), [('boss', 'idle', -1, 0)])
+
+    def test_busy(self):
+        """A thread handling a message is busy for as long as the message should take."""
+        queue = self._queue(sopActor.BOSS, 'boss')
+        queue.put(sopActor.Msg.STATUS, None, duration=1000)
+        queue.put(sopActor.Msg.STATUS, None)
+        queue.get(timeout=0)
+        (name, state, age, depth), = self.heartbeat.health(self.actorState, time.time() + 1100)
+        self.assertEqual((state, depth), ('busy', 1))
+        self.assertGreater(age, 1099)
+
+    def test_hung(self):
+        """A handler that's overrun what its message should take by more than stale is stale."""
+        queue = self._queue(sopActor.BOSS, 'boss')
+        queue.put(sopActor.Msg.STATUS, None, duration=1000)
+        queue.get(timeout=0)
+        self.assertEqual(self._states(time.time() + 1000 + 170), [('boss', 'busy')])
+        self.assertEqual(self._states(time.time() + 1000 + 190), [('boss', 'stale')])
+
+    def test_long_sequence(self):
+        """A master sequence has no expected duration, so is busy however long it runs."""
+        queue = self._queue(sopActor.MASTER, 'master')
+        queue.put(sopActor.Msg.DO_BOSS_SCIENCE, None)
+        queue.get(timeout=0)
+        self.assertEqual(self._states(time.time() + 600), [('master', 'busy')])
+
+    def test_dead(self):
+        self._queue(sopActor.BOSS, 'boss', alive=False)
+        self.assertEqual(self._states(), [('boss', 'dead')])
+
+    def test_executor(self):
+        """Queues handled by an executor have no thread to be stale."""
+        queue = self._queue(sopActor.FFS, 'ffs', alive=False)
+        queue.executor = object()
+        self.assertRaises(queue.Empty, queue.get, timeout=0)
+        self.assertEqual(self._states(time.time() + 1000), [('ffs', 'idle')])
+
+    def test_report(self):
+        self._queue(sopActor.MASTER, 'master')
+        self._queue(sopActor.BOSS, 'boss', alive=False)
+        self.heartbeat.report(self.cmd, self.actorState)
+        self.assertEqual(len(self.cmd.informs), 1)
+        self.assertTrue(self.cmd.informs[0].startswith('threadHealth="'))
+        self.assertIn('"boss","dead",-1.0,0', self.cmd.informs[0])
+        self.assertEqual(self.cmd.warns, ['text="sop threads hung or not checking in: boss (dead)"'])
+
+    def test_report_ok(self):
+        self._queue(sopActor.MASTER, 'master')
+        self.heartbeat.report(self.cmd, self.actorState)
+        self.assertEqual(self.cmd.warns, [])
+
+
+class TestProbe(unittest.TestCase):
+    def setUp(self):
+        self.heartbeat = heartbeat.Heartbeat()
+        self.actorState = FakeActorState()
+        self.cmd = FakeCmd()
+        self.responders = []
+
+    def tearDown(self):
+        for responder in self.responders:
+            responder.queue.put(sopActor.Msg.EXIT, None)
+
+    def _responder(self, tid, name, delay=0):
+        queue = sopActor.Queue(name, 0)
+        responder = Responder(queue, delay)
+        self.actorState.queues[tid] = queue
+        self.actorState.threads[tid] = responder
+        self.responders.append(responder)
+        responder.start()
+        return queue
+
+    def test_ok(self):
+        self._responder(sopActor.MASTER, 'master')
+        self._responder(sopActor.BOSS, 'boss', delay=0.1)
+        probe = self.heartbeat.probe(self.cmd, self.actorState, timeout=5)
+        self.assertEqual([(name, state) for name, state, latency in probe],
+                         [('boss', 'ok'), ('master', 'ok')])
+        self.assertGreaterEqual(probe[0][2], 0.1)
+
+    def test_parallel(self):
+        """Threads are asked at once, so the probe takes as long as the slowest."""
+        for tid, name in [(sopActor.MASTER, 'master'), (sopActor.BOSS, 'boss'),
+                          (sopActor.SLEW, 'slew')]:
+            self._responder(tid, name, delay=0.3)
+        start = time.time()
+        probe = self.heartbeat.probe(self.cmd, self.actorState, timeout=5)
+        self.assertLess(time.time() - start, 0.8)
+        self.assertEqual(set(state for name, state, latency in probe), set(['ok']))
+
+    def test_busy(self):
+        """A thread in the middle of something else is busy, and doesn't hold up the probe."""
+        queue = self._responder(sopActor.MASTER, 'master', delay=60)
+        queue.put(sopActor.Msg.STATUS, None, replyQueue=sopActor.Queue('ignored', 0))
+        while queue._current is None:
+            time.sleep(0.01)
+        self._responder(sopActor.BOSS, 'boss')
+        start = time.time()
+        probe = self.heartbeat.probe(self.cmd, self.actorState, timeout=5)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual([(name, state) for name, state, latency in probe],
+                         [('boss', 'ok'), ('master', 'busy')])
+        self.assertEqual(queue.qsize(), 0)
+
+    def test_failed(self):
+        """A thread that isn't busy, but doesn't answer, fails once the timeout's passed."""
+        self.actorState.queues[sopActor.BOSS] = sopActor.Queue('boss', 0)
+        self.actorState.threads[sopActor.BOSS] = FakeThread()
+        probe = self.heartbeat.probe(self.cmd, self.actorState, timeout=0.2)
+        (name, state, latency), = probe
+        self.assertEqual((name, state), ('boss', 'failed'))
+        self.assertGreaterEqual(latency, 0.2)
+
+    def test_dead(self):
+        self.actorState.queues[sopActor.BOSS] = sopActor.Queue('boss', 0)
+        self.actorState.threads[sopActor.BOSS] = FakeThread(alive=False)
+        self.assertEqual(self.heartbeat.probe(self.cmd, self.actorState, timeout=5),
+                         [('boss', 'dead', -1)])
+
+    def test_nothing(self):
+        self.assertEqual(self.heartbeat.probe(self.cmd, self.actorState, timeout=5), [])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
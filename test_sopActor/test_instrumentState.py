@@ -0,0 +1,121 @@
+"""
+Test the cached instrument state snapshots that preconditions are judged by.
+"""
+import unittest
+
+from actorcore import TestHelper
+
+import sopActor
+from sopActor import Msg
+import sopActor.myGlobals as myGlobals
+from sopActor.masterThread import SopPrecondition
+
+import sopTester
+
+class FakeKeyVar(list):
+    """A lamp keyVar's values, heard at timestamp."""
+    def __init__(self, values, timestamp):
+        list.__init__(self, values)
+        self.timestamp = timestamp
+class TestInstrumentState(sopTester.SopTester,unittest.TestCase):
+    def setUp(self):
+        self.verbose = True
+        super(TestInstrumentState,self).setUp()
+        self.cache = self.actorState.instrumentState
+
+    def test_ffs_closed(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['all_off'])
+        state = self.cache.snapshot()
+        self.assertEqual(state.ffs, 'closed')
+        self.assertEqual(state.ffsCounts, (0, 8))
+    def test_ffs_open(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['boss_science'])
+        self.assertEqual(self.cache.snapshot().ffs, 'open')
+
+    def test_lamps_off(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['all_off'])
+        state = self.cache.snapshot()
+        self.assertFalse(state.lamp(sopActor.FF_LAMP)[0])
+        self.assertFalse(state.lamp(sopActor.HGCD_LAMP)[0])
+        self.assertFalse(state.lamp(sopActor.NE_LAMP)[0])
+    def test_arcs_on(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['arcs'])
+        state = self.cache.snapshot()
+        self.assertFalse(state.lamp(sopActor.FF_LAMP)[0])
+        self.assertTrue(state.lamp(sopActor.HGCD_LAMP)[0])
+        self.assertTrue(state.lamp(sopActor.NE_LAMP)[0])
+    def test_lamp_journal(self):
+        """A lamp the journal knows has been on longer is judged by that, not the keyword."""
+        sopTester.updateModel('mcp',TestHelper.mcpState['arcs'])
+        since = self.cache.snapshot().lamp(sopActor.HGCD_LAMP)[1]
+        myGlobals.lampJournal.commanded('hgcd', True, since - 600)
+        self.cache._invalidate()
+        self.assertEqual(self.cache.snapshot().lamp(sopActor.HGCD_LAMP), (True, since - 600))
+    def test_lamp_journal_outside_lock(self):
+        """New lamp states are recorded in the journal, but not while holding the snapshot lock."""
+        sopTester.updateModel('mcp',TestHelper.mcpState['arcs'])
+        locked = []
+        observed = myGlobals.lampJournal.observed
+        def check(name, on, when):
+            locked.append(self.cache._lock.locked())
+            return observed(name, on, when)
+        myGlobals.lampJournal.observed = check
+        try:
+            state = self.cache.snapshot()
+        finally:
+            del myGlobals.lampJournal.observed
+        self.assertEqual(locked, [False]*3)
+        self.assertEqual(myGlobals.lampJournal.since('hgcd'), state.lamp(sopActor.HGCD_LAMP))
+    def test_lamp_keyword_between_snapshots(self):
+        """A lamp turned off and on again between snapshots is judged from when it came back on."""
+        sopTester.updateModel('mcp',TestHelper.mcpState['arcs'])
+        since = self.cache.snapshot().lamp(sopActor.HGCD_LAMP)[1]
+        self.cache._lampChanged('hgcd', FakeKeyVar([0]*4, since + 1000))
+        self.cache._lampChanged('hgcd', FakeKeyVar([1]*4, since + 1100))
+        self.assertEqual(myGlobals.lampJournal.since('hgcd'), (True, since + 1100))
+        self.assertEqual(myGlobals.lampJournal.earliest('hgcd', True, since + 1100), since + 1100)
+    def test_unknown_lamp(self):
+        self.assertRaises(KeyError, self.cache.snapshot().lamp, sopActor.FFS)
+
+    def test_apogee_shutter(self):
+        sopTester.updateModel('apogee',TestHelper.apogeeState['B_open'])
+        self.assertTrue(self.cache.snapshot().apogeeShutter)
+        sopTester.updateModel('apogee',TestHelper.apogeeState['A_closed'])
+        self.assertFalse(self.cache.snapshot().apogeeShutter)
+
+    def test_snapshot_is_cached(self):
+        state = self.cache.snapshot()
+        self.assertIs(self.cache.snapshot(), state)
+    def test_snapshot_invalidated(self):
+        state = self.cache.snapshot()
+        self.cache._invalidate()
+        self.assertIsNot(self.cache.snapshot(), state)
+    def test_snapshot_new_model(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['all_off'])
+        state = self.cache.snapshot()
+        sopTester.updateModel('mcp',TestHelper.mcpState['boss_science'])
+        self.assertIsNot(self.cache.snapshot(), state)
+        self.assertEqual(self.cache.snapshot().ffs, 'open')
+
+    def test_precondition_ffs(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['all_off'])
+        self.assertTrue(SopPrecondition(sopActor.FFS, Msg.FFS_MOVE, open=True).required())
+        self.assertFalse(SopPrecondition(sopActor.FFS, Msg.FFS_MOVE, open=False).required())
+    def test_precondition_lamp(self):
+        sopTester.updateModel('mcp',TestHelper.mcpState['arcs'])
+        self.assertTrue(SopPrecondition(sopActor.NE_LAMP, Msg.LAMP_ON, on=False).required())
+        self.assertFalse(SopPrecondition(sopActor.FF_LAMP, Msg.LAMP_ON, on=False).required())
+    def test_precondition_warmup(self):
+        """The warmup delay goes in the Msg's data, leaving the precondition's own kwargs alone."""
+        sopTester.updateModel('mcp',TestHelper.mcpState['all_off'])
+        pre = SopPrecondition(sopActor.HGCD_LAMP, Msg.LAMP_ON, on=True)
+        self.assertTrue(pre.required())
+        self.assertEqual(pre.kwargs, {'on':True})
+        delay = int(myGlobals.warmupTime[sopActor.HGCD_LAMP])
+        self.assertEqual(pre.msgKwargs(), {'on':True, 'delay':delay, 'duration':delay})
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
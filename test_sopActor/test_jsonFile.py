@@ -0,0 +1,44 @@
+"""
+Test saving sop's small JSON files.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sopActor.utils.jsonFile import save_json
+
+class TestSaveJson(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tmpdir, 'data.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self):
+        with open(self.fileName) as fd:
+            return json.load(fd)
+
+    def test_save(self):
+        save_json(self.fileName, {'hgcd': [True, 100.0]})
+        self.assertEqual(self._load(), {'hgcd': [True, 100.0]})
+        self.assertEqual(os.listdir(self.tmpdir), ['data.json'])
+
+    def test_replaces(self):
+        save_json(self.fileName, [1, 2])
+        save_json(self.fileName, [3])
+        self.assertEqual(self._load(), [3])
+
+    def test_failed_write_keeps_old(self):
+        """A save that fails part way leaves the last good file as it was."""
+        save_json(self.fileName, [1, 2])
+        self.assertRaises(TypeError, save_json, self.fileName, [object()])
+        self.assertEqual(self._load(), [1, 2])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -0,0 +1,102 @@
+"""
+Test predicting how long slews take, and choosing where to slew to.
+"""
+import unittest
+
+from sopActor import kinematics
+from sopActor.kinematics import Axis, Mount
+
+import sopTester
+
+class TestAxis(unittest.TestCase):
+    def setUp(self):
+        self.axis = Axis('alt', 1.5, 0.5)
+
+    def test_full_speed(self):
+        # 3 seconds each way to get up to speed, covering 4.5 degrees.
+        self.assertAlmostEqual(self.axis.moveTime(30), 30/1.5 + 3)
+        self.assertAlmostEqual(self.axis.moveTime(-30), 30/1.5 + 3)
+
+    def test_short(self):
+        self.assertAlmostEqual(self.axis.moveTime(2), 4)
+        self.assertEqual(self.axis.moveTime(0), 0)
+
+    def test_distanceIn(self):
+        for distance in (0.5, 4.5, 30, 200):
+            self.assertAlmostEqual(self.axis.distanceIn(self.axis.moveTime(distance)), distance)
+        self.assertEqual(self.axis.distanceIn(0), 0)
+
+    def test_no_accel(self):
+        axis = Axis('alt', 1.5, None)
+        self.assertAlmostEqual(axis.moveTime(-30), 20)
+        self.assertAlmostEqual(axis.distanceIn(20), 30)
+
+
+class TestMount(unittest.TestCase):
+    def setUp(self):
+        self.mount = Mount(Axis('az', 1.5, 0.5), Axis('alt', 1.5, 0.5), Axis('rot', 2.0, 1.0))
+        self.az, self.alt, self.rot = self.mount.axes
+
+    def test_slowest_axis(self):
+        self.assertAlmostEqual(self.mount.slewTime((100, 30, 0), (121, 60, 0)), self.alt.moveTime(30))
+        self.assertAlmostEqual(self.mount.slewTime((100, 30, 0), (121, 30, 90)), self.rot.moveTime(90))
+
+    def test_az_waits_for_alt_limit(self):
+        time = self.mount.slewTime((0, 10, 0), (90, 60, 0))
+        self.assertAlmostEqual(time, self.alt.moveTime(8) + self.az.moveTime(90))
+
+    def test_az_before_alt_limit(self):
+        time = self.mount.slewTime((90, 60, 0), (0, 10, 0))
+        self.assertAlmostEqual(time, self.az.moveTime(90) + self.alt.moveTime(8))
+
+    def test_low_without_az(self):
+        self.assertAlmostEqual(self.mount.slewTime((90, 30, 0), (90, 10, 0)), self.alt.moveTime(20))
+
+    def test_toward_rot_as_far_as_alt_allows(self):
+        az, alt, rot = self.mount.toward((121, 34, 56), (121, 45, 0))
+        self.assertEqual((az, alt), (121, 45))
+        self.assertAlmostEqual(rot, 56 - self.rot.distanceIn(self.alt.moveTime(11)))
+        self.assertAlmostEqual(self.mount.slewTime((121, 34, 56), (az, alt, rot)),
+                               self.alt.moveTime(11))
+
+    def test_toward_all_the_way(self):
+        """The rotator gets there while az is moving."""
+        self.assertEqual(self.mount.toward((12, 34, 56), (121, 45, 0)), (121, 45, 0))
+
+    def test_toward_paced_by_alt(self):
+        """The rotator goes only as far as it can while alt is moving, however far az goes."""
+        az, alt, rot = self.mount.toward((12, 34, 56), (121, 45, 0), pacing=(kinematics.ALT,))
+        self.assertEqual((az, alt), (121, 45))
+        self.assertAlmostEqual(rot, 56 - self.rot.distanceIn(self.alt.moveTime(11)))
+
+    def test_toward_gang_change(self):
+        """Without accelerations, as gotoGangChange has always moved the rotator."""
+        mount = Mount(Axis('az', 1.5, None), Axis('alt', 1.5, None), Axis('rot', 2.0, None))
+        rot = mount.toward((12, 34, 56), (121, 45, 0), pacing=(kinematics.ALT,))[kinematics.ROT]
+        self.assertAlmostEqual(rot, 56 - 2.0*11/1.5)
+
+
+class TestPosition(unittest.TestCase):
+    def _actorState(self, axePos):
+        """An actorState whose tcc reports the axes at axePos."""
+        return sopTester.FakeActorState(models={'tcc': sopTester.FakeModel(axePos=axePos)})
+
+    def test_position(self):
+        self.assertEqual(kinematics.position(self._actorState([12, 34, 56])), (12, 34, 56))
+
+    def test_unknown(self):
+        self.assertIsNone(kinematics.position(self._actorState([None, None, None])))
+        self.assertIsNone(kinematics.position(object()))
+
+    def test_slewDuration(self):
+        actorState = self._actorState([121, 30, 0])
+        self.assertAlmostEqual(kinematics.slewDuration(actorState, 121, 90, 0),
+                               kinematics.mount.slewTime((121, 30, 0), (121, 90, 0)))
+        self.assertEqual(kinematics.slewDuration(self._actorState([None]*3), 121, 90, 0),
+                         kinematics.defaultSlewDuration)
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -0,0 +1,94 @@
+"""
+Test remembering when the lamps last changed, across restarts.
+"""
+import os
+import shutil
+import json
+import tempfile
+import threading
+import time
+import unittest
+
+from sopActor import lampJournal
+
+def slowDump(obj, fd, **kwargs):
+    """json.dump, taking long enough that another save could start in the middle of it."""
+    for c in json.dumps(obj, **kwargs):
+        fd.write(c)
+        fd.flush()
+        time.sleep(0.001)
+
+class TestLampJournal(unittest.TestCase):
+    def setUp(self):
+        self.journal = lampJournal.LampJournal()
+        self.tmpdir = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tmpdir, 'lampJournal.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_first_seen(self):
+        self.assertEqual(self.journal.observed('hgcd', True, 1000), (True, 1000))
+        self.assertEqual(self.journal.since('hgcd'), (True, 1000))
+        self.assertIsNone(self.journal.since('ne'))
+
+    def test_repeated_keyword(self):
+        """The mcp saying the lamps are still on doesn't restart their warmup."""
+        self.journal.observed('hgcd', True, 1000)
+        self.assertEqual(self.journal.observed('hgcd', True, 1600), (True, 1000))
+
+    def test_transition(self):
+        self.journal.observed('hgcd', True, 1000)
+        self.assertEqual(self.journal.observed('hgcd', False, 1600), (False, 1600))
+        self.assertEqual(self.journal.observed('hgcd', True, 1700), (True, 1700))
+
+    def test_earliest(self):
+        """earliest() judges like observed(), but doesn't note anything."""
+        self.assertEqual(self.journal.earliest('hgcd', True, 1000), 1000)
+        self.assertIsNone(self.journal.since('hgcd'))
+        self.journal.observed('hgcd', True, 1000)
+        self.assertEqual(self.journal.earliest('hgcd', True, 1600), 1000)
+        self.assertEqual(self.journal.earliest('hgcd', False, 1600), 1600)
+        self.assertEqual(self.journal.since('hgcd'), (True, 1000))
+
+    def test_commanded(self):
+        self.journal.commanded('ne', True, 1000)
+        self.assertEqual(self.journal.observed('ne', True, 1002), (True, 1000))
+        self.journal.commanded('ne', True, 1500)
+        self.assertEqual(self.journal.since('ne'), (True, 1000))
+
+    def test_survives_restart(self):
+        self.journal.load(self.fileName)
+        self.journal.commanded('hgcd', True, 1000)
+        journal = lampJournal.LampJournal()
+        journal.load(self.fileName)
+        self.assertEqual(journal.observed('hgcd', True, 1600), (True, 1000))
+
+    def test_concurrent_saves(self):
+        """Lamps changing at once (e.g. HgCd and Ne for the arcs) don't tear the file."""
+        self.journal.load(self.fileName)
+        threads = [threading.Thread(target=self.journal.commanded, args=(name, True, 1000))
+                   for name in ('hgcd', 'ne', 'ff', 'uv', 'wht')]
+        dump, lampJournal.json.dump = lampJournal.json.dump, slowDump
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            lampJournal.json.dump = dump
+        journal = lampJournal.LampJournal()
+        journal.load(self.fileName)
+        self.assertEqual(journal.lamps, self.journal.lamps)
+
+    def test_load_damaged(self):
+        with open(self.fileName, 'w') as fd:
+            fd.write('{"hgcd":[true,')
+        self.journal.load(self.fileName)
+        self.assertIsNone(self.journal.since('hgcd'))
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -93,8 +93,14 @@ class TestLampThread(sopTester.SopThreadTester,unittest.TestCase):
             replyQueue = myGlobals.actorState.queues['lamp']
         lampHandler = lampThreads.LampHandler(myGlobals.actorState, self.lampQueue, name)
         lampHandler.wait_until(self.cmd, endTime, replyQueue)
+        self._fire_timers()
         self.lamp_helper(nCall, nInfo, nWarn, nErr, replyQueue, reply, didFail)
 
+    def _fire_timers(self):
+        """Have the timers put their WAIT_UNTILs on their queues now, rather than up to 5s from now."""
+        for timer in myGlobals.timers.pending(self.cmd):
+            myGlobals.timers.fire(timer)
+
     def test_wait_until_10(self):
         endTime = time.time() + 10.5 # to account for int() rounding down.
         self._wait_until(0,1,0,0,'ne',endTime)
@@ -102,6 +108,17 @@ class TestLampThread(sopTester.SopThreadTester,unittest.TestCase):
         endTime = time.time() + 1
         self._wait_until(0,0,0,0,'ne',endTime)
 
+    def test_wait_until_doesnt_block(self):
+        endTime = time.time() + 10.5
+        lampHandler = lampThreads.LampHandler(myGlobals.actorState, self.lampQueue, 'ne')
+        start = time.time()
+        lampHandler.wait_until(self.cmd, endTime, self.lampQueue)
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(len(myGlobals.timers), 1)
+        self.assert_empty(self.lampQueue)
+        self._fire_timers()
+        self.lamp_helper(0, 1, 0, 0, self.lampQueue, sopActor.Msg.WAIT_UNTIL, False)
+
     def test_wait_until_done(self):
         endTime = time.time() - 1
         reply = sopActor.Msg.LAMP_COMPLETE
@@ -113,6 +130,15 @@ class TestLampThread(sopTester.SopThreadTester,unittest.TestCase):
         reply = sopActor.Msg.LAMP_COMPLETE
         self._wait_until(0,0,1,0,'ne',endTime,reply=reply,replyQueue=self.lampQueue,didFail=True)
 
+    def test_handler(self):
+        """The Executor handler for a lamp queue handles that lamp's messages."""
+        queues = {sopActor.HGCD_LAMP: self.lampQueue}
+        handle = lampThreads.handler(sopActor.HGCD_LAMP)(myGlobals.actorState.actor, queues)
+        msg = sopActor.Msg(sopActor.Msg.LAMP_ON, self.cmd, on=True, replyQueue=self.replyQueue)
+        self.assertTrue(handle(msg))
+        self.assertEqual(self.cmd.calls, ['mcp hgcd.on'])
+        self.lamp_helper(1, 0, 0, 0, self.replyQueue, sopActor.Msg.LAMP_COMPLETE, False)
+
 
 if __name__ == '__main__':
     verbosity = 2
@@ -920,6 +920,39 @@ class TestBossCalibs(MasterThreadTester):
         cmdState.nArc = 2
         self._do_boss_calibs(29,148,0,0,cmdState)
 
+    def _warm_arcs_during(self, cmdState, step):
+        # with sop.cfg's HgCd warmup, as the tests' is shorter than any flat's readout.
+        myGlobals.warmupTime[sopActor.HGCD_LAMP] = 210
+        return masterThread.warm_arcs_during(cmdState, step)
+    def test_warm_arcs_during_flat(self):
+        cmdState = CmdState.DoBossCalibsCmd()
+        cmdState.nFlat = 1
+        cmdState.nArc = 1
+        self.assertTrue(self._warm_arcs_during(cmdState, 'expose'))
+    def test_warm_arcs_not_during_dark(self):
+        cmdState = CmdState.DoBossCalibsCmd()
+        cmdState.nDark = 1
+        cmdState.nFlat = 1
+        cmdState.nArc = 1
+        self.assertFalse(self._warm_arcs_during(cmdState, 'expose'))
+    def test_warm_arcs_not_too_early(self):
+        cmdState = CmdState.DoBossCalibsCmd()
+        cmdState.nFlat = 2
+        cmdState.nArc = 1
+        self.assertFalse(self._warm_arcs_during(cmdState, 'expose'))
+        cmdState.nFlatDone = 1
+        self.assertTrue(self._warm_arcs_during(cmdState, 'readout'))
+    def test_warm_arcs_no_arcs(self):
+        cmdState = CmdState.DoBossCalibsCmd()
+        cmdState.nFlat = 1
+        self.assertFalse(self._warm_arcs_during(cmdState, 'expose'))
+    def test_no_warm_arcs_with_short_warmup(self):
+        """The tests' HgCd warmup fits in the last readout, so the arcs are prepped as before."""
+        cmdState = CmdState.DoBossCalibsCmd()
+        cmdState.nFlat = 1
+        cmdState.nArc = 1
+        self.assertFalse(masterThread.warm_arcs_during(cmdState, 'expose'))
+
     def test_do_boss_calibs_flat_arc_fail_on_hgcd(self):
         cmdState = CmdState.DoBossCalibsCmd()
         self.cmd.failOn = "mcp hgcd.on"
@@ -2,17 +2,24 @@
 Test the multiCommand system.
 """
 import threading
+import time
 import unittest
 
 from sopActor import Queue, Msg, myGlobals
-from sopActor.multiCommand import Precondition, MultiCommand
+from sopActor.multiCommand import Precondition, MultiCommand, Deadlines
 
 import sopTester
 
 class PreconditionUnneeded(Precondition):
-    def required(self):
+    def required(self, state=None):
         return False
 
+class PreconditionState(Precondition):
+    """Remember the state we were judged by."""
+    def required(self, state=None):
+        self.state = state
+        return True
+
 class TestMultiCommand(sopTester.SopTester,unittest.TestCase):
     def setUp(self):
         self.verbose = True
@@ -101,6 +108,183 @@ class TestMultiCommand(sopTester.SopTester,unittest.TestCase):
         self.assertFalse(result)
         self._check_cmd(0,3,1,0,False, didFail=not result)
 
+    def test_run_timesout_per_step(self):
+        """A step with a short expected duration fails long before the overall timeout."""
+        self.multiCmd.timeout = 100
+        self.multiCmd.append(self.tid, Msg.EXIT, duration=0.1)
+        myGlobals.actorState.timeout = 0.1
+        start = time.time()
+        result = self.multiCmd.run()
+        self.assertFalse(result)
+        self.assertLess(time.time() - start, 5)
+        self._check_cmd(0,3,1,0,False, didFail=not result)
+
+    def test_append_dependsOn(self):
+        self.multiCmd.append(self.tid, Msg.DONE, dependsOn=(self.tid,))
+        self.assertEqual(self.multiCmd.commands[0][2].dependsOn, [self.queue])
+
+    def test_blocked(self):
+        """By default a command waits on every precondition; dependsOn narrows that."""
+        self.multiCmd.append(Precondition(self.tid, self.msgs[0]))
+        self.multiCmd.append(self.tid, self.msgs[1])
+        self.multiCmd.append(self.tid, self.msgs[2], dependsOn=())
+        self.multiCmd.append(self.tid, self.msgs[3], dependsOn=(self.tid,))
+        self.multiCmd._deadlines = Deadlines()
+        self.multiCmd._unsent = list(self.multiCmd.commands)
+        self.multiCmd._preconditions = [(self.queue, self.multiCmd.commands[0][2])]
+        blocked = [self.multiCmd._blocked(isPre, msg) for queue, isPre, msg in self.multiCmd.commands]
+        self.assertEqual(blocked, [False, True, False, True])
+
+    def test_cancel_dependents(self):
+        """A failed precondition cancels only what depends on it, directly or not."""
+        other = Queue('other', 0)
+        self.queues['other'] = other
+        self.multiCmd.append(Precondition(self.tid, self.msgs[0]))
+        self.multiCmd.append(Precondition('other', self.msgs[1], dependsOn=(self.tid,)))
+        self.multiCmd.append(self.tid, self.msgs[2], dependsOn=('other',))
+        self.multiCmd.append(self.tid, self.msgs[3], dependsOn=())
+        self.multiCmd._deadlines = Deadlines()
+        self.multiCmd._unsent = list(self.multiCmd.commands[1:])
+        self.multiCmd._preconditions = [(self.queue, self.multiCmd.commands[0][2]),
+                                        (other, self.multiCmd.commands[1][2])]
+        self.multiCmd._cancel(self.multiCmd._preconditions[:1])
+        self.assertFalse(self.multiCmd.status)
+        self.assertEqual([msg.type for queue, isPre, msg in self.multiCmd._unsent], [self.msgs[3]])
+        self.assertEqual([msg.type for queue, isPre, msg in self.multiCmd.commands],
+                         [self.msgs[0], self.msgs[3]])
+
+    def test_expire_keeps_sent(self):
+        """A precondition timing out doesn't stop the clock on commands already sent."""
+        other = Queue('other', 0)
+        self.queues['other'] = other
+        self.multiCmd.append(Precondition('other', self.msgs[0]))
+        self.multiCmd.append(self.tid, self.msgs[1], dependsOn=())
+        self.multiCmd.append(self.tid, self.msgs[2])
+        pre, sent = self.multiCmd.commands[0][2], self.multiCmd.commands[1][2]
+        self.multiCmd._deadlines = Deadlines()
+        self.multiCmd._deadlines.add(other, pre, -1)
+        self.multiCmd._deadlines.add(self.queue, sent, 10)
+        self.multiCmd._unsent = list(self.multiCmd.commands[2:])
+        self.multiCmd._preconditions = [(other, pre)]
+        self.multiCmd._prepping = True
+        self.multiCmd._running = True
+        self.multiCmd._expire()
+        self.assertNotIn(pre, self.multiCmd._deadlines)
+        self.assertIn(sent, self.multiCmd._deadlines)
+        self.assertEqual(self.multiCmd._unsent, [])
+        self.assertFalse(self.multiCmd.status)
+
+    def test_run_pre_dependsOn(self):
+        self.multiCmd.append(Precondition(self.tid, self.msgs[0]))
+        self.multiCmd.append(self.tid, self.msgs[1], dependsOn=())
+        result = self.multiCmd.run()
+        self.assertTrue(result)
+        self._check_cmd(2,6,0,0,False, didFail=not result)
+
+    def test_batch_deferred(self):
+        self.multiCmd.batchPreconditions = True
+        self.multiCmd.append(self.tid, Msg.DONE)
+        self.multiCmd.append(Precondition(self.tid, Msg.LAMP_ON, on=True))
+        self.assertEqual(len(self.multiCmd.commands), 1)
+        self.multiCmd._evaluate_preconditions()
+        self.assertEqual([(isPre, msg.type) for queue, isPre, msg in self.multiCmd.commands],
+                         [(True, Msg.LAMP_ON), (False, Msg.DONE)])
+    def test_batch_one_snapshot(self):
+        self.multiCmd.batchPreconditions = True
+        state = object()
+        self.multiCmd.snapshot = lambda: state
+        pres = [PreconditionState(self.tid, self.msgs[0]), PreconditionState(self.tid, self.msgs[1])]
+        for pre in pres:
+            self.multiCmd.append(pre)
+        self.multiCmd._evaluate_preconditions()
+        self.assertIs(pres[0].state, state)
+        self.assertIs(pres[1].state, state)
+    def test_batch_superseded(self):
+        """Only the last precondition for a given queue and message is kept."""
+        self.multiCmd.batchPreconditions = True
+        self.multiCmd.append(Precondition(self.tid, Msg.LAMP_ON, on=True))
+        self.multiCmd.append(Precondition(self.tid, Msg.FFS_MOVE, open=False))
+        self.multiCmd.append(Precondition(self.tid, Msg.LAMP_ON, on=False))
+        self.multiCmd.append(Precondition(self.tid, Msg.FFS_MOVE, open=False))
+        self.multiCmd._evaluate_preconditions()
+        msgs = [msg for queue, isPre, msg in self.multiCmd.commands]
+        self.assertEqual([msg.type for msg in msgs], [Msg.LAMP_ON, Msg.FFS_MOVE])
+        self.assertFalse(msgs[0].on)
+    def test_batch_run_pre(self):
+        self.multiCmd.batchPreconditions = True
+        self._prep_multiCmd_pre()
+        self.multiCmd.append(Precondition(self.tid, self.msgs[0]))
+        result = self.multiCmd.run()
+        self.assertTrue(result)
+        self._check_cmd(4,6,0,0,False, didFail=not result)
+
+
+class TestDeadlines(unittest.TestCase):
+    def setUp(self):
+        self.deadlines = Deadlines()
+        self.queue = Queue('boss', 0)
+        self.msg1 = Msg(Msg.EXPOSE, None)
+        self.msg2 = Msg(Msg.EXPOSE, None)
+        self.reply = Msg(Msg.REPLY, None)
+        self.reply.senderName0 = 'boss'
+
+    def test_add(self):
+        self.deadlines.add(self.queue, self.msg1, 10)
+        self.assertEqual(len(self.deadlines), 1)
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 10, places=1)
+        self.assertEqual(self.deadlines.outstanding(), ['boss'])
+
+    def test_same_queue_waits_its_turn(self):
+        self.deadlines.add(self.queue, self.msg1, 10)
+        self.deadlines.add(self.queue, self.msg2, 1)
+        self.assertIsNone(self.msg2.deadline)
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 10, places=1)
+        self.deadlines.replied(self.reply)
+        self.assertIsNotNone(self.msg2.deadline)
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 1, places=1)
+
+    def test_earliest_deadline(self):
+        self.deadlines.add(self.queue, self.msg1, 10)
+        self.deadlines.add(Queue('ffs', 0), self.msg2, 1)
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 1, places=1)
+        self.deadlines.replied(self.reply)
+        self.assertEqual(self.deadlines.outstanding(), ['ffs'])
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 1, places=1)
+
+    def test_replied_by_other_thread(self):
+        self.deadlines.add(Queue('apogeeScript', 0), self.msg1, 10)
+        self.assertEqual(self.deadlines.replied(self.reply), (self.msg1, False))
+        self.assertEqual(len(self.deadlines), 0)
+        self.assertIsNone(self.deadlines.timeLeft())
+
+    def test_replied_out_of_order(self):
+        """A reply that says what it answers stops that Msg's clock, not the oldest's."""
+        self.deadlines.add(self.queue, self.msg1, 10)
+        self.deadlines.add(self.queue, self.msg2, 1)
+        self.reply.inReplyTo = self.msg2
+        self.assertEqual(self.deadlines.replied(self.reply), (self.msg2, True))
+        self.assertIn(self.msg1, self.deadlines)
+        self.assertAlmostEqual(self.deadlines.timeLeft(), 10, places=1)
+
+    def test_expire(self):
+        """Only overdue Msgs expire, and the next on their queue goes on the clock."""
+        self.deadlines.add(self.queue, self.msg1, -1)
+        self.deadlines.add(self.queue, self.msg2, 10)
+        msg3 = Msg(Msg.EXPOSE, None)
+        self.deadlines.add(Queue('ffs', 0), msg3, 10)
+        self.assertEqual(self.deadlines.expire(), [self.msg1])
+        self.assertNotIn(self.msg1, self.deadlines)
+        self.assertIsNotNone(self.msg2.deadline)
+        self.assertEqual(self.deadlines.outstanding(), ['boss', 'ffs'])
+
+    def test_replied_passed_on(self):
+        """A reply to a Msg that was passed on answers the Msg it was passed on from."""
+        self.deadlines.add(Queue('apogeeScript', 0), self.msg1, 10)
+        relay = Msg(Msg.EXPOSE, None)
+        relay.inReplyTo = self.msg1
+        self.reply.inReplyTo = relay
+        self.assertEqual(self.deadlines.replied(self.reply), (self.msg1, True))
+        self.assertEqual(len(self.deadlines), 0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+"""
+Test the queue latency statistics.
+"""
+import unittest
+
+from sopActor import Queue, Msg, perf
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        self.histogram = perf.Histogram()
+
+    def test_empty(self):
+        self.assertEqual(self.histogram.mean(), 0)
+        self.assertEqual(self.histogram.percentile(50), 0)
+
+    def test_add(self):
+        for x in (0.0005, 0.003, 0.003, 0.3, 40):
+            self.histogram.add(x)
+        self.assertEqual(self.histogram.n, 5)
+        self.assertEqual(self.histogram.max, 40)
+        self.assertAlmostEqual(self.histogram.mean(), 40.3065/5)
+        self.assertEqual(self.histogram.percentile(50), 0.005)
+        self.assertEqual(self.histogram.percentile(90), 40)
+
+    def test_bounded(self):
+        for i in range(10000):
+            self.histogram.add(i)
+        self.assertEqual(len(self.histogram.counts), len(perf.binEdges) + 1)
+        self.assertEqual(self.histogram.percentile(100), 9999)
+
+
+class TestQueueStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = perf.Perf()
+        self.queue = Queue('ffs', 0)
+        self.queue.stats = self.stats
+
+    def test_get_and_done(self):
+        self.queue.put(Msg.FFS_MOVE, None)
+        self.queue.put(Msg.STATUS, None)
+        self.queue.get(timeout=0)
+        self.assertEqual(self.stats.waits[('ffs', 'STATUS')].n, 1)
+        self.assertEqual(self.stats.handles, {})
+        self.queue.get(timeout=0)
+        self.assertEqual(self.stats.handles[('ffs', 'STATUS')].n, 1)
+        self.queue.done()
+        self.assertEqual(self.stats.handles[('ffs', 'FFS_MOVE')].n, 1)
+        self.queue.done()
+        self.assertEqual(self.stats.handles[('ffs', 'FFS_MOVE')].n, 1)
+
+    def test_reply_queue(self):
+        """Only the threads' own queues are timed, not e.g. a MultiCommand's replies."""
+        replyQueue = Queue('(replyQueue)', 0)
+        replyQueue.put(Msg.REPLY, None)
+        replyQueue.get(timeout=0)
+        replyQueue.done()
+        self.assertEqual((self.stats.waits, self.stats.handles), ({}, {}))
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
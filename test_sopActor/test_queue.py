@@ -0,0 +1,112 @@
+"""
+Test the priority ordering of sopActor.Queue, and the Msgs we put on it.
+"""
+import threading
+import unittest
+
+from sopActor import Queue, Msg, GenericMsg
+
+class TestQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue('testQueue', 0)
+
+    def test_default_priorities(self):
+        self.assertEqual(Msg(Msg.EXIT, None).priority, Msg.CRITICAL)
+        self.assertEqual(Msg(Msg.STATUS, None).priority, Msg.HIGH)
+        self.assertEqual(Msg(Msg.EXPOSE, None).priority, Msg.NORMAL)
+        self.assertEqual(Msg(Msg.WAIT_UNTIL, None).priority, Msg.LOW)
+        self.assertEqual(Msg(Msg.SCRIPT_STEP, None, priority=Msg.HIGH).priority, Msg.HIGH)
+
+    def test_compact_msg(self):
+        msg = Msg(Msg.LAMP_ON, None, on=True)
+        self.assertIsInstance(msg, Msg)
+        self.assertEqual(type(msg).__name__, 'LampOnMsg')
+        self.assertEqual(msg.data(), {'on':True})
+        self.assertFalse(hasattr(msg, 'noWait'))
+        self.assertFalse(hasattr(msg, '__dict__'))
+
+    def test_compact_msg_undeclared_data(self):
+        with self.assertRaises(AttributeError):
+            Msg(Msg.EXPOSE, None, expTime=10, blah=1)
+
+    def test_generic_msg(self):
+        msg = Msg(Msg.DONE, None, blah=1)
+        self.assertIs(type(msg), GenericMsg)
+        self.assertIsInstance(msg, Msg)
+        self.assertEqual(msg.data(), {'blah':1})
+
+    def test_sender_names(self):
+        self.queue.put(Msg.REPLY, None, success=True)
+        msg = self.queue.get(timeout=0)
+        self.assertEqual(msg.senderName0, 'MainThread')
+        self.assertIs(msg.senderQueue, self.queue)
+
+    def test_fifo_within_priority(self):
+        msgs = [Msg(Msg.DONE, None, n=i) for i in range(10)]
+        for msg in msgs:
+            self.queue.put(msg)
+        for msg in msgs:
+            self.assertIs(self.queue.get(timeout=0), msg)
+
+    def test_priority_order(self):
+        self.queue.put(Msg.WAIT_UNTIL, None, endTime=0)
+        self.queue.put(Msg.LAMP_ON, None, on=True)
+        self.queue.put(Msg.STATUS, None)
+        self.queue.put(Msg.EXIT, None)
+        types = [self.queue.get(timeout=0).type for i in range(4)]
+        self.assertEqual(types, [Msg.EXIT, Msg.STATUS, Msg.LAMP_ON, Msg.WAIT_UNTIL])
+
+    def test_flush(self):
+        self.queue.put(Msg.STATUS, None)
+        self.queue.put(Msg.WAIT_UNTIL, None, endTime=0)
+        self.queue.flush()
+        self.assertTrue(self.queue.empty())
+
+
+class TestInReplyTo(unittest.TestCase):
+    """Replies, and Msgs passed on, know which Msg they're answering."""
+    def setUp(self):
+        self.queue = Queue('testQueue', 0)
+        self.replyQueue = Queue('(replyQueue)', 0)
+        self.msg = Msg(Msg.EXPOSE, None, replyQueue=self.replyQueue)
+        self.queue.put(self.msg)
+
+    def _handle(self, handler):
+        """Handle our queue's next message with handler, as a thread would."""
+        def run():
+            handler(self.queue.get(timeout=1))
+            self.queue.done()
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+    def test_reply(self):
+        self._handle(lambda msg: msg.replyQueue.put(Msg.REPLY, None, success=True))
+        self.assertIs(self.replyQueue.get(timeout=0).inReplyTo, self.msg)
+
+    def test_passed_on(self):
+        other = Queue('other', 0)
+        self._handle(lambda msg: other.put(Msg.EXPOSE, None, replyQueue=msg.replyQueue))
+        self.assertIs(other.get(timeout=0).inReplyTo, self.msg)
+
+    def test_new_command(self):
+        """A Msg with a reply queue of its own isn't answering the one being handled."""
+        other = Queue('other', 0)
+        self._handle(lambda msg: other.put(Msg.EXPOSE, None, replyQueue=Queue('mine', 0)))
+        self.assertIsNone(other.get(timeout=0).inReplyTo)
+
+    def test_reply_after_getting_replies(self):
+        """Getting replies to our own commands doesn't change which Msg we're handling."""
+        def handler(msg):
+            mine = Queue('mine', 0)
+            mine.put(Msg.REPLY, None, success=True)
+            mine.get(timeout=0)
+            msg.replyQueue.put(Msg.REPLY, None, success=True)
+        self._handle(handler)
+        self.assertIs(self.replyQueue.get(timeout=0).inReplyTo, self.msg)
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
@@ -0,0 +1,128 @@
+"""
+Test loading and stepping through .inp scripts.
+"""
+import unittest
+
+from sopActor import durations, script
+import sopActor.myGlobals as myGlobals
+
+from sopTester import FakeCmd
+
+class TestScript(unittest.TestCase):
+    def setUp(self):
+        self.cmd = FakeCmd()
+        myGlobals.durations = durations.Durations()
+
+    def _steps(self, text):
+        s = script.Script(self.cmd, 'test', text)
+        steps = []
+        while True:
+            lines = s.fetchNextStep()
+            if not lines:
+                return steps
+            steps.append([(actor, cmdStr, maxTime) for actor, cmdStr, maxTime, block in lines])
+
+    def test_sequential(self):
+        steps = self._steps("""10.0 apogeecal allOff
+                               apogee shutter close""")
+        self.assertEqual(steps, [[('apogeecal', 'allOff', 10.0)],
+                                 [('apogee', 'shutter close', 0.0)]])
+
+    def test_fork(self):
+        steps = self._steps("""apogeecal SourceOff source=Quartz
+                               fork
+                               apogee dither namedpos=A
+                               5.0 apogeecal SourceOn source=ThAr
+                               join
+                               130.0 apogee expose nreads=12 ; object=ArcLamp""")
+        self.assertEqual(steps, [[('apogeecal', 'SourceOff source=Quartz', 0.0)],
+                                 [('apogee', 'dither namedpos=A', 0.0),
+                                  ('apogeecal', 'SourceOn source=ThAr', 5.0)],
+                                 [('apogee', 'expose nreads=12 ; object=ArcLamp', 130.0)]])
+
+    def test_consecutive_forks(self):
+        steps = self._steps("""fork
+                               tcc show time
+                               guider version
+                               join
+                               fork
+                               sop version
+                               join""")
+        self.assertEqual([len(step) for step in steps], [2, 1])
+
+    def test_lines_keys(self):
+        self._steps("""fork
+                       tcc show time
+                       guider version
+                       join""")
+        lines = [r for r in self.cmd.informs if r.startswith('scriptLine=')]
+        self.assertEqual(len(lines), 2)
+
+    def test_bad_blocks(self):
+        for text in ("fork\nfork\ntcc show time\njoin\njoin",
+                     "tcc show time\njoin",
+                     "fork\ntcc show time"):
+            self.assertRaises(RuntimeError, script.Script, self.cmd, 'test', text)
+
+
+class TestTiming(unittest.TestCase):
+    def setUp(self):
+        self.cmd = FakeCmd()
+        myGlobals.durations = durations.Durations()
+
+    def _script(self, text):
+        return script.Script(self.cmd, 'test', text, genKeys=False)
+
+    def test_sequential(self):
+        s = self._script("""10.0 apogeecal allOff
+                            apogee shutter close
+                            110.0 apogee expose nreads=10 ; object=Dark""")
+        self.assertEqual(s.timing(), [(10.0, 10.0, True),
+                                      (script.defaultMaxTime, 10.0 + script.defaultMaxTime, True),
+                                      (110.0, 120.0 + script.defaultMaxTime, True)])
+        self.assertEqual(s.expectedTotal(), 120.0 + script.defaultMaxTime)
+
+    def test_fork(self):
+        s = self._script("""fork
+                            10.0 apogeecal allOff
+                            20.0 apogee shutter close
+                            join
+                            110.0 apogee expose nreads=10 ; object=Dark""")
+        self.assertEqual(s.timing(), [(10.0, 10.0, False), (20.0, 20.0, True), (110.0, 130.0, True)])
+        self.assertEqual(s.expectedTotal(), 130.0)
+
+    def test_learned(self):
+        for i in range(3):
+            myGlobals.durations.observedCall('apogee', 'expose nreads=10 ; object=Dark', 112, literal=True)
+        s = self._script("""10.0 apogeecal allOff
+                            110.0 apogee expose nreads=10 ; object=Dark""")
+        self.assertEqual(s.expectedTotal(), 122.0)
+
+    def test_learned_literally(self):
+        """A line learns from itself, not from the same command with other numbers."""
+        for i in range(3):
+            myGlobals.durations.observedCall('apogee', 'expose nreads=60 ; object=Dark', 660, literal=True)
+        s = self._script("""330.0 apogee expose nreads=30 ; object=Dark
+                            660.0 apogee expose nreads=60 ; object=Dark""")
+        self.assertEqual([t for t, end, critical in s.timing()], [330.0, 660.0])
+
+    def test_keys(self):
+        self._script("""fork
+                        10.0 apogeecal allOff
+                        20.0 apogee shutter close
+                        join""").genTimingKeys()
+        self.assertEqual(self.cmd.informs, ['scriptLineTiming=test,1,10.0,10.0,F',
+                                              'scriptLineTiming=test,2,20.0,20.0,T',
+                                              'scriptTiming=test,20.0'])
+        self.assertEqual(self._script("# nothing").expectedTotal(), 0.0)
+
+    def test_line_keys(self):
+        """A dry run's keys don't include a scriptState, which would hide the running script's."""
+        self._script("""10.0 apogeecal allOff""").genLineKeys()
+        self.assertEqual([r.split(',')[:3] for r in self.cmd.informs], [['scriptLine=test', '1', '10.0']])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
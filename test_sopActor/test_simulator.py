@@ -0,0 +1,112 @@
+"""
+Test simulating master thread commands on a virtual clock.
+"""
+import time
+import unittest
+
+import sopActor
+from sopActor import Msg, CmdState
+import sopActor.myGlobals as myGlobals
+from sopActor import masterThread
+from sopActor.simulator import Simulator, simulate
+
+warmupTime = {sopActor.FF_LAMP: 1, sopActor.HGCD_LAMP: 100, sopActor.NE_LAMP: 20,
+              sopActor.WHT_LAMP: 0, sopActor.UV_LAMP: 0}
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self.sim = Simulator(warmupTime=warmupTime)
+
+    def _steps(self, timeline, who, what):
+        return [step for step in timeline.steps if step.who == who and step.what == what]
+
+    def test_bias(self):
+        timeline = simulate('doBossCalibs', self.sim, nBias=1)
+        self.assertTrue(timeline.succeeded)
+        expose = self._steps(timeline, 'boss', 'EXPOSE')
+        self.assertEqual(len(expose), 1)
+        self.assertEqual(expose[0].end - expose[0].start,
+                         masterThread.flushDuration + masterThread.readoutDuration)
+        self.assertEqual(timeline.end, expose[0].end)
+
+    def test_arc_waits_for_warmup(self):
+        timeline = simulate('doBossCalibs', self.sim, nArc=1, arcTime=4)
+        path = [(step.who, step.what, step.start, step.end) for step in timeline.criticalPath()
+                if step.end > step.start]
+        expTime = masterThread.flushDuration + 4
+        self.assertEqual(path, [('hgcd', 'LAMP_ON', 0, 100),
+                                ('boss', 'EXPOSE', 100, 100 + expTime),
+                                ('boss', 'EXPOSE', 100 + expTime, 100 + expTime + masterThread.readoutDuration)])
+        self.assertEqual(timeline.end, 100 + expTime + masterThread.readoutDuration)
+
+    def test_arc_lamps_warm_during_flats(self):
+        timeline = simulate('doBossCalibs', self.sim, nDark=1, nFlat=2, nArc=1)
+        self.assertTrue(timeline.succeeded)
+        boss = self._steps(timeline, 'boss', 'EXPOSE')
+        dark, flat1, readout1, flat2, readout2, arc = boss[:6]
+        hgcd = self._steps(timeline, 'hgcd', 'LAMP_ON')[0]
+        # not during the dark, but in time for the arc.
+        self.assertGreaterEqual(hgcd.start, dark.end)
+        self.assertLessEqual(hgcd.start + warmupTime[sopActor.HGCD_LAMP], arc.start)
+        self.assertEqual(arc.start, readout2.end)
+
+    def test_arc_lamps_warm_during_flat_exposure(self):
+        """With just one flat, its readout is too short a warmup, so they start with the exposure."""
+        timeline = simulate('doBossCalibs', self.sim, nFlat=1, nArc=1)
+        self.assertTrue(timeline.succeeded)
+        flat, readout, arc = self._steps(timeline, 'boss', 'EXPOSE')[:3]
+        for lamp in ('hgcd', 'ne'):
+            warmup = self._steps(timeline, lamp, 'LAMP_ON')[0]
+            self.assertEqual(warmup.start, flat.start)
+            self.assertLess(warmup.start, flat.end)
+        self.assertEqual(arc.start, readout.end)
+
+    def test_goto_field_guider_flat_after_slew(self):
+        timeline = simulate('gotoField', self.sim, doCalibs=False, doHartmann=False)
+        self.assertTrue(timeline.succeeded)
+        slew = self._steps(timeline, 'tcc', 'SLEW')[0]
+        flat = self._steps(timeline, 'guider', 'EXPOSE')[0]
+        self.assertLessEqual(slew.end, flat.start)
+        self.assertEqual(self._steps(timeline, 'guider', 'START')[0].end, timeline.end)
+
+    def test_goto_field_guider_during_readout(self):
+        timeline = simulate('gotoField', self.sim)
+        self.assertTrue(timeline.succeeded)
+        readout = self._steps(timeline, 'boss', 'EXPOSE')[-1]
+        guider = self._steps(timeline, 'guider', 'START')[0]
+        self.assertLess(guider.end, readout.end)
+        self.assertEqual(timeline.end, readout.end)
+
+    def test_stages(self):
+        timeline = simulate('doBossCalibs', self.sim, nBias=1)
+        stages = [(stage, state) for t, stage, state in timeline.stages]
+        self.assertIn(('doBossCalibs.expose', 'running'), stages)
+        self.assertEqual(stages[-1], ('doBossCalibs.readoutFinish', 'done'))
+
+    def test_dependsOn(self):
+        """BOSS starts exposing without waiting for the APOGEE shutter."""
+        sim = Simulator(warmupTime=warmupTime, durations={Msg.APOGEE_SHUTTER: lambda msg: 100})
+        cmdState = CmdState.DoApogeeMangaDitherCmd()
+        timeline = sim.run(masterThread.do_apogeemanga_dither, cmdState)
+        self.assertTrue(timeline.succeeded)
+        ffs = self._steps(timeline, 'ffs', 'FFS_MOVE')[0]
+        self.assertEqual(self._steps(timeline, 'boss', 'EXPOSE')[0].start, ffs.end)
+        self.assertEqual(self._steps(timeline, 'apogee', 'APOGEE_DITHER_SET')[0].start, 100)
+
+    def test_fast(self):
+        start = time.time()
+        timeline = simulate('doMangaSequence', self.sim)
+        self.assertTrue(timeline.succeeded)
+        self.assertGreater(timeline.end, 3600)
+        self.assertLess(time.time() - start, 5)
+
+    def test_restores_globals(self):
+        actorState = getattr(myGlobals, 'actorState', None)
+        simulate('hartmann', self.sim)
+        self.assertIs(getattr(myGlobals, 'actorState', None), actorState)
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
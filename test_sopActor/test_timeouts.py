@@ -0,0 +1,133 @@
+"""
+Test choosing timeouts from how long things have taken before.
+"""
+import time
+import unittest
+
+from sopActor import Msg, durations, timeouts
+import sopActor.myGlobals as myGlobals
+
+import sopTester
+
+class FakeClock(object):
+    """Stands in for the time module; the time only moves when we say."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TestTimeoutPolicy(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict((name, getattr(myGlobals, name, None)) for name in ('durations', 'actorState'))
+        myGlobals.durations = durations.Durations()
+        self.policy = timeouts.TimeoutPolicy(percentile=90, margin=10, minSamples=5, shorten=True)
+        myGlobals.actorState = sopTester.FakeActorState(actor=sopTester.FakeActor())
+        self.cmdr = myGlobals.actorState.actor.cmdr
+        self.cmdr.clock = timeouts.time = FakeClock()
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(myGlobals, name, value)
+        timeouts.time = time
+
+    def _expose(self, expTime):
+        return Msg(Msg.EXPOSE, None, expTime=expTime, expType='science', readout=True)
+
+    def test_msg_default(self):
+        for i in range(4):
+            myGlobals.durations.observed('boss', self._expose(900), 1015)
+        self.assertEqual(self.policy.msgTimeout('boss', self._expose(900), 1234), 1234)
+
+    def test_msg_learned(self):
+        for overhead in range(110, 120):
+            myGlobals.durations.observed('boss', self._expose(900), 900 + overhead)
+        self.assertEqual(self.policy.msgTimeout('boss', self._expose(30), 1234), 30 + 119 + 10)
+
+    def test_msg_explicit_timeout(self):
+        """A learned timeout never undercuts the one a Msg was explicitly given."""
+        for i in range(10):
+            myGlobals.durations.observed('guider', Msg(Msg.DECENTER, None), 5)
+        msg = Msg(Msg.DECENTER, None)
+        msg.timeout = 60
+        self.assertEqual(self.policy.msgTimeout('guider', msg, 1234), 60)
+
+    def test_msg_nominal(self):
+        """Slews learn their overhead beyond their estimate, so a long one gets longer."""
+        for i in range(10):
+            msg = Msg(Msg.SLEW, None, az=10, alt=60, rot=0)
+            msg.nominal = 20
+            myGlobals.durations.observed('tcc', msg, 25)
+        msg = Msg(Msg.SLEW, None, az=180, alt=30, rot=0)
+        msg.nominal = 200
+        self.assertEqual(self.policy.msgTimeout('tcc', msg, 1234), 200 + 5 + 10)
+        self.assertEqual(self.policy.msgTimeout('tcc', Msg(Msg.SLEW, None, ra=10, dec=0), 1234), 1234)
+
+    def test_call_default(self):
+        self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120)
+        self.assertEqual(self.cmdr.timeLims, [120])
+
+    def test_call_learned(self):
+        for i in range(5):
+            myGlobals.durations.observedCall('mcp', 'ffs.open', 7)
+        self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120)
+        self.assertEqual(self.cmdr.timeLims, [17])
+
+    def test_call_nominal(self):
+        for i in range(5):
+            myGlobals.durations.observedCall('boss', 'exposure flat itime=30', 40, nominal=30)
+        self.policy.call(actor='boss', cmdStr='exposure flat itime=100', nominal=100, timeLim=1000)
+        self.assertEqual(self.cmdr.timeLims, [100 + 10 + 10])
+
+    def test_call_keepTimeLim(self):
+        for i in range(5):
+            myGlobals.durations.observedCall('mcp', 'ffs.open', 7)
+        self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120, keepTimeLim=True)
+        self.assertEqual(self.cmdr.timeLims, [120])
+        self.assertEqual(len(myGlobals.durations.samples.values()[0]), 6)
+
+    def test_call_learns(self):
+        for i in range(5):
+            self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120)
+        self.assertEqual(self.policy.callTimeout('mcp', 'ffs.open', 120), 10)
+
+    def test_call_failures_not_learned(self):
+        self.cmdr.didFail = True
+        for i in range(5):
+            self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120)
+        self.assertEqual(self.policy.callTimeout('mcp', 'ffs.open', 120), 120)
+
+    def test_call_timeout_learned(self):
+        """A call that runs out of time took at least its timeLim, so the limit loosens."""
+        for i in range(5):
+            myGlobals.durations.observedCall('mcp', 'ffs.open', 7)
+        self.cmdr.didFail = True
+        self.cmdr.took = 17
+        self.policy.call(actor='mcp', cmdStr='ffs.open', timeLim=120)
+        self.assertEqual(self.cmdr.timeLims, [17])
+        self.assertEqual(self.policy.callTimeout('mcp', 'ffs.open', 120), 27)
+
+    def test_not_shorter_than_default(self):
+        """Unless told to shorten, learning only ever lengthens the hand-built timeouts."""
+        policy = timeouts.TimeoutPolicy(percentile=90, margin=10, minSamples=5)
+        for i in range(5):
+            myGlobals.durations.observedCall('mcp', 'ffs.open', 7)
+            myGlobals.durations.observedCall('mcp', 'ff.on', 200)
+            myGlobals.durations.observed('boss', self._expose(900), 1015)
+        self.assertEqual(policy.callTimeout('mcp', 'ffs.open', 120), 120)
+        self.assertEqual(policy.callTimeout('mcp', 'ff.on', 120), 210)
+        self.assertEqual(policy.msgTimeout('boss', self._expose(900), 1234), 1234)
+        self.assertEqual(policy.msgTimeout('boss', self._expose(900), 1000), 900 + 115 + 10)
+
+    def test_call_no_timeLim(self):
+        for i in range(5):
+            myGlobals.durations.observedCall('tcc', 'axis status', 1)
+        self.policy.call(actor='tcc', cmdStr='axis status')
+        self.assertEqual(self.cmdr.timeLims, [None])
+
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)
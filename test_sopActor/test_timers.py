@@ -0,0 +1,67 @@
+"""
+Test the shared Timers service.
+"""
+import time
+import unittest
+
+from sopActor import Queue, Msg
+from sopActor.timers import Timers
+
+class TestTimers(unittest.TestCase):
+    def setUp(self):
+        self.timers = Timers()
+        self.queue = Queue('timers', 0)
+
+    def tearDown(self):
+        self.timers.stop()
+
+    def test_add(self):
+        start = time.time()
+        self.timers.add(start + 0.2, self.queue, Msg(Msg.WAIT_UNTIL, None))
+        self.assertTrue(self.queue.empty())
+        msg = self.queue.get(timeout=2)
+        self.assertEqual(msg.type, Msg.WAIT_UNTIL)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(len(self.timers), 0)
+
+    def test_order(self):
+        now = time.time()
+        self.timers.add(now + 0.3, self.queue, Msg(Msg.WAIT_UNTIL, None, n=2))
+        self.timers.add(now + 0.1, self.queue, Msg(Msg.WAIT_UNTIL, None, n=1))
+        self.assertEqual(self.queue.get(timeout=2).n, 1)
+        self.assertEqual(self.queue.get(timeout=2).n, 2)
+
+    def test_cancel(self):
+        timer = self.timers.add(time.time() + 0.1, self.queue, Msg(Msg.WAIT_UNTIL, None))
+        self.timers.cancel(timer)
+        self.assertEqual(len(self.timers), 0)
+        with self.assertRaises(Queue.Empty):
+            self.queue.get(timeout=0.3)
+
+    def test_pending(self):
+        cmd, other = object(), object()
+        timer = self.timers.add(time.time() + 100, self.queue, Msg(Msg.WAIT_UNTIL, cmd))
+        self.timers.add(time.time() + 100, self.queue, Msg(Msg.WAIT_UNTIL, other))
+        self.assertEqual(self.timers.pending(cmd), [timer])
+
+    def test_fire(self):
+        timer = self.timers.add(time.time() + 100, self.queue, Msg(Msg.WAIT_UNTIL, None, n=1))
+        self.timers.add(time.time() + 100, self.queue, Msg(Msg.WAIT_UNTIL, None, n=2))
+        self.timers.fire(timer)
+        self.assertEqual(self.queue.get(timeout=1).n, 1)
+        self.assertEqual(len(self.timers), 1)
+        self.timers.fire(timer)
+        self.assertTrue(self.queue.empty())
+    def test_stop(self):
+        self.timers.add(time.time() + 100, self.queue, Msg(Msg.WAIT_UNTIL, None))
+        thread = self.timers._thread
+        self.timers.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(self.timers), 0)
+        self.assertTrue(self.queue.empty())
+        self.timers.stop()              # nothing left to stop
+
+if __name__ == '__main__':
+    verbosity = 2
+
+    unittest.main(verbosity=verbosity)